@@ -0,0 +1,6 @@
+"""
+Kasi Extractor - извличане на клиенти от Kasi_all (MDB/CSV) за SMS известия.
+
+GUI приложението е sms_notification_clients.py; тук е всичко без Tkinter,
+а командният ред е и `python -m kasi_extractor`.
+"""
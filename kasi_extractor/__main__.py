@@ -0,0 +1,9 @@
+"""python -m kasi_extractor <подкоманда> - командният ред без GUI"""
+
+import sys
+
+from .cli import run_cli
+
+
+if __name__ == "__main__":
+    sys.exit(run_cli(sys.argv[1:]))
@@ -0,0 +1,99 @@
+"""
+Синтетични данни и измервания на текстовото съхранение и изходните формати.
+"""
+
+import os
+import tempfile
+import time
+
+from .core import (PYARROW_AVAILABLE, arrow_text_dtype, column_as_text, fix_dataframe_encoding,
+                   fix_encoding_series, fix_encoding_utf8_to_windows1251, np, pd, to_quoted_csv_lines)
+from .writers import open_table_writers
+
+
+def synthetic_kasi_text(rows, seed=0):
+    """
+    Синтетична таблица с текстовите колони на Kasi_all - кирилица с
+    'счупена' кодировка, каквато идва от mdb-export.
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array(['Магазин', 'Аптека', 'Кафе', 'Бензиностанция', 'Хранителни стоки',
+                      'ул. Васил Левски', 'бул. България', 'ж.к. Младост', 'София', 'Пловдив',
+                      'ЕООД', 'ООД', 'ЕТ', 'Търговия', 'Сервиз'])
+    broken = np.array([w.encode('windows-1251').decode('latin-1') for w in words], dtype=object)
+
+    def column(parts):
+        picks = rng.integers(0, len(broken), size=(rows, parts))
+        text = pd.Series(broken[picks[:, 0]])
+        for part in range(1, parts):
+            text = text + ' ' + broken[picks[:, part]]
+        return text.astype(object)
+
+    return pd.DataFrame({
+        'Ime_Obekt': column(2),
+        'Adres_Obekt': column(3),
+        'Ime_Firma': column(2),
+    })
+
+
+def benchmark_text_storage(rows=2_000_000, seed=0):
+    """
+    Сравнява object колони (по един Python str на клетка, поправка ред по ред)
+    с Arrow низове (поправка на цяла колона). Връща {вариант: {метрика: стойност}}.
+    """
+    baseline = synthetic_kasi_text(rows, seed)
+    results = {}
+
+    def measure(name, df, fix):
+        timings = {'memory_mb': df.memory_usage(deep=True, index=False).sum() / (1024 * 1024)}
+        started = time.perf_counter()
+        for column in df.columns:
+            df[column] = fix(df[column])
+        timings['fix_encoding_s'] = time.perf_counter() - started
+        timings['fixed_memory_mb'] = df.memory_usage(deep=True, index=False).sum() / (1024 * 1024)
+        started = time.perf_counter()
+        mask = df['Ime_Firma'].str.contains('ЕООД', regex=False) & \
+            df['Adres_Obekt'].str.startswith('ул.')
+        timings['filter_s'] = time.perf_counter() - started
+        timings['matches'] = int(mask.sum())
+        started = time.perf_counter()
+        to_quoted_csv_lines(df.apply(column_as_text))
+        timings['to_csv_lines_s'] = time.perf_counter() - started
+        results[name] = timings
+
+    measure('object', baseline.copy(),
+            lambda series: series.astype(object).map(fix_encoding_utf8_to_windows1251).astype(object))
+    dtype = arrow_text_dtype()
+    if dtype is not None:
+        measure('arrow', baseline.astype(dtype), fix_encoding_series)
+    return results
+
+
+def benchmark_export_formats(rows=500_000, seed=0, chunksize=100_000):
+    """
+    Скорост на запис на едни и същи текстови редове във всеки формат поотделно
+    и във всички наведнъж (fan-out, по нишка на формат).
+    Връща {формат: {'seconds', 'rows_per_s', 'size_mb'}}.
+    """
+    text_df = fix_dataframe_encoding(synthetic_kasi_text(rows, seed)).apply(column_as_text)
+    extensions = [ext for ext in ('.csv', '.xlsx', '.json', '.ndjson', '.parquet')
+                  if ext != '.parquet' or PYARROW_AVAILABLE]
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        def measure(name, paths):
+            started = time.perf_counter()
+            writer = open_table_writers(paths, text_df.columns)
+            for start in range(0, rows, chunksize):
+                writer.write(text_df.iloc[start:start + chunksize])
+            writer.close()
+            seconds = time.perf_counter() - started
+            results[name] = {
+                'seconds': seconds,
+                'rows_per_s': rows / seconds if seconds else 0.0,
+                'size_mb': sum(os.path.getsize(path) for path in paths) / (1024 * 1024),
+            }
+
+        for ext in extensions:
+            measure(ext[1:], [os.path.join(temp_dir, f"single{ext}")])
+        measure('fan-out', [os.path.join(temp_dir, f"all{ext}") for ext in extensions])
+    return results
@@ -0,0 +1,435 @@
+"""
+Команден ред - подкомандите без стартиране на GUI.
+"""
+
+from datetime import date
+import csv
+import sys
+import os
+import threading
+import asyncio
+
+from .core import DEFAULT_TABLE, PANDAS_AVAILABLE, arrow_text_dtype, file_fingerprint, parse_query_date, pd
+from .progress import ConsoleProgressSink, ProgressTracker
+from .sources import iter_source_chunks, load_source_dataframe
+from .writers import parse_byte_size
+from .validation import VALIDATION_COLUMN
+from .messages import DEFAULT_SMS_TEMPLATE, build_messages, estimate_sms_cost, render_messages
+from .suppression import NotificationHistory, SuppressionList
+from .extraction import extract_date_range
+from .profiling import (PROFILE_PROBLEM_FIELDS, PROFILE_REPORT_FIELDS, format_profile_value, profile_source,
+                        write_profile_report)
+from .storage import PartitionStore, SqliteStore, load_date_window
+from .indexes import LookupIndex, TrigramIndex
+from .scheduling import (DEFAULT_WAVE_OFFSETS, compute_notification_waves, wave_window,
+                         write_notification_waves)
+from .diff import DIFF_KEY_COLUMNS, diff_snapshots
+from .service import serve_extraction
+from .dispatch import DispatchJournal, MockSmsGateway, SmsDispatcher
+from .benchmarks import benchmark_export_formats, benchmark_text_storage
+
+
+def cli_progress():
+    """ProgressTracker с изход към конзолата (stderr)"""
+    return ProgressTracker([ConsoleProgressSink()], min_interval=0.5)
+
+
+def cli_partition(args):
+    """CLI: разделя таблицата Kasi_all на дялове по End_Data"""
+    df = load_source_dataframe(args.source, progress=cli_progress())
+    root = args.output or PartitionStore.default_root(args.source)
+    store = PartitionStore.build(df, root, file_fingerprint(args.source), granularity=args.by)
+    print(f"Записани {store.total_rows:,} реда в {len(store.manifest['partitions'])} дяла "
+          f"({store.manifest['format']}) -> {root}")
+    LookupIndex.build(df, LookupIndex.default_root(args.source), file_fingerprint(args.source))
+    TrigramIndex.build(df, TrigramIndex.default_root(args.source), file_fingerprint(args.source))
+    return 0
+
+
+def cli_index(args):
+    """CLI: изгражда индексите за търсене по Number, Number_EKA, Phone и bulst"""
+    df = load_source_dataframe(args.source, progress=cli_progress())
+    root = args.output or LookupIndex.default_root(args.source)
+    index = LookupIndex.build(df, root, file_fingerprint(args.source))
+    print(f"Индексирани {index.total_rows:,} реда по {', '.join(index.manifest['columns'])} -> {root}")
+    text_index = TrigramIndex.build(df, root, file_fingerprint(args.source))
+    print(f"Индекс за търсене по текст: {text_index.manifest['values']:,} стойности, "
+          f"{text_index.manifest['trigrams']:,} триграми")
+    return 0
+
+
+def cli_lookup(args):
+    """CLI: търси записи по стойност в индексираните колони"""
+    index = LookupIndex.for_source(args.source)
+    fingerprint = file_fingerprint(args.source)
+    if not index.is_current(fingerprint):
+        df = load_source_dataframe(args.source, progress=cli_progress())
+        index = LookupIndex.build(df, index.root, fingerprint)
+    columns = [args.column] if args.column else None
+    result = index.search(args.value, columns)
+    if len(result) == 0:
+        print(f"Няма намерени записи за '{args.value}'", file=sys.stderr)
+        return 1
+    result.to_csv(sys.stdout, index=False)
+    return 0
+
+
+def cli_search(args):
+    """CLI: търси по част от име на обект, фирма или адрес"""
+    index = TrigramIndex.for_source(args.source)
+    fingerprint = file_fingerprint(args.source)
+    if not index.is_current(fingerprint):
+        df = load_source_dataframe(args.source, progress=cli_progress())
+        index = TrigramIndex.build(df, index.root, fingerprint)
+    matches = index.search(args.query, limit=args.limit)
+    for column, value, rows in zip(matches['Колона'], matches['Стойност'], matches['Редове']):
+        print(f"{value}\t{column}\t{rows}")
+    return 0 if len(matches) else 1
+
+
+def cli_schedule(args):
+    """CLI: изчислява и записва вълните известия за следващите N дни"""
+    offsets = [int(x) for x in args.offsets.split(',') if x.strip()]
+    today = parse_query_date(args.today) if args.today else date.today()
+    window_start, window_end = wave_window(today, args.days, offsets)
+    df, _ = load_date_window(args.source, window_start, window_end)
+    waves = compute_notification_waves(df, today, args.days, offsets)
+    output = args.output or os.path.splitext(args.source)[0] + '_waves'
+    summary = write_notification_waves(waves, output)
+    for send_date, days_before, rows, _ in summary:
+        print(f"{send_date.strftime('%d.%m.%Y')}  T-{days_before:<3} {rows:>7,} клиента")
+    print(f"Записани {len(summary)} вълни ({len(waves):,} известия) в {output}")
+    return 0
+
+
+def cli_extract(args):
+    """CLI: извлича клиентите за периода направо в CSV (конвейер на части)"""
+    start = parse_query_date(args.start) if args.start else None
+    end = parse_query_date(args.end) if args.end else None
+    outputs = args.output or [os.path.splitext(args.source)[0] + '_extract.csv']
+    suppression = SuppressionList.load(args.suppress, args.suppress_cache) if args.suppress else None
+    history = NotificationHistory(args.history) if args.history else None
+    if history is None and args.record:
+        # Както в прозореца - историята до източника, иначе --record не би записал нищо
+        history = NotificationHistory.for_source(args.source)
+        print(f"История на известията: {history.path}")
+    split = None
+    if args.max_rows or args.max_bytes or args.split_by:
+        split = {'max_rows': args.max_rows, 'max_bytes': args.max_bytes, 'partition_by': args.split_by}
+    stats = extract_date_range(args.source, start, end, outputs, args.chunksize,
+                               progress=cli_progress(), spec=args.spec, suppression=suppression,
+                               history=history, cooldown_days=args.cooldown, record_history=args.record,
+                               split=split, validate=args.validate, quarantine_path=args.quarantine)
+    if stats['missing_columns']:
+        print(f"Внимание: липсващи колони: {', '.join(stats['missing_columns'])}", file=sys.stderr)
+    print(f"Записани {stats['rows_written']:,} от {stats['rows_read']:,} реда в {', '.join(outputs)}")
+    if suppression is not None:
+        print(f"Премахнати с отказ от SMS: {stats['suppressed']:,} (списък с {len(suppression):,} номера)")
+    if history is not None:
+        print(f"Пропуснати (известени през последните {args.cooldown} дни): {stats['already_notified']:,}")
+    if args.validate == 'flag':
+        print(f"Отбелязани с невалиден ЕИК/телефон: {stats['invalid_rows']:,} (колона {VALIDATION_COLUMN})")
+    elif args.validate == 'quarantine':
+        print(f"Невалиден ЕИК/телефон: {stats['invalid_rows']:,} реда, отделени в {stats['quarantine_path']}")
+    stages = ', '.join(f"{name} {seconds:.1f} сек." for name, seconds in stats['stage_seconds'].items())
+    print(f"Общо {stats['wall_seconds']:.1f} сек. (етапи: {stages})")
+    if stats['writer_seconds']:
+        print("Запис: " + ', '.join(f"{os.path.basename(path)} {seconds:.1f} сек."
+                                    for path, seconds in stats['writer_seconds'].items()))
+    for manifest_path, parts in stats['parts'].items():
+        print(f"{len(parts)} части, описани в {manifest_path}")
+    return 0
+
+
+def cli_profile(args):
+    """CLI: профил на качеството на данните - JSON или HTML отчет"""
+    output = args.output or os.path.splitext(args.source)[0] + '_profile.html'
+    report = profile_source(args.source, args.chunksize, progress=cli_progress(), table=args.table)
+    write_profile_report(report, output)
+    for name, column in report['columns'].items():
+        problems = ', '.join(f"{title}: {format_profile_value(column, key)}"
+                             for key, title in PROFILE_REPORT_FIELDS
+                             if key in PROFILE_PROBLEM_FIELDS and column.get(key))
+        print(f"{name}: празни {format_profile_value(column, 'null_rate')}, "
+              f"различни {format_profile_value(column, 'distinct')}" + (f" - {problems}" if problems else ""))
+    print(f"{report['rows']:,} реда за {report['wall_seconds']:.1f} сек. Отчет: {output}")
+    return 0
+
+
+def cli_diff(args):
+    """CLI: сравнява две версии на базата и записва добавени/премахнати/променени клиенти"""
+    compare_columns = [c.strip() for c in args.columns.split(',')] if args.columns else None
+    key_columns = tuple(c.strip() for c in args.key.split(','))
+    output = args.output or os.path.splitext(args.new)[0] + '_diff'
+    counts = diff_snapshots(args.old, args.new, output, key_columns, compare_columns, args.partitions)
+    print(f"Добавени: {counts['added']:,}, премахнати: {counts['removed']:,}, "
+          f"променени: {counts['changed']:,}, без промяна: {counts['unchanged']:,}")
+    if counts['duplicates_old'] or counts['duplicates_new']:
+        print(f"Внимание: повтарящи се ключове - пропуснати {counts['duplicates_old']:,} реда в старата "
+              f"и {counts['duplicates_new']:,} в новата версия (сравнен е последният ред)", file=sys.stderr)
+    print(f"Записано в {output}")
+    return 0
+
+
+def cli_sqlite(args):
+    """CLI: зарежда Kasi_all в SQLite база с индекси"""
+    output = args.output or SqliteStore.default_path(args.source)
+    store = SqliteStore(output)
+    total_rows = store.build(iter_source_chunks(args.source, args.chunksize, progress=cli_progress()),
+                             file_fingerprint(args.source))
+    print(f"Заредени {total_rows:,} реда в {output}")
+    return 0
+
+
+def cli_serve(args):
+    """CLI: стартира локалната HTTP услуга с данните в паметта"""
+    serve_extraction(args.source, args.host, args.port, args.watch_interval)
+    return 0
+
+
+def read_extracted_rows(csv_path):
+    """Чете записан CSV с извлечени клиенти като текстов DataFrame"""
+    return pd.read_csv(csv_path, encoding='utf-8', dtype=str, keep_default_na=False)
+
+
+def cli_dispatch(args):
+    """CLI: изпраща SMS известия към шлюза по записан CSV с клиенти"""
+    rows = read_extracted_rows(args.clients)
+    if args.suppress:
+        rows, suppressed = SuppressionList.load(args.suppress, args.suppress_cache).anti_join(rows)
+        print(f"Премахнати с отказ от SMS: {suppressed:,}")
+    history = NotificationHistory(args.history) if args.history else None
+    if history is not None:
+        rows, notified = history.exclude_recent(rows, args.cooldown)
+        print(f"Пропуснати (известени през последните {args.cooldown} дни): {notified:,}")
+    messages = build_messages(rows, args.template)
+    journal = DispatchJournal(args.journal or os.path.splitext(args.clients)[0] + '_dispatch.jsonl')
+    dispatcher = SmsDispatcher(args.gateway, journal, api_key=args.api_key,
+                               batch_size=args.batch_size, concurrency=args.concurrency,
+                               rate=args.rate, max_retries=args.retries, history=history)
+    try:
+        stats = asyncio.run(dispatcher.dispatch(messages))
+    finally:
+        journal.close()
+    print(f"Изпратени: {stats['sent']}, отхвърлени: {stats['rejected']}, "
+          f"пропуснати (вече изпратени): {stats['skipped']}, неуспешни: {stats['failed']}")
+    return 0 if stats['failed'] == 0 else 2
+
+
+def cli_render(args):
+    """CLI: рендира шаблона за всички клиенти и показва оценка на изпращането"""
+    df = read_extracted_rows(args.clients)
+    rendered = render_messages(df, args.template)
+    output = args.output or os.path.splitext(args.clients)[0] + '_messages.csv'
+    rendered.to_csv(output, index=False, encoding='utf-8', quoting=csv.QUOTE_ALL)
+    estimate = estimate_sms_cost(rendered, args.price, args.rate)
+    print(f"Съобщения: {estimate['messages']:,}, SMS части: {estimate['segments']:,} "
+          f"(UCS-2: {estimate['ucs2_messages']:,}, многочастови: {estimate['multipart_messages']:,})")
+    print(f"Цена: {estimate['cost']:.2f}, време при {args.rate:.0f} SMS/сек: {estimate['seconds']} сек.")
+    print(f"Записано в {output}")
+    return 0
+
+
+def cli_mock_gateway(args):
+    """CLI: стартира локален тестов SMS шлюз"""
+    gateway = MockSmsGateway(args.host, args.port, args.fail_rate).start()
+    print(f"Тестовият шлюз слуша на {gateway.url}")
+    try:
+        while True:
+            threading.Event().wait(5)
+            print(f"Приети съобщения: {len(gateway.delivered)}, дубликати: {gateway.duplicates}")
+    except KeyboardInterrupt:
+        gateway.stop()
+    return 0
+
+
+def cli_benchmark_text(args):
+    """CLI: сравнява паметта и скоростта на object и Arrow текстови колони"""
+    if not arrow_text_dtype():
+        print("pyarrow не е инсталиран - измерва се само object вариантът.")
+    results = benchmark_text_storage(args.rows)
+    metrics = ['memory_mb', 'fixed_memory_mb', 'fix_encoding_s', 'filter_s', 'to_csv_lines_s', 'matches']
+    print(f"{'':16}" + ''.join(f"{name:>12}" for name in results))
+    for metric in metrics:
+        print(f"{metric:16}" + ''.join(f"{results[name][metric]:>12,.2f}" for name in results))
+    return 0
+
+
+def cli_benchmark_export(args):
+    """CLI: сравнява скоростта на запис във всеки изходен формат и във всички наведнъж"""
+    results = benchmark_export_formats(args.rows)
+    print(f"{'':8}{'сек.':>10}{'реда/сек.':>14}{'MB':>10}")
+    for name, result in results.items():
+        print(f"{name:8}{result['seconds']:>10.2f}{result['rows_per_s']:>14,.0f}{result['size_mb']:>10.1f}")
+    return 0
+
+
+def positive_rate(text):
+    """--rate: SMS в секунда - положително число"""
+    rate = float(text)
+    if not rate > 0:
+        raise ValueError(f"Скоростта трябва да е положителна: {text}")
+    return rate
+
+
+def run_cli(argv):
+    """Команден ред - изпълнява подкоманда без да стартира GUI"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SMS Notification Clients - команден ред")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    partition_parser = subparsers.add_parser('partition', help="Разделя Kasi_all на дялове по End_Data")
+    partition_parser.add_argument('source', help="MDB или CSV файл")
+    partition_parser.add_argument('--by', choices=['month', 'day'], default='month',
+                                  help="Размер на дяловете (по подразбиране: month)")
+    partition_parser.add_argument('--output', help="Директория на хранилището")
+    partition_parser.set_defaults(handler=cli_partition)
+
+    index_parser = subparsers.add_parser('index', help="Индекси за търсене по Number, Number_EKA, Phone, bulst")
+    index_parser.add_argument('source', help="MDB или CSV файл")
+    index_parser.add_argument('--output', help="Директория на индекса")
+    index_parser.set_defaults(handler=cli_index)
+
+    lookup_parser = subparsers.add_parser('lookup', help="Търси записи по номер, ЕКА, телефон или ЕИК")
+    lookup_parser.add_argument('source', help="MDB или CSV файл")
+    lookup_parser.add_argument('value', help="Търсената стойност")
+    lookup_parser.add_argument('--column', choices=LookupIndex.COLUMNS, help="Търси само в тази колона")
+    lookup_parser.set_defaults(handler=cli_lookup)
+
+    search_parser = subparsers.add_parser('search', help="Търси по част от Ime_Obekt, Ime_Firma, Adres_Obekt")
+    search_parser.add_argument('source', help="MDB или CSV файл")
+    search_parser.add_argument('query', help="Търсеният текст (поне 2 знака)")
+    search_parser.add_argument('--limit', type=int, default=20)
+    search_parser.set_defaults(handler=cli_search)
+
+    schedule_parser = subparsers.add_parser('schedule', help="Вълни известия за следващите N дни")
+    schedule_parser.add_argument('source', help="MDB или CSV файл")
+    schedule_parser.add_argument('--days', type=int, default=30, help="Хоризонт в дни (по подразбиране 30)")
+    schedule_parser.add_argument('--offsets', default=','.join(map(str, DEFAULT_WAVE_OFFSETS)),
+                                 help="Дни преди End_Data, напр. 30,14,7,1")
+    schedule_parser.add_argument('--today', help="Начална дата (dd.mm.yyyy), по подразбиране днес")
+    schedule_parser.add_argument('--output', help="Директория за вълните")
+    schedule_parser.set_defaults(handler=cli_schedule)
+
+    extract_parser = subparsers.add_parser('extract', help="Извлича клиентите с End_Data в периода в CSV")
+    extract_parser.add_argument('source', help="MDB или CSV файл")
+    extract_parser.add_argument('start', nargs='?', help="Начална дата (dd.mm.yyyy)")
+    extract_parser.add_argument('end', nargs='?', help="Крайна дата (dd.mm.yyyy)")
+    extract_parser.add_argument('--spec', help="JSON спецификация: таблица, колони, филтри, join-ове")
+    extract_parser.add_argument('--suppress', action='append',
+                                help="Файл с телефони, отказали SMS (може няколко пъти)")
+    extract_parser.add_argument('--suppress-cache',
+                                help="Кеш (.npz) на списъка за отказ - чете се от него, ако файловете "
+                                     "не са променяни, и се обновява при нужда")
+    extract_parser.add_argument('--history', help="Файл с историята на известията "
+                                                  "(с --record по подразбиране до източника)")
+    extract_parser.add_argument('--cooldown', type=int, default=NotificationHistory.DEFAULT_COOLDOWN_DAYS,
+                                help="Пропуска известените през последните N дни (с --history)")
+    extract_parser.add_argument('--record', action='store_true',
+                                help="Добавя извлечените редове в историята като известени "
+                                     "(без --history - в историята до източника)")
+    extract_parser.add_argument('--output', action='append',
+                                help="Изходен файл: .csv, .xlsx, .json, .ndjson или .parquet; "
+                                     "може няколко пъти - всички се пишат при едно четене "
+                                     "(по подразбиране <source>_extract.csv)")
+    extract_parser.add_argument('--max-rows', type=int,
+                                help="Разделя изхода на номерирани файлове до N реда всеки")
+    extract_parser.add_argument('--max-bytes', type=parse_byte_size,
+                                help="Разделя изхода на файлове до този размер, напр. 10MB (CSV/JSON/NDJSON)")
+    extract_parser.add_argument('--split-by', help="Отделни файлове за всяка стойност на колоната, напр. Ime_Firma")
+    extract_parser.add_argument('--validate', choices=['flag', 'quarantine'],
+                                help="Проверка на ЕИК (bulst) и мобилен телефон: flag - колона с причината, "
+                                     "quarantine - невалидните редове в отделен файл")
+    extract_parser.add_argument('--quarantine', help="Файл за невалидните редове (по подразбиране <output>_quarantine.csv)")
+    extract_parser.add_argument('--chunksize', type=int, default=100000, help="Редове на част")
+    extract_parser.set_defaults(handler=cli_extract)
+
+    profile_parser = subparsers.add_parser('profile', help="Профил на качеството на данните (JSON/HTML отчет)")
+    profile_parser.add_argument('source', help="MDB или CSV файл")
+    profile_parser.add_argument('--output', help="Отчет: .html или .json (по подразбиране <source>_profile.html)")
+    profile_parser.add_argument('--table', default=DEFAULT_TABLE, help="Таблица в MDB файла")
+    profile_parser.add_argument('--chunksize', type=int, default=100000, help="Редове на част")
+    profile_parser.set_defaults(handler=cli_profile)
+
+    diff_parser = subparsers.add_parser('diff', help="Сравнява две версии на Kasi_all (общите колони; "
+                                                     "при повтарящ се ключ - последният ред)")
+    diff_parser.add_argument('old', help="Предишната версия (MDB или CSV)")
+    diff_parser.add_argument('new', help="Новата версия (MDB или CSV)")
+    diff_parser.add_argument('--key', default=','.join(DIFF_KEY_COLUMNS),
+                             help="Ключови колони; при повтарящ се ключ се сравнява последният ред, "
+                                  "а броят пропуснатите дубликати се извежда")
+    diff_parser.add_argument('--columns', help="Колони за сравнение, напр. End_Data,Phone (по подразбиране всички)")
+    diff_parser.add_argument('--partitions', type=int, default=16,
+                             help="Брой временни дялове (повече дялове = по-малко памет)")
+    diff_parser.add_argument('--output', help="Директория за резултата")
+    diff_parser.set_defaults(handler=cli_diff)
+
+    sqlite_parser = subparsers.add_parser('sqlite', help="Експортира Kasi_all в SQLite база с индекси")
+    sqlite_parser.add_argument('source', help="MDB или CSV файл")
+    sqlite_parser.add_argument('--output', help="Път до базата (по подразбиране <source>.sqlite)")
+    sqlite_parser.add_argument('--chunksize', type=int, default=200000, help="Редове на транзакция")
+    sqlite_parser.set_defaults(handler=cli_sqlite)
+
+    serve_parser = subparsers.add_parser('serve', help="Локална HTTP услуга за извличане на клиенти")
+    serve_parser.add_argument('source', help="MDB или CSV файл")
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--watch-interval', type=float, default=5.0,
+                              help="Интервал (сек.) за проверка за промени във файла")
+    serve_parser.set_defaults(handler=cli_serve)
+
+    dispatch_parser = subparsers.add_parser('dispatch', help="Изпраща SMS известия към шлюз")
+    dispatch_parser.add_argument('clients', help="CSV с извлечени клиенти (от 'Запиши CSV')")
+    dispatch_parser.add_argument('--template', default=DEFAULT_SMS_TEMPLATE,
+                                 help="Текст на съобщението, напр. 'Устройство {Number_EKA} изтича на {End_Data:%%d.%%m.%%Y}'")
+    dispatch_parser.add_argument('--gateway', required=True, help="URL на SMS шлюза")
+    dispatch_parser.add_argument('--api-key')
+    dispatch_parser.add_argument('--journal', help="Дневник за продължаване след прекъсване")
+    dispatch_parser.add_argument('--batch-size', type=int, default=100)
+    dispatch_parser.add_argument('--concurrency', type=int, default=4)
+    dispatch_parser.add_argument('--rate', type=positive_rate, default=SmsDispatcher.DEFAULT_RATE,
+                                 help="Съобщения в секунда")
+    dispatch_parser.add_argument('--retries', type=int, default=5)
+    dispatch_parser.add_argument('--suppress', action='append',
+                                 help="Файл с телефони, отказали SMS (може няколко пъти)")
+    dispatch_parser.add_argument('--suppress-cache',
+                                 help="Кеш (.npz) на списъка за отказ (както при extract)")
+    dispatch_parser.add_argument('--history', help="Файл с историята на известията - изпратените се добавят в него")
+    dispatch_parser.add_argument('--cooldown', type=int, default=NotificationHistory.DEFAULT_COOLDOWN_DAYS,
+                                 help="Пропуска известените през последните N дни (с --history)")
+    dispatch_parser.set_defaults(handler=cli_dispatch)
+
+    render_parser = subparsers.add_parser('render', help="Рендира SMS текстовете и оценява цената")
+    render_parser.add_argument('clients', help="CSV с извлечени клиенти")
+    render_parser.add_argument('--template', default=DEFAULT_SMS_TEMPLATE)
+    render_parser.add_argument('--output', help="Изходен CSV (по подразбиране *_messages.csv)")
+    render_parser.add_argument('--price', type=float, default=0.0, help="Цена за една SMS част")
+    render_parser.add_argument('--rate', type=positive_rate, default=SmsDispatcher.DEFAULT_RATE,
+                               help="Очаквана скорост (SMS/сек.)")
+    render_parser.set_defaults(handler=cli_render)
+
+    gateway_parser = subparsers.add_parser('mock-gateway', help="Локален тестов SMS шлюз")
+    gateway_parser.add_argument('--host', default='127.0.0.1')
+    gateway_parser.add_argument('--port', type=int, default=8766)
+    gateway_parser.add_argument('--fail-rate', type=float, default=0.0,
+                                help="Дял заявки, на които шлюзът отговаря с 503")
+    gateway_parser.set_defaults(handler=cli_mock_gateway, needs_pandas=False)
+
+    bench_parser = subparsers.add_parser('benchmark-text', help="Памет/скорост: object срещу Arrow низове")
+    bench_parser.add_argument('--rows', type=int, default=2_000_000)
+    bench_parser.set_defaults(handler=cli_benchmark_text)
+
+    export_bench_parser = subparsers.add_parser('benchmark-export', help="Скорост на запис по формати и fan-out")
+    export_bench_parser.add_argument('--rows', type=int, default=500_000)
+    export_bench_parser.set_defaults(handler=cli_benchmark_export)
+
+    args = parser.parse_args(argv)
+    if getattr(args, 'needs_pandas', True) and not PANDAS_AVAILABLE:
+        print("Грешка: pandas не е инсталиран!", file=sys.stderr)
+        return 1
+    try:
+        return args.handler(args)
+    except Exception as e:
+        print(f"Грешка: {e}", file=sys.stderr)
+        return 1
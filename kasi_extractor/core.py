@@ -0,0 +1,329 @@
+"""
+Общи помощни функции: незадължителните зависимости (pandas, pyarrow), колоните
+на Kasi_all, текстови колони, поправка на кодировката и разбор на датите.
+"""
+
+from datetime import datetime
+from collections import namedtuple
+import os
+import functools
+
+
+try:
+    import pandas as pd
+    import numpy as np
+    PANDAS_AVAILABLE = True
+except ImportError:
+    # Модулите импортират pd/np оттук - без pandas работи само копирането на CSV
+    pd = np = None
+    PANDAS_AVAILABLE = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pa = pc = pq = None
+    PYARROW_AVAILABLE = False
+
+# Текстовите колони се държат като Arrow низове (ако има pyarrow)
+USE_ARROW_STRINGS = PYARROW_AVAILABLE
+
+
+# Таблицата с касовите апарати в MDB базата
+DEFAULT_TABLE = 'Kasi_all'
+
+# Колоните, които се извличат за SMS известията
+REQUIRED_COLUMNS = ('Number', 'End_Data', 'Model', 'Number_EKA', 'Ime_Obekt',
+                    'Adres_Obekt', 'Dan_Number', 'Phone', 'Ime_Firma', 'bulst')
+
+ColumnPlan = namedtuple('ColumnPlan', ['names', 'indices', 'missing'])
+
+
+@functools.lru_cache(maxsize=64)
+def compile_column_plan(headers, required_columns=REQUIRED_COLUMNS):
+    """
+    Съпоставя нужните колони с индекси в заглавния ред (кешира се по заглавията).
+    Първо се търси точно съвпадение, после съвпадение без значение на регистъра
+    и накрая - колона, която съдържа името (старото поведение).
+    """
+    headers = [h for h in headers if h != 'End_Data_parsed']
+    lowered = [h.lower() for h in headers]
+    names, indices, missing = [], [], []
+    for col_name in required_columns:
+        if col_name in headers:
+            index = headers.index(col_name)
+        elif col_name.lower() in lowered:
+            index = lowered.index(col_name.lower())
+        else:
+            index = next((i for i, h in enumerate(lowered) if col_name.lower() in h), None)
+
+        if index is None:
+            missing.append(col_name)
+        else:
+            names.append(col_name)
+            indices.append(index)
+    return ColumnPlan(tuple(names), tuple(indices), tuple(missing))
+
+
+def column_as_text(series):
+    """Превръща колона в текст: празно за липсващи стойности, '123' вместо '123.0'"""
+    if isinstance(series.dtype, pd.StringDtype):
+        # Arrow/string колоните остават в буферите си - без минаване през object
+        text = series.fillna('')
+    else:
+        text = series.astype(object).where(series.notna(), '').astype(str)
+    return text.str.replace(r'^(-?\d+)\.0$', r'\1', regex=True)
+
+
+def project_columns(df, plan):
+    """Избира колоните от плана с едно вземане по индекси и ги превръща в текст"""
+    projected = df.iloc[:, list(plan.indices)]
+    projected.columns = list(plan.names)
+    return projected.apply(column_as_text)
+
+
+def quoted_csv_header(columns):
+    return ','.join(f'"{col}"' for col in columns)
+
+
+def quoted_csv_series(text_df):
+    """Редовете на текстов DataFrame във формат "a","b" като колона (без заглавие)"""
+    quoted = ['"' + text_df[col].str.replace('"', '""', regex=False) + '"' for col in text_df.columns]
+    lines = quoted[0]
+    for column in quoted[1:]:
+        lines = lines + ',' + column
+    return lines
+
+
+def to_quoted_csv_lines(text_df):
+    """Връща заглавие + редове във формат "a","b" (за текстов DataFrame)"""
+    header = quoted_csv_header(text_df.columns)
+    if len(text_df) == 0:
+        return [header]
+    return [header] + quoted_csv_series(text_df).tolist()
+
+
+def concat_text(series):
+    """
+    Всички стойности на текстова колона, слепени в UTF-8 байтове. При Arrow
+    низове това е направо буферът с данните (без Python низове и почти без
+    GIL), така че писачите в отделни нишки наистина вървят паралелно.
+    """
+    if len(series) == 0:
+        return b''
+    if PYARROW_AVAILABLE and isinstance(series.dtype, pd.StringDtype) and series.dtype.storage == 'pyarrow':
+        array = pa.array(series.array)
+        parts = []
+        for chunk in (array.chunks if isinstance(array, pa.ChunkedArray) else [array]):
+            if chunk.null_count:
+                chunk = chunk.fill_null('')
+            offset_type = np.int64 if pa.types.is_large_string(chunk.type) else np.int32
+            offsets = np.frombuffer(chunk.buffers()[1], dtype=offset_type)[chunk.offset:chunk.offset + len(chunk) + 1]
+            if len(offsets) and offsets[-1] > offsets[0]:
+                parts.append(memoryview(chunk.buffers()[2])[offsets[0]:offsets[-1]])
+        return parts[0] if len(parts) == 1 else b''.join(parts)
+    return ''.join(series.tolist()).encode('utf-8')
+
+
+def utf8_lengths(series):
+    """Дължината в UTF-8 байтове на всяка стойност от текстова колона (numpy масив)"""
+    if len(series) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if PYARROW_AVAILABLE and isinstance(series.dtype, pd.StringDtype) and series.dtype.storage == 'pyarrow':
+        lengths = pc.binary_length(pa.array(series.array)).fill_null(0)
+        return lengths.to_numpy(zero_copy_only=False).astype(np.int64)
+    return series.str.encode('utf-8').str.len().to_numpy(dtype=np.int64)
+
+
+def file_fingerprint(file_path):
+    """Връща отпечатък (път, размер, време на промяна) на файла"""
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+
+def is_text_column(series):
+    """Проверява дали колоната е текстова (object или string dtype)"""
+    return (pd.api.types.is_object_dtype(series.dtype) or
+            pd.api.types.is_string_dtype(series.dtype))
+
+
+def parse_end_data(series):
+    """
+    Парсва колоната End_Data във формата на mdb-export (с резервни формати).
+    Датите силно се повтарят, затова всяка различна стойност се парсва
+    веднъж и резултатът се разпъва по кодовете от pd.factorize.
+    """
+    codes, uniques = pd.factorize(series)
+    if len(uniques) == 0 or len(uniques) * 2 > len(series):
+        return _parse_end_data_values(series)
+    parsed = _parse_end_data_values(pd.Series(uniques)).to_numpy()
+    values = parsed[codes]
+    values[codes < 0] = np.datetime64('NaT')
+    return pd.Series(values, index=series.index, name=series.name)
+
+
+def _parse_end_data_values(series):
+    try:
+        return pd.to_datetime(series, format='%m/%d/%y %H:%M:%S', errors='coerce')
+    except:
+        try:
+            return pd.to_datetime(series, format='%m/%d/%Y %H:%M:%S', errors='coerce')
+        except:
+            return pd.to_datetime(series, errors='coerce')
+
+
+def fix_encoding_utf8_to_windows1251(text):
+    """
+    Поправя текст използвайки работещия метод: UTF-8→Latin-1→Windows-1251
+    """
+    try:
+        step1 = text.encode('latin-1', errors='ignore')
+        result = step1.decode('windows-1251', errors='ignore')
+        return result
+    except:
+        return text
+
+
+def arrow_text_dtype():
+    """
+    Dtype за текстовите колони: string[pyarrow] (UTF-8 буфер + отмествания)
+    ако има pyarrow, иначе None (остават object/str по подразбиране).
+    Липсващите стойности остават NaN, както при object колоните.
+    """
+    if not (USE_ARROW_STRINGS and PYARROW_AVAILABLE):
+        return None
+    try:
+        return pd.StringDtype('pyarrow', na_value=np.nan)
+    except TypeError:
+        # pandas < 2.3 няма na_value - string[pyarrow] с pd.NA
+        return pd.StringDtype('pyarrow')
+
+
+def use_arrow_strings(df):
+    """Превръща текстовите колони в Arrow низове (на място); без pyarrow не прави нищо"""
+    dtype = arrow_text_dtype()
+    if dtype is None:
+        return df
+    for column in df.columns:
+        if is_text_column(df[column]) and df[column].dtype != dtype:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def fix_encoding_series(series):
+    """
+    Векторизирана поправка на кодировката на цяла колона.
+
+    Поправката е знак по знак (UTF-8→Latin-1→Windows-1251 с errors='ignore'),
+    затова цялата колона се съединява с разделител '\x00', прекодира се с
+    едно извикване и се разделя обратно - вместо по едно извикване на ред.
+    Ако някоя стойност съдържа самия разделител, се минава ред по ред.
+    Arrow колоните се поправят направо върху буфера (_fix_encoding_arrow).
+    Липсващите стойности стават ''. Резултатът запазва dtype-а на колоната.
+    """
+    if isinstance(series.dtype, pd.StringDtype) and series.dtype.storage == 'pyarrow':
+        return pd.Series(_fix_encoding_arrow(pa.array(series.array)), index=series.index,
+                         name=series.name, dtype=series.dtype)
+    values = series.fillna('').astype(str)
+    if len(values) == 0:
+        return values
+    if values.str.contains('\x00', regex=False).any():
+        fixed = values.map(fix_encoding_utf8_to_windows1251)
+    else:
+        joined = '\x00'.join(values.tolist())
+        repaired = joined.encode('latin-1', errors='ignore').decode('windows-1251', errors='ignore')
+        fixed = pd.Series(repaired.split('\x00'), index=series.index)
+    if isinstance(series.dtype, pd.StringDtype):
+        return fixed.astype(series.dtype)
+    return fixed
+
+
+# Знаци, които поправката изтрива: извън Latin-1 и 0x98 (няма го в Windows-1251)
+_ENCODING_DROPPED_RE = '[^\\x00-\\x97\\x99-\\xff]'
+# Latin-1 знаци, чийто Windows-1251 еквивалент е 3 байта в UTF-8 (€, „, №, ...) -
+# всички останали запазват дължината си в байтове (ASCII 1→1, останалите 2→2)
+_ENCODING_WIDENED_RE = '[' + ''.join(
+    '\\x%02x' % b for b in range(0x80, 0x100)
+    if b != 0x98 and len(bytes([b]).decode('windows-1251').encode('utf-8')) == 3) + ']'
+
+
+def _fix_encoding_arrow(array):
+    """
+    Поправка на кодировката директно върху UTF-8 буфера на Arrow колона.
+
+    Целият буфер се прекодира наведнъж; отместванията на редовете се
+    запазват, а се коригират само за редовете със знаци, които стават
+    3-байтови. Връща pyarrow large_string масив без null стойности.
+    """
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    array = pc.fill_null(array, '').cast(pa.large_string())
+
+    def latin1_bytes(array):
+        offsets = np.frombuffer(array.buffers()[1], dtype=np.int64)[array.offset:array.offset + len(array) + 1]
+        data = array.buffers()[2]
+        data = data.to_pybytes()[offsets[0]:offsets[-1]] if data is not None else b''
+        return offsets - offsets[0], data, data.decode('utf-8').encode('latin-1')
+
+    try:
+        offsets, data, raw = latin1_bytes(array)
+        clean = b'\x98' not in raw
+    except UnicodeEncodeError:
+        clean = False
+    if not clean:
+        # Рядкият случай - първо махаме знаците, които поправката изтрива
+        array = pc.replace_substring_regex(array, _ENCODING_DROPPED_RE, '')
+        offsets, data, raw = latin1_bytes(array)
+
+    repaired = raw.decode('windows-1251').encode('utf-8')
+    if len(repaired) != len(data):
+        widened = pc.count_substring_regex(array, _ENCODING_WIDENED_RE).to_numpy(zero_copy_only=False)
+        offsets = offsets.copy()
+        offsets[1:] += np.cumsum(widened, dtype=np.int64)
+    return pa.LargeStringArray.from_buffers(len(array), pa.py_buffer(np.ascontiguousarray(offsets)),
+                                            pa.py_buffer(repaired))
+
+
+def fix_dataframe_encoding(df):
+    """Поправя кодировката на всички текстови колони на място"""
+    for column in df.columns:
+        if is_text_column(df[column]):
+            df[column] = fix_encoding_series(df[column])
+    return df
+
+
+def detect_source_type(file_path):
+    """Разпознава типа на източника по разширението ('mdb', 'csv' или 'unknown')"""
+    file_extension = os.path.splitext(file_path)[1].lower()
+    if file_extension == '.mdb':
+        return 'mdb'
+    if file_extension == '.csv':
+        return 'csv'
+    return 'unknown'
+
+
+def parse_query_date(text):
+    """Приема дата като dd.mm.yyyy или yyyy-mm-dd"""
+    for date_format in ('%d.%m.%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(text.strip(), date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Невалидна дата: {text}")
+
+
+HASH_MIX_1 = 0xBF58476D1CE4E5B9
+HASH_MIX_2 = 0x94D049BB133111EB
+HASH_GOLDEN = 0x9E3779B97F4A7C15
+
+
+def mix64(keys):
+    """splitmix64 - векторизирано разбъркване на int64 ключове"""
+    with np.errstate(over='ignore'):
+        z = keys.astype(np.uint64) + np.uint64(HASH_GOLDEN)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(HASH_MIX_1)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(HASH_MIX_2)
+        return z ^ (z >> np.uint64(31))
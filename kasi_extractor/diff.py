@@ -0,0 +1,142 @@
+"""
+Разлики между две снимки на Kasi_all по ключ (добавени, премахнати, променени).
+"""
+
+import csv
+import os
+import tempfile
+import shutil
+
+from .core import column_as_text, pd
+from .sources import iter_source_chunks, source_columns
+
+
+DIFF_KEY_COLUMNS = ('Number', 'Number_EKA')
+
+
+def diff_snapshots(old_path, new_path, output_dir, key_columns=DIFF_KEY_COLUMNS,
+                   compare_columns=None, partitions=16, chunksize=200000):
+    """
+    Сравнява две версии на Kasi_all (MDB или CSV) ред по ред.
+
+    1) Двата източника се четат на части; за всеки ред се смята хеш на ключа
+       (Number/Number_EKA) и хеш на съдържанието (векторно), а редът се
+       записва в един от partitions временни дяла според хеша на ключа.
+    2) Всеки дял се обработва отделно с hash join по ключа - в паметта е
+       само 1/partitions от таблицата.
+    Резултатът се дописва поточно в added.csv, removed.csv и changed.csv
+    (changed съдържа новите стойности, Changed_Columns и старите стойности).
+    Сравняват се само колоните, общи за двете версии, в един и същи ред -
+    добавена колона или различен ред на колоните не прави редовете
+    "променени". При повтарящ се ключ се взима последният ред, а броят
+    пропуснатите дубликати се връща в duplicates_old/duplicates_new.
+    Връща речник с броя редове във всяка група.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    counts = {'added': 0, 'removed': 0, 'changed': 0, 'unchanged': 0,
+              'duplicates_old': 0, 'duplicates_new': 0}
+
+    old_header = source_columns(old_path)
+    new_header = source_columns(new_path)
+    common = [c for c in old_header if c in new_header and c not in key_columns]
+    compare = [c for c in compare_columns if c in common] if compare_columns else common
+
+    spill_dir = tempfile.mkdtemp(prefix='kasi_diff_')
+    try:
+        columns = {}
+        for side, source in (('old', old_path), ('new', new_path)):
+            writers = {}
+            handles = []
+            for chunk in iter_source_chunks(source, chunksize):
+                missing = [col for col in key_columns if col not in chunk.columns]
+                if missing:
+                    raise RuntimeError(f"Липсват ключови колони в {os.path.basename(source)}: {', '.join(missing)}")
+                text = chunk.drop(columns=['End_Data_parsed'], errors='ignore').apply(column_as_text)
+                columns[side] = list(text.columns)
+
+                # Хешът е само по общите колони в реда на compare - еднакъв за двете страни
+                missing = [c for c in compare if c not in text.columns]
+                if missing:
+                    raise RuntimeError(f"Липсват колони в {os.path.basename(source)}: {', '.join(missing)}")
+                text['_row_hash'] = pd.util.hash_pandas_object(text[compare], index=False).astype(str)
+                part_ids = pd.util.hash_pandas_object(text[list(key_columns)], index=False).values % partitions
+
+                for part_id, group in text.groupby(part_ids, sort=False):
+                    if part_id not in writers:
+                        handle = open(os.path.join(spill_dir, f"{side}_{part_id}.csv"), 'w',
+                                      encoding='utf-8', newline='')
+                        handles.append(handle)
+                        writers[part_id] = csv.writer(handle)
+                        writers[part_id].writerow(group.columns)
+                    writers[part_id].writerows(group.itertuples(index=False, name=None))
+            for handle in handles:
+                handle.close()
+
+        old_columns = columns.get('old', [c for c in old_header if c != 'End_Data_parsed'])
+        new_columns = columns.get('new', [c for c in new_header if c != 'End_Data_parsed'])
+        key = list(key_columns)
+
+        outputs = {}
+        for name, header in (('added', new_columns), ('removed', old_columns),
+                             ('changed', new_columns + ['Changed_Columns'] + [f'old_{c}' for c in compare])):
+            handle = open(os.path.join(output_dir, f"{name}.csv"), 'w', encoding='utf-8', newline='')
+            writer = csv.writer(handle, quoting=csv.QUOTE_ALL)
+            writer.writerow(header)
+            outputs[name] = (handle, writer)
+
+        try:
+            for part_id in range(partitions):
+                old_part, old_duplicates = _read_spill(os.path.join(spill_dir, f"old_{part_id}.csv"),
+                                                       old_columns, key)
+                new_part, new_duplicates = _read_spill(os.path.join(spill_dir, f"new_{part_id}.csv"),
+                                                       new_columns, key)
+                counts['duplicates_old'] += old_duplicates
+                counts['duplicates_new'] += new_duplicates
+
+                merged = new_part.merge(old_part, on=key, how='outer', suffixes=('', '_old'), indicator=True)
+                added = merged[merged['_merge'] == 'left_only']
+                removed = merged[merged['_merge'] == 'right_only']
+                both = merged[merged['_merge'] == 'both']
+                changed = both[both['_row_hash'] != both['_row_hash_old']].copy()
+
+                if len(changed):
+                    changed_columns = pd.Series('', index=changed.index)
+                    for col in compare:
+                        differs = changed[col] != changed[f'{col}_old']
+                        changed_columns = changed_columns.where(~differs, changed_columns + ',' + col)
+                    changed['Changed_Columns'] = changed_columns.str.lstrip(',')
+                    # Различен хеш без различна колона (съвпадение на хешове) не е промяна
+                    changed = changed[changed['Changed_Columns'] != '']
+
+                counts['unchanged'] += len(both) - len(changed)
+                counts['added'] += len(added)
+                counts['removed'] += len(removed)
+                counts['changed'] += len(changed)
+
+                outputs['added'][1].writerows(added[new_columns].itertuples(index=False, name=None))
+                removed_rows = removed[[c if c in key or c not in new_columns else f'{c}_old'
+                                        for c in old_columns]]
+                outputs['removed'][1].writerows(removed_rows.itertuples(index=False, name=None))
+
+                if len(changed):
+                    out = changed[new_columns + ['Changed_Columns'] + [f'{c}_old' for c in compare]]
+                    outputs['changed'][1].writerows(out.itertuples(index=False, name=None))
+        finally:
+            for handle, _ in outputs.values():
+                handle.close()
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    return counts
+
+
+def _read_spill(path, columns, key):
+    """
+    Чете временен дял от diff_snapshots (последният ред за повтарящ се ключ
+    печели). Връща (дял, брой пропуснати дубликати).
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns + ['_row_hash'], dtype=str), 0
+    part = pd.read_csv(path, encoding='utf-8', dtype=str, keep_default_na=False)
+    unique = part.drop_duplicates(subset=key, keep='last')
+    return unique, len(part) - len(unique)
@@ -0,0 +1,254 @@
+"""
+Изпращане на SMS към шлюза: лимит на скоростта, дневник и тестов шлюз.
+"""
+
+from datetime import datetime
+import json
+import os
+import threading
+import asyncio
+import random
+import urllib.request
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .messages import history_keys
+
+
+class TokenBucket:
+    """Ограничител на скоростта (token bucket) за asyncio - rate съобщения в секунда"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self._updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens=1):
+        tokens = min(tokens, self.capacity)
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class DispatchJournal:
+    """
+    Дневник (append-only JSONL) на изпращането.
+
+    Преди всяка партида се записва 'pending', а след отговора - 'sent' или
+    'rejected'. При повторно пускане завършените съобщения се пропускат, а
+    недовършените ('pending') се изпращат отново със същия id, така че
+    шлюзът ги разпознава като дубликати и не ги изпраща втори път.
+    """
+
+    FINAL_STATES = ('sent', 'rejected')
+
+    def __init__(self, path):
+        self.path = path
+        self.states = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # недописан ред след срив
+                    self.states[entry['id']] = entry['status']
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def is_done(self, message_id):
+        return self.states.get(message_id) in self.FINAL_STATES
+
+    def record(self, entries):
+        """Записва състоянията и ги изпраща на диска преди да продължим"""
+        stamp = datetime.now().isoformat(timespec='seconds')
+        for entry in entries:
+            self.states[entry['id']] = entry['status']
+            self._file.write(json.dumps(dict(entry, ts=stamp), ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class SmsDispatcher:
+    """
+    Изпраща съобщения към SMS шлюз на партиди.
+
+    Партидите се изпращат паралелно (до concurrency заявки), скоростта се
+    ограничава с TokenBucket, а временните грешки (мрежа, 429, 5xx) се
+    повтарят с експоненциално нарастващо изчакване. Всичко се отразява в
+    DispatchJournal, за да може прекъснато изпращане да продължи, а
+    изпратените се добавят в NotificationHistory (ако е зададена).
+
+    Протокол на шлюза: POST {"messages": [{"id", "to", "text"}, ...]} ->
+    {"results": [{"id", "status": "accepted"|"rejected", "error"}]}.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    DEFAULT_RATE = 50.0
+
+    def __init__(self, gateway_url, journal, api_key=None, batch_size=100, concurrency=4,
+                 rate=DEFAULT_RATE, max_retries=5, backoff=1.0, timeout=30, history=None):
+        self.gateway_url = gateway_url
+        self.journal = journal
+        self.history = history
+        self.api_key = api_key
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.rate_limiter = TokenBucket(rate, max(rate, batch_size))
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.stats = {'sent': 0, 'rejected': 0, 'skipped': 0, 'failed': 0}
+
+    def _post(self, payload):
+        """Блокираща HTTP заявка към шлюза (изпълнява се в отделна нишка)"""
+        request = urllib.request.Request(
+            self.gateway_url, data=json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+            headers={'Content-Type': 'application/json; charset=utf-8'}, method='POST')
+        if self.api_key:
+            request.add_header('Authorization', f'Bearer {self.api_key}')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+    async def _send_batch(self, batch, semaphore):
+        async with semaphore:
+            self.journal.record([{'id': m['id'], 'status': 'pending', 'to': m['to']} for m in batch])
+
+            for attempt in range(self.max_retries + 1):
+                # Всеки опит (и повторният след 429/5xx) взима жетони от лимита
+                await self.rate_limiter.acquire(len(batch))
+                try:
+                    status, body = await asyncio.to_thread(self._post, {'messages': batch})
+                except (urllib.error.URLError, OSError, ValueError):
+                    # ValueError - отговор 200, който не е JSON
+                    status, body = None, None
+
+                if status == 200:
+                    try:
+                        self._record_results(batch, body.get('results', []))
+                        return
+                    except (AttributeError, TypeError):
+                        # JSON, но не във формата на протокола - повтаря се като временна грешка
+                        status = None
+                if status is not None and status not in self.RETRY_STATUSES:
+                    # Постоянна грешка - шлюзът отхвърля цялата партида
+                    self.journal.record([{'id': m['id'], 'status': 'rejected', 'error': f'HTTP {status}'}
+                                         for m in batch])
+                    self.stats['rejected'] += len(batch)
+                    return
+                if attempt < self.max_retries:
+                    delay = self.backoff * (2 ** attempt)
+                    await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
+            # Изчерпани опити - остават 'pending' и ще се изпратят при следващо пускане
+            self.stats['failed'] += len(batch)
+
+    def _record_results(self, batch, results):
+        # Първо се разчита целият отговор - при неочакван формат нищо не се записва
+        by_id = {result.get('id'): result for result in results}
+        entries = []
+        for message in batch:
+            result = by_id.get(message['id'], {})
+            if result.get('status') == 'accepted':
+                entries.append({'id': message['id'], 'status': 'sent'})
+            else:
+                entries.append({'id': message['id'], 'status': 'rejected',
+                                'error': result.get('error', 'няма отговор за съобщението')})
+        sent = sum(entry['status'] == 'sent' for entry in entries)
+        self.stats['sent'] += sent
+        self.stats['rejected'] += len(entries) - sent
+        self.journal.record(entries)
+        if self.history is not None:
+            self.history.record(history_keys([entry['id'] for entry in entries if entry['status'] == 'sent']))
+
+    async def dispatch(self, messages):
+        """Изпраща всички още неизпратени съобщения и връща статистика"""
+        pending = []
+        seen = set()
+        for message in messages:
+            if self.journal.is_done(message['id']) or message['id'] in seen:
+                self.stats['skipped'] += 1
+                continue
+            seen.add(message['id'])
+            pending.append(message)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+        await asyncio.gather(*(self._send_batch(batch, semaphore) for batch in batches))
+        return self.stats
+
+
+class MockSmsGateway:
+    """
+    Локален тестов SMS шлюз със същия протокол като SmsDispatcher.
+    Пази приетите id (повторно изпратен id не се брои втори път) и може
+    да симулира временни откази (fail_rate) за проверка на повторните опити.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, fail_rate=0.0):
+        self.delivered = {}
+        self.duplicates = 0
+        self.requests = 0
+        self.fail_rate = fail_rate
+        self._lock = threading.Lock()
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length).decode('utf-8'))
+                with gateway._lock:
+                    gateway.requests += 1
+                    if random.random() < gateway.fail_rate:
+                        self.send_response(503)
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    results = []
+                    for message in payload.get('messages', []):
+                        if not message.get('to') or not message.get('text'):
+                            results.append({'id': message.get('id'), 'status': 'rejected',
+                                            'error': 'липсва номер или текст'})
+                            continue
+                        if message['id'] in gateway.delivered:
+                            gateway.duplicates += 1
+                        else:
+                            gateway.delivered[message['id']] = message
+                        results.append({'id': message['id'], 'status': 'accepted'})
+                body = json.dumps({'results': results}, ensure_ascii=False).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{self.server.server_address[1]}/send"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
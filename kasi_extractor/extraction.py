@@ -0,0 +1,331 @@
+"""
+Извличане на клиентите за период: спецификация, филтри, join-ове и конвейерът
+до изходните файлове.
+"""
+
+import json
+import os
+
+from .core import (DEFAULT_TABLE, REQUIRED_COLUMNS, column_as_text, compile_column_plan, detect_source_type,
+                   fix_dataframe_encoding, np, parse_end_data, pd, project_columns, use_arrow_strings)
+from .sources import iter_source_chunks, stream_source_chunks
+from .pipeline import Pipeline
+from .writers import SplitWriter, open_table_writer, open_table_writers
+from .validation import VALIDATION_COLUMN, validate_clients
+from .messages import notification_keys
+
+
+# Спецификация по подразбиране - извличането на SMS клиентите от Kasi_all
+DEFAULT_EXTRACTION_SPEC = {
+    'table': DEFAULT_TABLE,
+    'date_column': 'End_Data',
+    'columns': list(REQUIRED_COLUMNS),
+    'filters': [],
+    'joins': [],
+}
+
+SPEC_FILTER_OPS = ('eq', 'ne', 'in', 'not_in', 'contains', 'startswith', 'notnull', 'isnull')
+SPEC_JOIN_TYPES = ('left', 'inner')
+
+
+def load_extraction_spec(spec=None):
+    """
+    Зарежда и проверява спецификация за извличане (път до JSON файл или речник).
+
+    {
+      "table": "Kasi_all",
+      "date_column": "End_Data",
+      "columns": ["Number_EKA", "End_Data", "Phone", "Firma_Ime", "Serviz_Ime"],
+      "filters": [{"column": "Model", "op": "in", "value": ["Datecs DP-25", "Tremol S21"]}],
+      "joins": [
+        {"table": "Firmi", "on": "bulst", "right_on": "EIK",
+         "columns": ["Ime", "Telefon"], "prefix": "Firma_"},
+        {"source": "serviz.csv", "on": "Dan_Number", "how": "inner", "prefix": "Serviz_"}
+      ]
+    }
+
+    Липсващите полета се взимат от DEFAULT_EXTRACTION_SPEC. "date_column": null
+    изключва филтъра по дата. Join е към таблица от същата MDB база ("table")
+    или към друг MDB/CSV файл ("source"). При грешка хвърля ValueError.
+    """
+    if spec is None:
+        spec = {}
+    elif isinstance(spec, str):
+        with open(spec, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+    if not isinstance(spec, dict):
+        raise ValueError("Спецификацията трябва да е JSON обект!")
+
+    result = dict(DEFAULT_EXTRACTION_SPEC)
+    result.update(spec)
+    if not result['columns']:
+        raise ValueError("Спецификацията няма колони за извличане!")
+
+    for spec_filter in result['filters']:
+        if 'column' not in spec_filter or spec_filter.get('op') not in SPEC_FILTER_OPS:
+            raise ValueError(f"Невалиден филтър {spec_filter} - операции: {', '.join(SPEC_FILTER_OPS)}")
+        if spec_filter['op'] in ('in', 'not_in') and not isinstance(spec_filter.get('value'), list):
+            raise ValueError(f"Филтърът '{spec_filter['op']}' по '{spec_filter['column']}' изисква списък!")
+
+    for join in result['joins']:
+        if 'on' not in join or not (join.get('table') or join.get('source')):
+            raise ValueError(f"Невалиден join {join} - нужни са 'on' и 'table' или 'source'")
+        if join.get('how', 'left') not in SPEC_JOIN_TYPES:
+            raise ValueError(f"Невалиден вид join '{join['how']}' - възможни: {', '.join(SPEC_JOIN_TYPES)}")
+    return result
+
+
+def apply_spec_filter(chunk, spec_filter):
+    """Прилага един филтър от спецификацията; стойностите се сравняват като текст"""
+    column = spec_filter['column']
+    if column not in chunk.columns:
+        raise RuntimeError(f"Колона '{column}' от филтъра не е намерена!")
+    text = column_as_text(chunk[column])
+    op = spec_filter['op']
+    value = spec_filter.get('value')
+    if op in ('in', 'not_in'):
+        values = column_as_text(pd.Series(value, dtype=object)).tolist()
+        mask = text.isin(values)
+        return chunk[mask if op == 'in' else ~mask]
+    if op == 'notnull':
+        return chunk[text != '']
+    if op == 'isnull':
+        return chunk[text == '']
+    value = column_as_text(pd.Series([value], dtype=object)).iloc[0]
+    if op == 'eq':
+        return chunk[text == value]
+    if op == 'ne':
+        return chunk[text != value]
+    if op == 'contains':
+        return chunk[text.str.contains(value, regex=False)]
+    return chunk[text.str.startswith(value)]
+
+
+class HashJoin:
+    """
+    Hash join на частите от основната таблица към справочна таблица.
+
+    build() изчита справочната таблица веднъж (на части) и строи хеш индекс
+    по ключа; probe() търси ключовете на цяла част наведнъж
+    (pd.Index.get_indexer) и добавя колоните с префикс. Ключовете се
+    сравняват като текст, така че Long Integer и Text колони се съединяват.
+    При дублиран ключ се взима първият ред; празните ключове не се съединяват.
+    """
+
+    def __init__(self, join, file_path):
+        self.source = join.get('source') or file_path
+        self.table = join.get('table') or DEFAULT_TABLE
+        self.left_on = join['on']
+        self.right_on = join.get('right_on', self.left_on)
+        self.columns = join.get('columns')
+        self.prefix = join.get('prefix', f"{self.table}_")
+        self.how = join.get('how', 'left')
+        self.index = None
+        self.values = None
+
+    def build(self, runner=None, progress=None):
+        if runner is not None and os.path.abspath(runner.file_path) != os.path.abspath(self.source):
+            runner = None
+        parts = []
+        for chunk in iter_source_chunks(self.source, runner=runner, progress=progress, table=self.table):
+            if self.right_on not in chunk.columns:
+                raise RuntimeError(f"Ключът '{self.right_on}' не е намерен в '{self.table}'!")
+            columns = self.columns or [col for col in chunk.columns if col != self.right_on]
+            missing = [col for col in columns if col not in chunk.columns]
+            if missing:
+                raise RuntimeError(f"Колоните {', '.join(missing)} не са намерени в '{self.table}'!")
+            parts.append(chunk[[self.right_on] + list(columns)])
+        if not parts:
+            raise RuntimeError(f"Справочната таблица '{self.table}' е празна!")
+
+        lookup = pd.concat(parts, ignore_index=True)
+        keys = column_as_text(lookup[self.right_on])
+        keep = (keys != '') & ~keys.duplicated()
+        self.index = pd.Index(keys[keep])
+        values = lookup.loc[keep, [col for col in lookup.columns if col != self.right_on]]
+        values.columns = [self.prefix + col for col in values.columns]
+        # Последният ред е празен - към него сочат несъединените ключове
+        self.values = values.reset_index(drop=True).reindex(range(len(values) + 1))
+        return self
+
+    def probe(self, chunk):
+        if self.left_on not in chunk.columns:
+            raise RuntimeError(f"Ключът '{self.left_on}' не е намерен в основната таблица!")
+        positions = self.index.get_indexer(column_as_text(chunk[self.left_on]))
+        if self.how == 'inner':
+            matched = positions >= 0
+            chunk = chunk[matched]
+            positions = positions[matched]
+        else:
+            positions = np.where(positions >= 0, positions, len(self.values) - 1)
+        joined = self.values.iloc[positions]
+        joined.index = chunk.index
+        return pd.concat([chunk, joined], axis=1)
+
+
+def spec_stage(spec, start=None, end=None, joins=(), counter=None):
+    """
+    Етап на конвейера по спецификация: филтър по дата, филтрите по колоните
+    на основната таблица, join-овете, останалите филтри и извличане на
+    колоните като текст.
+    """
+    date_column = spec['date_column']
+    early_filters = []
+    late_filters = list(spec['filters'])
+
+    def stage(chunk):
+        if counter is not None:
+            counter['rows_read'] += len(chunk)
+        if date_column and (start is not None or end is not None):
+            if date_column not in chunk.columns:
+                raise RuntimeError(f"Колона '{date_column}' не е намерена в таблицата!")
+            dates = parse_end_data(chunk[date_column])
+            mask = dates.notna()
+            if start is not None:
+                mask &= dates >= pd.Timestamp(start)
+            if end is not None:
+                mask &= dates < pd.Timestamp(end) + pd.Timedelta(days=1)
+            chunk = chunk[mask]
+
+        # Филтрите по колоните на основната таблица - преди join (по-малко редове за търсене)
+        if not early_filters and late_filters:
+            early_filters.extend(f for f in late_filters if f['column'] in chunk.columns)
+            late_filters[:] = [f for f in late_filters if f not in early_filters]
+        for spec_filter in early_filters:
+            chunk = apply_spec_filter(chunk, spec_filter)
+        for join in joins:
+            chunk = join.probe(chunk)
+        for spec_filter in late_filters:
+            chunk = apply_spec_filter(chunk, spec_filter)
+
+        plan = compile_column_plan(tuple(chunk.columns), tuple(spec['columns']))
+        if counter is not None:
+            counter['missing_columns'] = plan.missing
+        return project_columns(chunk, plan)
+    return stage
+
+
+def encoding_stage(file_path):
+    """Етап: Arrow низове + поправка на кодировката (само за MDB източници)"""
+    if detect_source_type(file_path) == 'mdb':
+        return lambda chunk: fix_dataframe_encoding(use_arrow_strings(chunk))
+    return use_arrow_strings
+
+
+def extract_date_range(file_path, start, end, output_path, chunksize=100000,
+                       runner=None, progress=None, poll=None, spec=None, suppression=None,
+                       history=None, cooldown_days=None, record_history=False, split=None,
+                       validate=None, quarantine_path=None):
+    """
+    Извлича клиентите с End_Data в [start, end] директно в CSV файл
+    (същият формат като 'Запиши CSV') или друг формат по разширението
+    (.xlsx, .json, .ndjson, .parquet) чрез конвейер:
+    mdb-export/четене -> кодировка -> филтри, join-ове и колони -> запис.
+    output_path може да е списък от пътища - тогава всяка част се записва
+    във всички файлове наведнъж (FanOutWriter, по нишка на файл).
+    split ({'max_rows': ..., 'max_bytes': ..., 'partition_by': ...}) разделя
+    всеки изходен файл на номерирани части с манифест (SplitWriter).
+    validate проверява ЕИК (bulst) и мобилния телефон (validate_clients):
+    'flag' добавя колона VALIDATION_COLUMN с причината, 'quarantine'
+    премества невалидните редове с причината в quarantine_path (по
+    подразбиране <изход>_quarantine.csv).
+    spec е спецификация за извличане (виж load_extraction_spec) - таблица,
+    колони, колона с дата, филтри и join-ове към справочни таблици.
+    suppression (SuppressionList) премахва телефоните с отказ от SMS, а
+    history (NotificationHistory) - известените през последните
+    cooldown_days дни; с record_history=True записаните редове се добавят
+    в историята след успешно извличане.
+    Връща статистика с редовете и заетото време на всеки етап.
+    """
+    spec = load_extraction_spec(spec)
+    joins = [HashJoin(join, file_path).build(runner) for join in spec['joins']]
+    counter = {'rows_read': 0, 'missing_columns': (), 'suppressed': 0, 'already_notified': 0,
+               'invalid_rows': 0}
+    if validate not in (None, 'flag', 'quarantine'):
+        raise ValueError(f"Непознат режим на проверка: {validate}")
+    columns = list(spec['columns']) + ([VALIDATION_COLUMN] if validate == 'flag' else [])
+    quarantine = None
+    if validate == 'quarantine':
+        first_output = output_path if isinstance(output_path, str) else output_path[0]
+        quarantine_path = quarantine_path or os.path.splitext(first_output)[0] + '_quarantine.csv'
+        quarantine = open_table_writer(quarantine_path, columns + [VALIDATION_COLUMN])
+    writer = open_table_writers(output_path, columns, split=split)
+    stages = [
+        ('encoding', encoding_stage(file_path)),
+        ('filter', spec_stage(spec, start, end, joins, counter)),
+    ]
+    if validate is not None:
+        def check(chunk):
+            valid, reasons = validate_clients(chunk)
+            counter['invalid_rows'] += int((~valid).sum())
+            if validate == 'flag':
+                return chunk.assign(**{VALIDATION_COLUMN: reasons})
+            if not valid.all():
+                quarantine.write(chunk[~valid].assign(**{VALIDATION_COLUMN: reasons[~valid]}))
+            return chunk[valid]
+        stages.append(('validate', check))
+    if suppression is not None:
+        def suppress(chunk):
+            kept, removed = suppression.anti_join(chunk)
+            counter['suppressed'] += removed
+            return kept
+        stages.append(('suppress', suppress))
+    written_keys = []
+    if history is not None:
+        cooldown = history.DEFAULT_COOLDOWN_DAYS if cooldown_days is None else cooldown_days
+
+        def exclude_notified(chunk):
+            kept, removed = history.exclude_recent(chunk, cooldown)
+            counter['already_notified'] += removed
+            if record_history:
+                written_keys.append(notification_keys(kept))
+            return kept
+        stages.append(('history', exclude_notified))
+    stages.append(('write', writer.write))
+    pipeline = Pipeline(stream_source_chunks(file_path, chunksize, runner, progress, table=spec['table']), stages)
+    try:
+        stage_seconds = pipeline.run(poll)
+    finally:
+        writer.close()
+        if quarantine is not None:
+            quarantine.close()
+    if record_history and written_keys:
+        history.record(np.concatenate(written_keys))
+    return {
+        'rows_read': counter['rows_read'],
+        'rows_written': writer.rows,
+        'missing_columns': list(counter['missing_columns']),
+        'suppressed': counter['suppressed'],
+        'already_notified': counter['already_notified'],
+        'invalid_rows': counter['invalid_rows'],
+        'quarantine_path': quarantine_path if quarantine is not None else None,
+        'stage_seconds': stage_seconds,
+        'writer_seconds': getattr(writer, 'writer_seconds', {}),
+        'parts': {part_writer.manifest_path: part_writer.parts
+                  for part_writer in getattr(writer, 'writers', [writer]) if isinstance(part_writer, SplitWriter)},
+        'wall_seconds': pipeline.wall_seconds,
+    }
+
+
+def export_table(file_path, output_path, chunksize=100000, runner=None, progress=None, poll=None):
+    """Пълен експорт на Kasi_all в CSV с поправена кодировка - също като конвейер"""
+    first = [True]
+
+    def write(chunk):
+        chunk.to_csv(output_path, mode='w' if first[0] else 'a', header=first[0],
+                     index=False, encoding='utf-8')
+        first[0] = False
+        counter['rows'] += len(chunk)
+        counter['columns'] = len(chunk.columns)
+
+    counter = {'rows': 0, 'columns': 0}
+    pipeline = Pipeline(stream_source_chunks(file_path, chunksize, runner, progress), [
+        ('encoding', encoding_stage(file_path)),
+        ('write', write),
+    ])
+    pipeline.run(poll)
+    if first[0]:
+        open(output_path, 'w', encoding='utf-8').close()
+    counter['stage_seconds'] = pipeline.stage_seconds
+    counter['wall_seconds'] = pipeline.wall_seconds
+    return counter
@@ -0,0 +1,462 @@
+"""
+Индекси за търсене: точни стойности (Number, Number_EKA, Phone, bulst) и
+част от име/адрес (триграми).
+"""
+
+from datetime import datetime
+import json
+import os
+
+from .core import PYARROW_AVAILABLE, arrow_text_dtype, column_as_text, np, pa, pc, pd
+from .validation import normalize_phone_numbers
+
+
+class LookupIndex:
+    """
+    Хеш индекси за търсене на клиент/устройство по Number, Number_EKA,
+    Phone и bulst - без филтриране по дати.
+
+    За всяка колона ключовете (нормализиран текст, за Phone - номерът като
+    int64) се хешират до int64 и се пазят като CSR масиви: уникални ключове,
+    отмествания и номера на редове. При отваряне уникалните ключове отиват
+    в pd.Index (хеш таблица), така че търсенето е O(1) + броя намерени
+    редове. Редовете се пазят в Arrow файл, който се отваря с memory map и
+    се четат само намерените (без pyarrow - pickle, зареден в паметта).
+    Манифестът пази отпечатъка на източника, както при PartitionStore.
+    """
+
+    MANIFEST_NAME = '_lookup.json'
+    INDEX_NAME = 'index.npz'
+    BATCH_ROWS = 65536
+    COLUMNS = ('Number', 'Number_EKA', 'Phone', 'bulst')
+    # Проверка, че хешът на pandas е същият като при изграждането
+    HASH_PROBE = 'Kasi_all'
+
+    def __init__(self, root):
+        self.root = root
+        self.manifest = None
+        self._arrays = None
+        self._indexes = {}
+        self._rows = None
+        self._batch_starts = None
+        manifest_path = os.path.join(root, self.MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+
+    @staticmethod
+    def default_root(source_path):
+        return os.path.splitext(source_path)[0] + '_lookup'
+
+    @classmethod
+    def for_source(cls, source_path):
+        return cls(cls.default_root(source_path))
+
+    def is_current(self, fingerprint):
+        if not self.manifest or self.manifest.get('hash_probe') != self._hash_probe():
+            return False
+        size, mtime_ns = self.manifest['source'][1:]
+        return size == fingerprint[1] and mtime_ns == fingerprint[2]
+
+    @property
+    def total_rows(self):
+        return self.manifest['total_rows'] if self.manifest else 0
+
+    @classmethod
+    def _hash_probe(cls):
+        return str(cls.key_hashes('Number_EKA', pd.Series([cls.HASH_PROBE]))[0])
+
+    @staticmethod
+    def normalized_keys(column, values):
+        """Нормализираните ключове: за Phone - номерът като int64 (-1 невалиден), иначе текст strip().upper()"""
+        if column == 'Phone':
+            return normalize_phone_numbers(values)
+        return column_as_text(pd.Series(values)).str.strip().str.upper().to_numpy(dtype=object)
+
+    @classmethod
+    def key_hashes(cls, column, values):
+        """int64 ключове на стойностите; -1 за празни/невалидни"""
+        keys = cls.normalized_keys(column, values)
+        if column == 'Phone':
+            return keys
+        hashes = pd.util.hash_array(keys).view(np.int64)
+        return np.where(keys == '', -1, hashes)
+
+    @classmethod
+    def build(cls, df, root, fingerprint):
+        """Записва редовете и индексите по COLUMNS и връща новия индекс"""
+        os.makedirs(root, exist_ok=True)
+        data = df.drop(columns=['End_Data_parsed'], errors='ignore').reset_index(drop=True)
+
+        if PYARROW_AVAILABLE:
+            rows_name = 'rows.arrow'
+            table = pa.Table.from_pandas(data, preserve_index=False)
+            with pa.OSFile(os.path.join(root, rows_name), 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table, max_chunksize=cls.BATCH_ROWS)
+        else:
+            rows_name = 'rows.pkl'
+            data.to_pickle(os.path.join(root, rows_name))
+
+        arrays = {}
+        columns = [col for col in cls.COLUMNS if col in data.columns]
+        for col in columns:
+            keys = cls.key_hashes(col, data[col])
+            positions = np.flatnonzero(keys != -1)
+            order = np.argsort(keys[positions], kind='stable')
+            sorted_keys = keys[positions][order]
+            unique_keys, starts = np.unique(sorted_keys, return_index=True)
+            arrays[f'{col}_keys'] = unique_keys
+            arrays[f'{col}_offsets'] = np.append(starts, len(sorted_keys)).astype(np.int64)
+            arrays[f'{col}_rows'] = positions[order].astype(np.int64)
+        np.savez(os.path.join(root, cls.INDEX_NAME), **arrays)
+
+        manifest = {
+            'source': list(fingerprint),
+            'columns': columns,
+            'rows_file': rows_name,
+            'total_rows': len(data),
+            'hash_probe': cls._hash_probe(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+        }
+        temp_manifest = os.path.join(root, cls.MANIFEST_NAME + '.tmp')
+        with open(temp_manifest, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_manifest, os.path.join(root, cls.MANIFEST_NAME))
+        return cls(root)
+
+    def _index(self, column):
+        if self._arrays is None:
+            with np.load(os.path.join(self.root, self.INDEX_NAME)) as data:
+                self._arrays = {name: data[name] for name in data.files}
+        if column not in self._indexes:
+            self._indexes[column] = pd.Index(self._arrays[f'{column}_keys'])
+        return self._indexes[column]
+
+    def take(self, positions):
+        """Чете само редовете на positions - от Arrow файла само партидите, в които попадат"""
+        rows_path = os.path.join(self.root, self.manifest['rows_file'])
+        if self._rows is None:
+            if self.manifest['rows_file'].endswith('.arrow'):
+                self._rows = pa.ipc.open_file(pa.memory_map(rows_path, 'r'))
+            else:
+                self._rows = pd.read_pickle(rows_path)
+        if isinstance(self._rows, pd.DataFrame):
+            result = self._rows.iloc[positions]
+        else:
+            if self._batch_starts is None:
+                # Партидите не са задължително по BATCH_ROWS реда (напр. колони на парчета след pd.concat)
+                lengths = [self._rows.get_batch(i).num_rows for i in range(self._rows.num_record_batches)]
+                self._batch_starts = np.cumsum([0] + lengths)
+            batch_ids = np.searchsorted(self._batch_starts, positions, side='right') - 1
+            offsets = positions - self._batch_starts[batch_ids]
+            batches = [self._rows.get_batch(int(batch_id)).take(pa.array(offsets[batch_ids == batch_id]))
+                       for batch_id in np.unique(batch_ids)]
+            table = pa.Table.from_batches(batches, schema=self._rows.schema)
+            result = table.to_pandas()
+        result.index = positions
+        return result
+
+    def lookup_positions(self, column, value):
+        """Номерата на редовете (от източника) със стойност value в колоната"""
+        if column not in self.manifest['columns']:
+            return np.empty(0, dtype=np.int64)
+        key = self.key_hashes(column, pd.Series([value], dtype=object))[0]
+        if key == -1:
+            return np.empty(0, dtype=np.int64)
+        slot = self._index(column).get_indexer([key])[0]
+        if slot < 0:
+            return np.empty(0, dtype=np.int64)
+        offsets = self._arrays[f'{column}_offsets']
+        return self._arrays[f'{column}_rows'][offsets[slot]:offsets[slot + 1]]
+
+    def lookup(self, column, value):
+        """Редовете със стойност value в колоната (проверени - без съвпадения по хеш)"""
+        positions = np.sort(self.lookup_positions(column, value))
+        rows = self.take(positions)
+        if len(rows):
+            # Сравняват се самите нормализирани стойности - различни ключове с еднакъв хеш отпадат
+            expected = self.normalized_keys(column, pd.Series([value], dtype=object))[0]
+            rows = rows[self.normalized_keys(column, rows[column]) == expected]
+        return rows
+
+    def search(self, value, columns=None):
+        """Търси стойността във всички индексирани колони; колона 'Намерено_в' показва къде"""
+        frames = []
+        for column in columns or self.manifest['columns']:
+            rows = self.lookup(column, value)
+            if len(rows):
+                frames.append(rows.assign(Намерено_в=column))
+        if not frames:
+            return pd.DataFrame(columns=['Намерено_в'])
+        result = pd.concat(frames)
+        return result[~result.index.duplicated()].sort_index()
+
+
+class TrigramIndex:
+    """
+    Индекс от триграми за търсене по част от Ime_Obekt, Ime_Firma и Adres_Obekt.
+
+    Индексират се уникалните (нормализирани) стойности на трите колони, а не
+    редовете - имената на фирми се повтарят много. Всеки знак се кодира с
+    малък номер от азбуката на данните, триграмата е число, а за всяка
+    триграма се пази подреденият списък от стойности, които я съдържат (CSR).
+    Заявката сечe списъците на своите триграми (от най-краткия), проверява
+    кандидатите с търсене на подниз и ги подрежда: съвпадение в началото,
+    после в началото на дума, после по-къси стойности и повече редове.
+    Файловете стоят в директорията на LookupIndex (същата снимка на данните).
+    """
+
+    MANIFEST_NAME = '_trigrams.json'
+    INDEX_NAME = 'trigrams.npz'
+    STRINGS_NAME = 'trigram_values.pkl'
+    COLUMNS = ('Ime_Obekt', 'Ime_Firma', 'Adres_Obekt')
+    # Разделител между стойностите при кодиране (не се среща в нормализиран текст)
+    SEPARATOR = '\n'
+    # Пунктуацията става интервал, за да се намират и думите след "ЕТ-", "(" или кавички.
+    # Изброена е изрично: \W в Arrow (RE2) е само ASCII и би изтрил кирилицата
+    PUNCTUATION_RE = r'[\s!-/:-@\[-`{-~„“”«»‘’–—№]+'
+    # Версия на нормализацията - индекс от друга версия се изгражда наново
+    FORMAT_VERSION = 2
+
+    def __init__(self, root):
+        self.root = root
+        self.manifest = None
+        self._arrays = None
+        self._values = None
+        self._keys = None
+        manifest_path = os.path.join(root, self.MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+
+    @staticmethod
+    def default_root(source_path):
+        return LookupIndex.default_root(source_path)
+
+    @classmethod
+    def for_source(cls, source_path):
+        return cls(cls.default_root(source_path))
+
+    def is_current(self, fingerprint):
+        if not self.manifest or self.manifest.get('version') != self.FORMAT_VERSION:
+            return False
+        size, mtime_ns = self.manifest['source'][1:]
+        return size == fingerprint[1] and mtime_ns == fingerprint[2]
+
+    @classmethod
+    def normalize(cls, values):
+        """Главни букви, пунктуацията - интервал, единични интервали - за индекса и за заявките"""
+        text = column_as_text(pd.Series(values))
+        return text.str.upper().str.replace(cls.PUNCTUATION_RE, ' ', regex=True).str.strip()
+
+    @staticmethod
+    def _codepoints(text):
+        return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+
+    @staticmethod
+    def _trigram_codes(symbols, size):
+        """Кодовете на всички триграми в масив от номера на знаци"""
+        symbols = symbols.astype(np.int64)
+        return (symbols[:-2] * size + symbols[1:-1]) * size + symbols[2:]
+
+    @classmethod
+    def build(cls, df, root, fingerprint):
+        """Изгражда индекса по наличните от COLUMNS колони и връща новия индекс"""
+        os.makedirs(root, exist_ok=True)
+        columns = [col for col in cls.COLUMNS if col in df.columns]
+
+        value_frames, row_codes = [], []
+        offset = 0
+        for column_id, col in enumerate(columns):
+            normalized = cls.normalize(df[col].reset_index(drop=True))
+            codes, uniques = pd.factorize(normalized)
+            # Показваме първата срещната оригинална стойност за всяка нормализирана
+            first_rows = pd.Series(np.arange(len(codes))).groupby(codes).first()
+            first_rows = first_rows[first_rows.index >= 0]
+            value_frames.append(pd.DataFrame({
+                'column': column_id,
+                'key': pd.Series(uniques, dtype=object),
+                'display': column_as_text(df[col].iloc[first_rows.to_numpy()]).to_numpy(dtype=object),
+            }))
+            # Празните стойности остават в списъка, но не сочат към редове
+            valid = np.asarray(uniques != '', dtype=bool)
+            row_codes.append(np.where(valid[codes], codes + offset, -1))
+            offset += len(uniques)
+        values = pd.concat(value_frames, ignore_index=True) if value_frames else \
+            pd.DataFrame(columns=['column', 'key', 'display'])
+        all_codes = np.concatenate(row_codes) if row_codes else np.empty(0, dtype=np.int64)
+        all_rows = np.tile(np.arange(len(df), dtype=np.int64), len(columns))
+        keep = all_codes >= 0
+        all_codes, all_rows = all_codes[keep], all_rows[keep]
+
+        # Номерираме стойностите по (дължина, -редове): в рамките на едно ниво на
+        # съвпадение кандидатите са подредени още с номерата си и търсенето не сортира
+        lengths = values['key'].str.len().to_numpy(dtype=np.int64)
+        counts = np.bincount(all_codes, minlength=len(values))
+        ranking = np.lexsort((-counts, lengths))
+        renumber = np.empty(len(values), dtype=np.int64)
+        renumber[ranking] = np.arange(len(values))
+        values = values.iloc[ranking].reset_index(drop=True)
+        lengths = lengths[ranking]
+        all_codes = renumber[all_codes]
+
+        # Стойност -> редове (CSR, редовете по ред във файла)
+        order = np.argsort(all_codes, kind='stable')
+        value_rows = all_rows[order]
+        value_offsets = np.searchsorted(all_codes[order], np.arange(len(values) + 1)).astype(np.int64)
+
+        # Всички стойности в един низ -> номера на знаци -> триграми. Пред всяка
+        # стойност има интервал, така че ' XY' намира думите, започващи с XY
+        joined = ''.join(cls.SEPARATOR + ' ' + values['key']) + cls.SEPARATOR
+        points = cls._codepoints(joined)
+        alphabet = np.flatnonzero(np.bincount(points)).astype(np.uint32)
+        symbol_of = np.zeros(int(alphabet[-1]) + 1, dtype=np.int64)
+        symbol_of[alphabet] = np.arange(len(alphabet))
+        symbols = symbol_of[points]
+        size = len(alphabet)
+        value_ids = np.repeat(np.arange(len(values) + 1, dtype=np.int64), np.append(lengths + 2, 1))
+        if len(points) >= 3:
+            separator = np.searchsorted(alphabet, ord(cls.SEPARATOR))
+            is_separator = symbols == separator
+            trigram_ok = ~(is_separator[:-2] | is_separator[1:-1] | is_separator[2:])
+            trigrams = cls._trigram_codes(symbols, size)[trigram_ok]
+            owners = value_ids[:-2][trigram_ok]
+        else:
+            trigrams = owners = np.empty(0, dtype=np.int64)
+
+        # Уникални двойки (триграма, стойност) като едно число, подредени по триграма
+        pairs = np.sort(trigrams * max(len(values), 1) + owners)
+        pairs = pairs[np.append(True, pairs[1:] != pairs[:-1])] if len(pairs) else pairs
+        pair_trigrams, pair_values = np.divmod(pairs, max(len(values), 1))
+        trigram_starts = np.flatnonzero(np.append(True, pair_trigrams[1:] != pair_trigrams[:-1])) \
+            if len(pairs) else np.empty(0, dtype=np.int64)
+        trigram_keys = pair_trigrams[trigram_starts]
+
+        np.savez(os.path.join(root, cls.INDEX_NAME),
+                 alphabet=alphabet,
+                 trigram_keys=trigram_keys,
+                 trigram_offsets=np.append(trigram_starts, len(pairs)).astype(np.int64),
+                 trigram_values=pair_values.astype(np.int64),
+                 value_offsets=value_offsets,
+                 value_rows=value_rows)
+        values.to_pickle(os.path.join(root, cls.STRINGS_NAME))
+
+        manifest = {
+            'version': cls.FORMAT_VERSION,
+            'source': list(fingerprint),
+            'columns': columns,
+            'values': len(values),
+            'trigrams': len(trigram_keys),
+            'created': datetime.now().isoformat(timespec='seconds'),
+        }
+        temp_manifest = os.path.join(root, cls.MANIFEST_NAME + '.tmp')
+        with open(temp_manifest, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_manifest, os.path.join(root, cls.MANIFEST_NAME))
+        return cls(root)
+
+    def load(self):
+        """Зарежда масивите в паметта (еднократно) - следващите търсения са без I/O"""
+        if self._arrays is None:
+            with np.load(os.path.join(self.root, self.INDEX_NAME)) as data:
+                self._arrays = {name: data[name] for name in data.files}
+            self._values = pd.read_pickle(os.path.join(self.root, self.STRINGS_NAME))
+            self._values['key'] = self._values['key'].astype(arrow_text_dtype())
+            if PYARROW_AVAILABLE:
+                self._keys = pa.chunked_array(pa.array(self._values['key'])).combine_chunks()
+            else:
+                self._keys = self._values['key']
+        return self
+
+    def _candidates(self, query):
+        """Номерата на стойностите, съдържащи всички триграми на заявката"""
+        arrays = self._arrays
+        alphabet = arrays['alphabet']
+        points = self._codepoints(query)
+        symbols = np.searchsorted(alphabet, points)
+        if (symbols >= len(alphabet)).any() or (alphabet[np.minimum(symbols, len(alphabet) - 1)] != points).any():
+            return np.empty(0, dtype=np.int64)
+
+        trigrams = np.unique(self._trigram_codes(symbols, len(alphabet)))
+        keys = arrays['trigram_keys']
+        slots = np.searchsorted(keys, trigrams)
+        if (slots >= len(keys)).any() or (keys[np.minimum(slots, len(keys) - 1)] != trigrams).any():
+            return np.empty(0, dtype=np.int64)
+
+        offsets = arrays['trigram_offsets']
+        postings = sorted((arrays['trigram_values'][offsets[slot]:offsets[slot + 1]] for slot in slots), key=len)
+        result = postings[0]
+        for posting in postings[1:]:
+            if len(result) == 0:
+                break
+            # Двоично търсене на (малкото) кандидати в по-дългия списък
+            slots = np.minimum(np.searchsorted(posting, result), len(posting) - 1)
+            result = result[posting[slots] == result]
+        return result
+
+    def search(self, query, limit=50):
+        """
+        Връща до limit стойности, съдържащи query, подредени по значимост:
+        DataFrame с колони value_id, Колона, Стойност, Редове.
+        """
+        self.load()
+        query = self.normalize([query]).iloc[0]
+        values = self._values
+        if not query:
+            candidates = np.empty(0, dtype=np.int64)
+        elif len(query) == 1:
+            # Един знак няма триграма - проверяваме всички стойности
+            candidates = None
+        elif len(query) == 2:
+            # Две букви търсим в началото на думите
+            candidates = self._candidates(' ' + query)
+        else:
+            candidates = self._candidates(query)
+
+        # Кандидатите са във възходящ ред = по дължина и брой редове; остава
+        # само нивото на съвпадение: в началото, в началото на дума, другаде
+        picked = np.concatenate(self._ranked(candidates, query, limit))[:limit]
+
+        offsets = self._arrays['value_offsets']
+        columns = self.manifest['columns']
+        return pd.DataFrame({
+            'value_id': picked,
+            'Колона': [columns[c] for c in values['column'].to_numpy()[picked]],
+            'Стойност': values['display'].iloc[picked].to_numpy(dtype=object),
+            'Редове': offsets[picked + 1] - offsets[picked],
+        })
+
+    def _ranked(self, candidates, query, limit):
+        """Кандидатите, съдържащи query, разделени по нива; спира щом има limit"""
+        if candidates is None:
+            candidates = np.arange(len(self._values), dtype=np.int64)
+            keys = self._keys
+        elif isinstance(self._keys, pd.Series):
+            keys = self._keys.iloc[candidates]
+        else:
+            keys = self._keys.take(pa.array(candidates, type=pa.int64()))
+
+        if isinstance(keys, pd.Series):
+            contains = keys.str.contains(query, regex=False).to_numpy(dtype=bool)
+            candidates, keys = candidates[contains], keys[contains]
+            prefix = keys.str.startswith(query).to_numpy(dtype=bool)
+            word_start = lambda: keys.str.contains(' ' + query, regex=False).to_numpy(dtype=bool)
+        else:
+            # Arrow compute - без минаване през Python низове
+            contains = pc.match_substring(keys, query)
+            candidates = candidates[contains.to_numpy(zero_copy_only=False)]
+            keys = keys.filter(contains)
+            prefix = pc.starts_with(keys, query).to_numpy(zero_copy_only=False)
+            word_start = lambda: pc.match_substring(keys, ' ' + query).to_numpy(zero_copy_only=False)
+
+        tiers = [candidates[prefix]]
+        if len(tiers[0]) < limit:
+            word = word_start() & ~prefix
+            tiers += [candidates[word], candidates[~(prefix | word)]]
+        return tiers
+
+    def rows_for(self, value_id):
+        """Номерата на редовете (от източника) със стойността value_id"""
+        offsets = self._arrays['value_offsets']
+        return self._arrays['value_rows'][offsets[value_id]:offsets[value_id + 1]]
@@ -0,0 +1,180 @@
+"""
+SMS текстове по шаблон, брой сегменти и id-та на съобщенията.
+"""
+
+import hashlib
+import math
+import string
+import re
+
+from .core import column_as_text, np, parse_end_data, pd
+
+
+DEFAULT_SMS_TEMPLATE = ("Уважаеми клиенти, срокът на фискалното устройство {Number_EKA} "
+                        "в {Ime_Obekt} изтича на {End_Data:%d.%m.%Y}.")
+
+# GSM 03.38 - основна таблица и разширение (символите от разширението заемат 2 септета)
+GSM7_BASIC_CHARS = ("@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+                    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà")
+GSM7_EXTENSION_CHARS = "^{}\\[~]|€\f"
+
+_GSM7_ONLY_RE = '[' + ''.join(re.escape(c) for c in GSM7_BASIC_CHARS + GSM7_EXTENSION_CHARS) + ']*'
+_GSM7_EXTENSION_RE = '[' + ''.join(re.escape(c) for c in GSM7_EXTENSION_CHARS) + ']'
+_ASTRAL_RE = '[\U00010000-\U0010FFFF]'
+
+
+class MessageTemplate:
+    """
+    Шаблон на SMS текст, компилиран веднъж и прилаган към цяла колона.
+
+    Синтаксисът е като str.format: {Ime_Obekt}, {Number_EKA}. Ако след
+    двоеточието има формат за дата, стойността се парсва като End_Data и се
+    форматира: {End_Data:%d.%m.%Y}. Другите формати и !r/!s/!a се прилагат
+    към текста на стойността както в str.format ({Number:>5}); формат, който
+    не е за текст (напр. {Number:.2f}), е грешка още при компилирането.
+    Рендирането е конкатенация на колони (без цикъл по редове, освен за
+    полетата с такъв формат), а броят SMS части се смята векторно.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.parts = []     # (литерал, поле, формат, преобразуване)
+        formatter = string.Formatter()
+        for literal, field, format_spec, conversion in formatter.parse(text):
+            format_spec = format_spec or ''
+            if field is not None:
+                self._check_field(formatter, field, format_spec, conversion)
+            self.parts.append((literal, field, format_spec, conversion))
+        self.fields = [field for _, field, _, _ in self.parts if field]
+
+    @staticmethod
+    def _check_field(formatter, field, format_spec, conversion):
+        """ValueError за поле, което не може да се рендира (номер вместо колона, грешен формат)"""
+        if not field or field.isdigit():
+            raise ValueError(f"Полетата в шаблона са имена на колони, а не {{{field}}}")
+        if format_spec.startswith('%'):
+            if conversion:
+                raise ValueError(f"Формат за дата не може да се комбинира с !{conversion}: {{{field}}}")
+            return
+        try:
+            format(formatter.convert_field('', conversion), format_spec)
+        except ValueError as e:
+            raise ValueError(f"Невалиден формат за {{{field}}} (стойностите са текст): {e}") from None
+
+    def missing_fields(self, columns):
+        return [field for field in self.fields if field not in columns]
+
+    def _field_values(self, df, field, format_spec, conversion):
+        if format_spec.startswith('%'):
+            parsed = parse_end_data(df[field])
+            return parsed.dt.strftime(format_spec).fillna('')
+        values = column_as_text(df[field])
+        if not format_spec and not conversion:
+            return values
+        formatter = string.Formatter()
+        return values.map(lambda value: format(formatter.convert_field(value, conversion), format_spec))
+
+    def render(self, df):
+        """Връща Series с текста на съобщението за всеки ред"""
+        missing = self.missing_fields(df.columns)
+        if missing:
+            raise KeyError(f"Шаблонът използва липсващи колони: {', '.join(missing)}")
+
+        result = pd.Series([''] * len(df), index=df.index, dtype=str)
+        for literal, field, format_spec, conversion in self.parts:
+            if literal:
+                result = result + literal
+            if field:
+                result = result + self._field_values(df, field, format_spec, conversion)
+        return result
+
+    @staticmethod
+    def segment_info(messages):
+        """
+        Векторно изчислява кодировката (GSM-7/UCS-2) и броя SMS части.
+        GSM-7: до 160 знака в едно SMS, иначе части по 153.
+        UCS-2 (напр. кирилица): до 70 знака, иначе части по 67.
+        """
+        messages = messages.astype(str)
+        is_gsm7 = messages.str.fullmatch(_GSM7_ONLY_RE)
+        gsm_length = messages.str.len() + messages.str.count(_GSM7_EXTENSION_RE)
+        ucs2_length = messages.str.len() + messages.str.count(_ASTRAL_RE)
+
+        length = gsm_length.where(is_gsm7, ucs2_length)
+        single_limit = np.where(is_gsm7, 160, 70)
+        part_limit = np.where(is_gsm7, 153, 67)
+        segments = np.where(length <= single_limit, 1, np.ceil(length / part_limit)).astype(int)
+        segments = np.where(length == 0, 0, segments)
+
+        return pd.DataFrame({
+            'encoding': np.where(is_gsm7, 'GSM-7', 'UCS-2'),
+            'length': length.astype(int),
+            'segments': segments,
+        }, index=messages.index)
+
+
+def estimate_sms_cost(segment_info, price_per_segment=0.0, rate=None):
+    """Оценка на обема, цената и времето за изпращане"""
+    total_segments = int(segment_info['segments'].sum())
+    estimate = {
+        'messages': len(segment_info),
+        'segments': total_segments,
+        'ucs2_messages': int((segment_info['encoding'] == 'UCS-2').sum()),
+        'multipart_messages': int((segment_info['segments'] > 1).sum()),
+        'cost': total_segments * price_per_segment,
+    }
+    if rate:
+        estimate['seconds'] = math.ceil(len(segment_info) / rate)
+    return estimate
+
+
+# Колоните, които определят едно известие (клиент, устройство, крайна дата)
+NOTIFICATION_KEY_COLUMNS = ('Phone', 'Number_EKA', 'End_Data')
+
+
+def message_ids(df):
+    """Стабилни id на известията - същият клиент/устройство/дата дава същия id"""
+    keys = None
+    for col in NOTIFICATION_KEY_COLUMNS:
+        values = column_as_text(df[col]) if col in df.columns else pd.Series('', index=df.index)
+        keys = values if keys is None else keys + '|' + values
+    return [hashlib.sha1(key.encode('utf-8')).hexdigest() for key in keys]
+
+
+def history_keys(ids):
+    """int64 ключове за историята - първите 8 байта от sha1 id-тата на съобщенията"""
+    return np.array([int(message_id[:16], 16) for message_id in ids], dtype=np.uint64).view(np.int64)
+
+
+def notification_keys(df):
+    """Същите ключове като history_keys(message_ids(df)), но направо от sha1 байтовете"""
+    keys = None
+    for col in NOTIFICATION_KEY_COLUMNS:
+        values = column_as_text(df[col]) if col in df.columns else pd.Series('', index=df.index)
+        keys = values if keys is None else keys + '|' + values
+    digests = b''.join([hashlib.sha1(key.encode('utf-8')).digest()[:8] for key in keys])
+    return np.frombuffer(digests, dtype='>i8').astype(np.int64)
+
+
+def render_messages(df, template):
+    """Рендира шаблона за всички редове - DataFrame с id, Phone, text, encoding, segments"""
+    if not isinstance(template, MessageTemplate):
+        template = MessageTemplate(template)
+    texts = template.render(df)
+    info = MessageTemplate.segment_info(texts)
+    phones = column_as_text(df['Phone']).str.replace(' ', '', regex=False)
+    return pd.DataFrame({
+        'id': message_ids(df),
+        'Phone': phones,
+        'text': texts,
+        'encoding': info['encoding'],
+        'segments': info['segments'],
+    }, index=df.index)
+
+
+def build_messages(df, template):
+    """Подготвя съобщенията {'id', 'to', 'text'} от извлечените редове"""
+    rendered = render_messages(df, template)
+    rendered = rendered[rendered['Phone'] != '']
+    return [{'id': message_id, 'to': phone, 'text': text}
+            for message_id, phone, text in zip(rendered['id'], rendered['Phone'], rendered['text'])]
@@ -0,0 +1,129 @@
+"""
+Конвейер от етапи в отделни нишки, свързани с ограничени опашки.
+"""
+
+import threading
+import queue
+import time
+
+from .sources import OperationCancelled
+
+
+class PipelineStopped(Exception):
+    """Етапът е спрян, защото друг етап на конвейера е завършил с грешка"""
+
+
+class Pipeline:
+    """
+    Конвейер от етапи, свързани с ограничени опашки.
+
+    Източникът (итерируем обект, напр. stream_source_chunks) и всеки етап
+    работят в собствена нишка, така че експортът, поправката на кодировката,
+    филтрирането и записът на различни части вървят едновременно - общото
+    време клони към най-бавния етап, а не към сбора им. Опашките са с размер
+    maxsize, затова бърз етап изчаква бавния и паметта е ограничена до
+    няколко части. Етапите са нишки: тежката работа (pandas парсер,
+    pyarrow, запис) освобождава GIL.
+
+    Етап е (име, функция); функцията получава част и връща следващата или
+    None, за да я пропусне. Първата грешка спира всички етапи и се хвърля
+    от run(). stage_seconds съдържа заетото време на всеки етап.
+    """
+
+    _END = object()
+
+    def __init__(self, source, stages, maxsize=4):
+        self.source = source
+        self.stages = list(stages)
+        self.maxsize = maxsize
+        self.stage_seconds = {}
+        self.wall_seconds = 0.0
+        self._stop = threading.Event()
+        self._errors = []
+
+    def _put(self, target, item):
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise PipelineStopped()
+
+    def _get(self, source):
+        while True:
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    raise PipelineStopped()
+
+    def _fail(self, error):
+        if not isinstance(error, PipelineStopped):
+            self._errors.append(error)
+        self._stop.set()
+
+    def _run_source(self, output):
+        busy = 0.0
+        iterator = iter(self.source)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    busy += time.perf_counter() - started
+                self._put(output, item)
+            self._put(output, self._END)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+            self.stage_seconds['source'] = busy
+
+    def _run_stage(self, name, function, source, output):
+        busy = 0.0
+        try:
+            while True:
+                item = self._get(source)
+                if item is self._END:
+                    break
+                started = time.perf_counter()
+                result = function(item)
+                busy += time.perf_counter() - started
+                if result is not None and output is not None:
+                    self._put(output, result)
+            if output is not None:
+                self._put(output, self._END)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self.stage_seconds[name] = busy
+
+    def cancel(self):
+        """Спира всички етапи; run() хвърля OperationCancelled"""
+        self._fail(OperationCancelled())
+
+    def run(self, poll=None):
+        """Изпълнява конвейера докрай; poll() се вика периодично (напр. за GUI)"""
+        started = time.perf_counter()
+        queues = [queue.Queue(maxsize=self.maxsize) for _ in self.stages]
+        workers = [threading.Thread(target=self._run_source, args=(queues[0],), daemon=True)]
+        for index, (name, function) in enumerate(self.stages):
+            output = queues[index + 1] if index + 1 < len(queues) else None
+            workers.append(threading.Thread(target=self._run_stage, daemon=True,
+                                            args=(name, function, queues[index], output)))
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            while worker.is_alive():
+                if poll is not None:
+                    poll()
+                worker.join(0.05)
+        self.wall_seconds = time.perf_counter() - started
+        if self._errors:
+            raise self._errors[0]
+        return self.stage_seconds
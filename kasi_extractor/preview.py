@@ -0,0 +1,108 @@
+"""
+Източник на редове по страници за преглед на големи резултати.
+"""
+
+from collections import OrderedDict
+
+from .core import PYARROW_AVAILABLE, column_as_text, np, pa, parse_end_data, pd
+
+
+class GridSource:
+    """
+    Редовете на DataFrame за VirtualGrid - по страници и без копиране.
+
+    Данните остават в колоните си; сортирането пази само пермутация на
+    номерата (int64), а текстът се прави само за поисканите страници,
+    които се кешират (LRU) до MAX_PAGES.
+    """
+
+    PAGE_ROWS = 256
+    MAX_PAGES = 16
+
+    def __init__(self, df):
+        self.df = df
+        self.columns = [str(col) for col in df.columns]
+        self.order = None
+        self.sort_column = None
+        self.descending = False
+        self._pages = OrderedDict()
+        self._sort_codes = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    def _page(self, page_no):
+        page = self._pages.get(page_no)
+        if page is None:
+            start = page_no * self.PAGE_ROWS
+            stop = min(start + self.PAGE_ROWS, len(self.df))
+            if self.order is None:
+                # Без сортиране страницата е изрязване - без копиране
+                positions = slice(start, stop)
+                chunk = self.df.iloc[positions]
+                texts = [column_as_text(chunk[col]).to_numpy(dtype=object) for col in chunk.columns]
+            else:
+                positions = self.order[start:stop]
+                texts = [self._take_text(self.df.iloc[:, i], positions) for i in range(len(self.columns))]
+            labels = self.df.index[positions].to_numpy()
+            page = (labels, list(zip(*texts)) if texts else [()] * len(labels))
+            self._pages[page_no] = page
+            if len(self._pages) > self.MAX_PAGES:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(page_no)
+        return page
+
+    @staticmethod
+    def _take_text(series, positions):
+        """
+        Текстът на редовете positions от колоната. Arrow колоните от няколко
+        части (след concat) се четат по части - take върху целия ChunkedArray
+        би слепил всички части при всяка страница.
+        """
+        if PYARROW_AVAILABLE and isinstance(series.dtype, pd.StringDtype) and series.dtype.storage == 'pyarrow':
+            chunked = pa.chunked_array(pa.array(series.array))
+            if chunked.num_chunks > 1:
+                bounds = np.cumsum([0] + [len(chunk) for chunk in chunked.chunks])
+                chunk_ids = np.searchsorted(bounds, positions, side='right') - 1
+                texts = np.empty(len(positions), dtype=object)
+                for chunk_id in np.unique(chunk_ids):
+                    mask = chunk_ids == chunk_id
+                    taken = chunked.chunk(int(chunk_id)).take(pa.array(positions[mask] - bounds[chunk_id]))
+                    texts[mask] = taken.fill_null('').to_numpy(zero_copy_only=False)
+                return column_as_text(pd.Series(texts)).to_numpy(dtype=object)
+        return column_as_text(series.iloc[positions]).to_numpy(dtype=object)
+
+    def rows(self, start, count):
+        """[(етикет на реда, стойности като текст)] за редовете start..start+count"""
+        result = []
+        stop = min(start + count, len(self.df))
+        while start < stop:
+            page_no, offset = divmod(start, self.PAGE_ROWS)
+            labels, values = self._page(page_no)
+            take = min(stop - start, self.PAGE_ROWS - offset)
+            result.extend(zip(labels[offset:offset + take], values[offset:offset + take]))
+            start += take
+        return result
+
+    def _codes(self, column):
+        """Кодове за сортиране на колоната и кодът на липсващите (най-големият)"""
+        cached = self._sort_codes.get(column)
+        if cached is None:
+            values = self.df[column]
+            if column == 'End_Data':
+                values = parse_end_data(values)
+            codes, uniques = pd.factorize(values, sort=True)
+            cached = (np.where(codes < 0, len(uniques), codes), len(uniques))
+            self._sort_codes[column] = cached
+        return cached
+
+    def sort_by(self, column, descending=False):
+        """Подрежда по колоната (стабилно); повторното сортиране не чете данните отново"""
+        codes, missing = self._codes(column)
+        if descending:
+            # Обръщаме реда, но липсващите остават накрая
+            codes = np.where(codes == missing, missing, -codes)
+        self.order = np.argsort(codes, kind='stable')
+        self.sort_column, self.descending = column, descending
+        self._pages.clear()
@@ -0,0 +1,288 @@
+"""
+Профил на качеството на данните с едно минаване и отчет в JSON/HTML.
+"""
+
+from datetime import datetime
+from collections import OrderedDict
+import json
+import html
+import os
+import math
+
+from .core import (DEFAULT_TABLE, HASH_MIX_1, PANDAS_AVAILABLE, is_text_column, mix64, np, pa, parse_end_data,
+                   pc, pd)
+from .sources import stream_source_chunks
+from .pipeline import Pipeline
+from .validation import valid_eik, valid_mobile_phones
+from .extraction import encoding_stage
+
+
+class HyperLogLog:
+    """
+    Приблизителен брой различни стойности в постоянна памет: 2**precision
+    еднобайтови регистъра (16 KB при 14, грешка около 0.8%). Добавянето на
+    вече видяна стойност не променя нищо, затова е достатъчно да се подават
+    различните стойности на всяка част.
+    """
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(hashes) == 0:
+            return
+        rest_bits = 64 - self.precision
+        index = (hashes >> np.uint64(rest_bits)).astype(np.intp)
+        rest = hashes & np.uint64((1 << rest_bits) - 1)
+        # Позицията на първата единица: frexp дава точно дължината в битове
+        # (rest < 2**53 се представя точно като float64), 0 дава 0
+        _, bit_length = np.frexp(rest.astype(np.float64))
+        rank = (rest_bits + 1 - bit_length).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Малки бройки - линейно броене по празните регистри
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+# Остатъци от неуспешна поправка на кодировката: Latin-1 букви (Ð, Ñ, ...),
+# знакът за заместване и двойно прекодиран UTF-8 ("Рђ", "РЎ", "С„", ...)
+_MOJIBAKE_RE = ('[\u00c0-\u00ff\ufffd]|'
+                '[РС][\u0402-\u040f\u0452-\u045f\u00a0-\u00bf\u2018-\u203a\u2116]')
+
+
+# Степените P**1, P**2, ... и P**0, P**-1, ... (по модул 2**64) за text_hashes -
+# растат до най-дългата видяна текстова колона на част и се преизползват
+_TEXT_HASH_POWERS = [np.zeros(0, dtype=np.uint64), np.ones(1, dtype=np.uint64)] if PANDAS_AVAILABLE else None
+
+
+def _text_hash_powers(size):
+    powers, inverse = _TEXT_HASH_POWERS
+    if len(powers) < size:
+        size = max(size, 2 * len(powers))
+        with np.errstate(over='ignore'):
+            powers = np.cumprod(np.full(size, HASH_MIX_1, dtype=np.uint64), dtype=np.uint64)
+            inverse = np.cumprod(np.full(size + 1, pow(HASH_MIX_1, -1, 1 << 64), dtype=np.uint64),
+                                 dtype=np.uint64)
+            inverse[1:] = inverse[:-1].copy()
+            inverse[0] = 1
+        _TEXT_HASH_POWERS[:] = [powers, inverse]
+    return powers, inverse
+
+
+def text_hashes(array):
+    """
+    64-битови хешове на стойностите на Arrow текстова колона, сметнати
+    векторно върху UTF-8 буфера - без Python низове. Всеки байт се умножава
+    по P**(позицията му в буфера), сумата на реда се връща към началото на
+    реда с P**-начало (P е нечетно, значи обратимо по модул 2**64), така че
+    еднакви стойности дават еднакви хешове. Накрая splitmix64 с дължината.
+    """
+    if isinstance(array, pa.ChunkedArray):
+        return np.concatenate([text_hashes(chunk) for chunk in array.chunks]) if array.num_chunks \
+            else np.zeros(0, dtype=np.uint64)
+    array = array.cast(pa.large_string())
+    offsets = np.frombuffer(array.buffers()[1], dtype=np.int64)[array.offset:array.offset + len(array) + 1]
+    lengths = np.diff(offsets)
+    sums = np.zeros(len(array), dtype=np.uint64)
+    total = int(offsets[-1] - offsets[0]) if len(array) else 0
+    if total:
+        powers, inverse = _text_hash_powers(total)
+        starts = offsets[:-1] - offsets[0]
+        filled = lengths > 0
+        with np.errstate(over='ignore'):
+            terms = np.frombuffer(array.buffers()[2], dtype=np.uint8)[offsets[0]:offsets[-1]].astype(np.uint64)
+            terms += np.uint64(1)
+            terms *= powers[:total]
+            sums[filled] = np.add.reduceat(terms, starts[filled]) * inverse[starts[filled]]
+    with np.errstate(over='ignore'):
+        return mix64(sums ^ mix64(lengths))
+
+
+def _is_ascii_text(array):
+    """Дали Arrow текстовата колона е само ASCII (по байтовете на буфера)"""
+    for chunk in (array.chunks if isinstance(array, pa.ChunkedArray) else [array]):
+        data = chunk.buffers()[2]
+        if data is not None and len(data) and np.frombuffer(data, dtype=np.uint8).max() >= 0x80:
+            return False
+    return True
+
+
+class DataProfiler:
+    """
+    Профил на качеството на данните с едно минаване на части: дял празни
+    стойности, брой различни (точно до EXACT_DISTINCT_LIMIT, после
+    HyperLogLog), стойности с развалена кодировка, а за колоните в CHECKS -
+    непарснати дати с min/max (End_Data), телефони, които не са български
+    мобилни (Phone), и ЕИК с грешна дължина или контролна цифра (bulst).
+    Всичко е векторизирано по колона; различните стойности се хешират само
+    веднъж на част.
+    """
+
+    EXACT_DISTINCT_LIMIT = 100_000
+    CHECKS = {'End_Data': 'date', 'Phone': 'phone', 'bulst': 'eik'}
+
+    def __init__(self, checks=None):
+        self.checks = dict(self.CHECKS if checks is None else checks)
+        self.rows = 0
+        self.columns = OrderedDict()
+
+    def _column(self, name):
+        if name not in self.columns:
+            self.columns[name] = {'nulls': 0, 'mojibake': 0, 'invalid': 0, 'min': None, 'max': None,
+                                  'exact': np.zeros(0, dtype=np.uint64), 'hll': HyperLogLog()}
+        return self.columns[name]
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        for name in chunk.columns:
+            stats = self._column(name)
+            series = chunk[name]
+            if isinstance(series.dtype, pd.StringDtype) and series.dtype.storage == 'pyarrow':
+                array = pc.fill_null(pa.array(series.array), '')
+                empty = pc.or_(pc.equal(pc.binary_length(array), 0), pc.utf8_is_space(array))
+                # HyperLogLog и точното броене не зависят от повторенията -
+                # хешират се само различните стойности на частта
+                hashes = text_hashes(pc.unique(pc.filter(array, pc.invert(empty))))
+                empty = empty.to_numpy(zero_copy_only=False)
+                if not _is_ascii_text(array):
+                    stats['mojibake'] += pc.sum(pc.match_substring_regex(array, _MOJIBAKE_RE)).as_py() or 0
+            elif is_text_column(series):
+                text = series.fillna('').astype(str)
+                empty = (text.str.strip() == '').to_numpy(dtype=bool)
+                hashes = pd.util.hash_array(text.to_numpy(dtype=object))[~empty]
+                stats['mojibake'] += int(text.str.contains(_MOJIBAKE_RE, regex=True).sum())
+            else:
+                # Числова колона (CSV с разпознати типове)
+                empty = series.isna().to_numpy()
+                hashes = pd.util.hash_array(series.to_numpy())[~empty]
+            stats['nulls'] += int(empty.sum())
+
+            stats['hll'].add_hashes(hashes)
+            if stats['exact'] is not None:
+                # Сортирано сливане вместо np.unique (бавният хеш-път при големи масиви)
+                merged = np.sort(np.concatenate([stats['exact'], hashes]))
+                merged = merged[np.concatenate(([True], merged[1:] != merged[:-1]))] if len(merged) else merged
+                stats['exact'] = merged if len(merged) <= self.EXACT_DISTINCT_LIMIT else None
+
+            check = self.checks.get(name)
+            if check == 'date':
+                parsed = parse_end_data(series)
+                stats['invalid'] += int((parsed.isna().to_numpy() & ~empty).sum())
+                low, high = parsed.min(), parsed.max()
+                if pd.notna(low):
+                    stats['min'] = low if stats['min'] is None else min(stats['min'], low)
+                    stats['max'] = high if stats['max'] is None else max(stats['max'], high)
+            elif check == 'phone':
+                stats['invalid'] += int((~valid_mobile_phones(series) & ~empty).sum())
+            elif check == 'eik':
+                stats['invalid'] += int((~valid_eik(series) & ~empty).sum())
+        return chunk
+
+    def report(self):
+        """Резултатът като речник (за JSON/HTML отчета)"""
+        columns = OrderedDict()
+        for name, stats in self.columns.items():
+            exact = stats['exact'] is not None
+            column = {
+                'nulls': stats['nulls'],
+                'null_rate': round(stats['nulls'] / self.rows, 6) if self.rows else 0.0,
+                'distinct': len(stats['exact']) if exact else stats['hll'].count(),
+                'distinct_approx': not exact,
+                'mojibake': stats['mojibake'],
+            }
+            check = self.checks.get(name)
+            if check == 'date':
+                column['parse_failures'] = stats['invalid']
+                column['min_date'] = stats['min'].strftime('%Y-%m-%d') if stats['min'] is not None else None
+                column['max_date'] = stats['max'].strftime('%Y-%m-%d') if stats['max'] is not None else None
+            elif check == 'phone':
+                column['invalid_phones'] = stats['invalid']
+            elif check == 'eik':
+                column['invalid_eik'] = stats['invalid']
+            columns[name] = column
+        return {'rows': self.rows, 'columns': columns}
+
+
+def profile_source(file_path, chunksize=100000, runner=None, progress=None, poll=None, table=DEFAULT_TABLE):
+    """
+    Профилира целия източник с едно минаване (конвейер: четене -> кодировка ->
+    профил) и връща отчета от DataProfiler.report() с източника и времето.
+    """
+    profiler = DataProfiler()
+    pipeline = Pipeline(stream_source_chunks(file_path, chunksize, runner, progress, table=table), [
+        ('encoding', encoding_stage(file_path)),
+        ('profile', profiler.update),
+    ])
+    pipeline.run(poll)
+    report = profiler.report()
+    report['source'] = os.path.abspath(file_path)
+    report['table'] = table
+    report['created'] = datetime.now().isoformat(timespec='seconds')
+    report['stage_seconds'] = pipeline.stage_seconds
+    report['wall_seconds'] = pipeline.wall_seconds
+    return report
+
+
+# Колоните на отчета: ключ -> заглавие (показват се само наличните)
+PROFILE_REPORT_FIELDS = (
+    ('nulls', "Празни"), ('null_rate', "Дял празни"), ('distinct', "Различни"),
+    ('mojibake', "Развалена кодировка"), ('parse_failures', "Непарснати дати"),
+    ('min_date', "Най-ранна дата"), ('max_date', "Най-късна дата"),
+    ('invalid_phones', "Невалидни телефони"), ('invalid_eik', "Невалидни ЕИК"),
+)
+# Полета, при които ненулева стойност е проблем (оцветяват се в HTML)
+PROFILE_PROBLEM_FIELDS = ('mojibake', 'parse_failures', 'invalid_phones', 'invalid_eik')
+
+
+def format_profile_value(column, field):
+    value = column.get(field)
+    if value is None:
+        return ''
+    if field == 'null_rate':
+        return f"{value:.2%}"
+    if field == 'distinct':
+        return f"≈{value:,}" if column['distinct_approx'] else f"{value:,}"
+    return f"{value:,}" if isinstance(value, int) else str(value)
+
+
+def write_profile_report(report, output_path):
+    """Записва отчета като HTML таблица (.html/.htm) или JSON (всичко друго)"""
+    if os.path.splitext(output_path)[1].lower() not in ('.html', '.htm'):
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return
+
+    fields = [(key, title) for key, title in PROFILE_REPORT_FIELDS
+              if any(key in column for column in report['columns'].values())]
+    header = ''.join(f"<th>{html.escape(title)}</th>" for _, title in fields)
+    rows = []
+    for name, column in report['columns'].items():
+        cells = []
+        for key, _ in fields:
+            problem = key in PROFILE_PROBLEM_FIELDS and column.get(key)
+            css = ' class="problem"' if problem else ''
+            cells.append(f"<td{css}>{html.escape(format_profile_value(column, key))}</td>")
+        rows.append(f"<tr><th>{html.escape(str(name))}</th>{''.join(cells)}</tr>")
+    document = (
+        "<!DOCTYPE html>\n<html lang=\"bg\"><head><meta charset=\"utf-8\">"
+        f"<title>Профил на {html.escape(os.path.basename(report.get('source', '')))}</title>"
+        "<style>body{font-family:sans-serif}table{border-collapse:collapse}"
+        "th,td{border:1px solid #ccc;padding:4px 8px;text-align:right}"
+        "tr>th:first-child{text-align:left}.problem{background:#fdd}</style></head><body>"
+        f"<h1>Профил на данните: {html.escape(report.get('source', ''))}</h1>"
+        f"<p>Таблица {html.escape(str(report.get('table', '')))}, {report['rows']:,} реда, "
+        f"{report.get('wall_seconds', 0):.1f} сек. ({html.escape(report.get('created', ''))})</p>"
+        f"<table><tr><th>Колона</th>{header}</tr>{''.join(rows)}</table>"
+        "<p>≈ - приблизителен брой (HyperLogLog)</p></body></html>\n"
+    )
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(document)
@@ -0,0 +1,143 @@
+"""
+Отчитане на напредъка по прочетени байтове с ETA.
+"""
+
+import sys
+import os
+import time
+
+from .core import pd
+
+
+class ProgressTracker:
+    """
+    Проследяване на напредъка по байтове (спрямо общия размер) и редове.
+
+    add() се вика от горещия цикъл и само обновява броячите; към
+    приемниците (sinks) се изпраща най-много веднъж на min_interval секунди,
+    така че отчитането не забавя четенето. Приемник е всяка функция, която
+    приема речника от snapshot() - например ConsoleProgressSink или
+    TkProgressSink.
+    """
+
+    def __init__(self, sinks=(), min_interval=0.25):
+        self.sinks = list(sinks)
+        self.min_interval = min_interval
+        self.start_phase('')
+
+    def start_phase(self, label, total_bytes=None):
+        self.label = label
+        self.total_bytes = total_bytes
+        self.bytes = 0
+        self.rows = 0
+        self.started = time.monotonic()
+        self._last_emit = 0.0
+
+    def add(self, data=None, nbytes=0, rows=0):
+        """Добавя прочетена част; ако е подаден bytes обект, редовете се броят по '\\n'"""
+        if data is not None:
+            nbytes = len(data)
+            rows = data.count(b'\n')
+        self.bytes += nbytes
+        self.rows += rows
+        now = time.monotonic()
+        if now - self._last_emit >= self.min_interval:
+            self._last_emit = now
+            self.emit()
+
+    def snapshot(self, finished=False):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        fraction = None
+        eta = None
+        if self.total_bytes:
+            fraction = 1.0 if finished else min(self.bytes / self.total_bytes, 0.99)
+            byte_rate = self.bytes / elapsed
+            if byte_rate > 0 and not finished:
+                eta = max(self.total_bytes - self.bytes, 0) / byte_rate
+        return {
+            'label': self.label,
+            'bytes': self.bytes,
+            'total_bytes': self.total_bytes,
+            'rows': self.rows,
+            'elapsed': elapsed,
+            'rows_per_sec': self.rows / elapsed,
+            'fraction': fraction,
+            'eta': eta,
+            'finished': finished,
+        }
+
+    def emit(self, finished=False):
+        progress = self.snapshot(finished)
+        for sink in self.sinks:
+            sink(progress)
+
+    def finish(self):
+        self.emit(finished=True)
+
+
+def format_progress(progress):
+    """Текст на напредъка: '<етап>: 45% (12.3/27.0 MB), 85,000 реда/сек, остават ~0:12'"""
+    parts = [f"{progress['label']}:"]
+    mb = progress['bytes'] / (1024 * 1024)
+    if progress['fraction'] is not None:
+        total_mb = progress['total_bytes'] / (1024 * 1024)
+        parts.append(f"{progress['fraction'] * 100:.0f}% ({mb:.1f}/{total_mb:.1f} MB)")
+    else:
+        parts.append(f"{mb:.1f} MB")
+    if progress['rows']:
+        parts.append(f"{progress['rows']:,} реда, {progress['rows_per_sec']:,.0f} реда/сек")
+    if progress['eta'] is not None:
+        minutes, seconds = divmod(int(progress['eta']), 60)
+        parts.append(f"остават ~{minutes}:{seconds:02d}")
+    if progress['finished']:
+        parts.append(f"готово за {progress['elapsed']:.1f} сек.")
+    return ' '.join(parts[:1]) + ' ' + ', '.join(parts[1:])
+
+
+class ConsoleProgressSink:
+    """Приемник за командния ред - обновява един ред в stderr"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+
+    def __call__(self, progress):
+        end = '\n' if progress['finished'] else '\r'
+        self.stream.write(format_progress(progress).ljust(100) + end)
+        self.stream.flush()
+
+
+class CountingReader:
+    """Обвивка на двоичен файл, която отчита прочетените байтове в ProgressTracker"""
+
+    def __init__(self, raw, progress):
+        self.raw = raw
+        self.progress = progress
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        if self.progress is not None:
+            self.progress.add(data)
+        return data
+
+    def readline(self, size=-1):
+        data = self.raw.readline(size)
+        if self.progress is not None:
+            self.progress.add(data)
+        return data
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def close(self):
+        self.raw.close()
+
+
+def read_csv_with_progress(csv_path, progress=None, label="Четене на CSV", **kwargs):
+    """pd.read_csv, който отчита прочетените байтове спрямо размера на файла"""
+    if progress is None:
+        return pd.read_csv(csv_path, encoding='utf-8', **kwargs)
+    progress.start_phase(label, os.path.getsize(csv_path))
+    with open(csv_path, 'rb') as raw:
+        result = pd.read_csv(CountingReader(raw, progress), encoding='utf-8', **kwargs)
+    progress.finish()
+    return result
@@ -0,0 +1,80 @@
+"""
+Вълни на известията по оставащите дни до изтичане на End_Data.
+"""
+
+from datetime import timedelta
+import csv
+import os
+
+from .core import compile_column_plan, parse_end_data, pd, project_columns, to_quoted_csv_lines
+
+
+DEFAULT_WAVE_OFFSETS = (30, 14, 7, 1)
+
+
+def wave_window(today, horizon_days, offsets):
+    """Периодът по End_Data, нужен за вълните в следващите horizon_days дни"""
+    return (today + timedelta(days=min(offsets)),
+            today + timedelta(days=horizon_days - 1 + max(offsets)))
+
+
+def compute_notification_waves(df, today, horizon_days, offsets=DEFAULT_WAVE_OFFSETS):
+    """
+    Изчислява всички вълни известия за следващите horizon_days дни.
+    За всеки отстъп (напр. 30/14/7/1 дни преди End_Data) датата на изпращане
+    е End_Data - отстъп; редовете се подреждат веднъж по (дата, отстъп).
+    Връща DataFrame с добавени колони Send_Date и Days_Before.
+    """
+    parsed = df['End_Data_parsed'] if 'End_Data_parsed' in df.columns else parse_end_data(df['End_Data'])
+    end_days = parsed.dt.normalize()
+    first_day = pd.Timestamp(today)
+    last_day = first_day + pd.Timedelta(days=horizon_days - 1)
+
+    frames = []
+    for offset in sorted(set(offsets), reverse=True):
+        send_dates = end_days - pd.Timedelta(days=offset)
+        mask = (send_dates >= first_day) & (send_dates <= last_day)
+        if mask.any():
+            wave = df[mask].copy()
+            wave['Send_Date'] = send_dates[mask].dt.date
+            wave['Days_Before'] = offset
+            frames.append(wave)
+
+    if not frames:
+        empty = df.iloc[0:0].copy()
+        empty['Send_Date'] = pd.Series(dtype=object)
+        empty['Days_Before'] = pd.Series(dtype=int)
+        return empty
+
+    waves = pd.concat(frames)
+    waves['_order'] = waves.index
+    waves = waves.sort_values(['Send_Date', 'Days_Before', '_order'], ascending=[True, False, True],
+                              kind='stable')
+    return waves.drop(columns=['_order'])
+
+
+def write_notification_waves(waves, output_dir):
+    """
+    Записва всяка вълна в отделен CSV (wave_YYYY-MM-DD_T-N.csv) с нужните колони
+    и обобщение _schedule.csv. Връща списък (дата, дни преди, редове, файл).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    plan = compile_column_plan(tuple(waves.columns.drop(['Send_Date', 'Days_Before'])))
+    summary = []
+
+    for (send_date, days_before), group in waves.groupby(['Send_Date', 'Days_Before'], sort=False):
+        extracted = project_columns(group, plan)
+        extracted['Send_Date'] = send_date.strftime('%d.%m.%Y')
+        extracted['Days_Before'] = str(days_before)
+        wave_path = os.path.join(output_dir, f"wave_{send_date.isoformat()}_T-{days_before}.csv")
+        with open(wave_path, 'w', encoding='utf-8', newline='') as f:
+            f.write('\n'.join(to_quoted_csv_lines(extracted)) + '\n')
+        summary.append((send_date, days_before, len(group), wave_path))
+
+    with open(os.path.join(output_dir, '_schedule.csv'), 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        writer.writerow(['Send_Date', 'Days_Before', 'Rows', 'File'])
+        for send_date, days_before, rows, wave_path in summary:
+            writer.writerow([send_date.strftime('%d.%m.%Y'), days_before, rows, os.path.basename(wave_path)])
+
+    return summary
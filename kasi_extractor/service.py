@@ -0,0 +1,219 @@
+"""
+Локална HTTP услуга за извличане с данни, заредени в паметта.
+"""
+
+from datetime import datetime, timedelta
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from .core import (compile_column_plan, file_fingerprint, np, parse_end_data, parse_query_date,
+                   project_columns, to_quoted_csv_lines)
+from .sources import load_source_dataframe
+
+
+class WarmDataset:
+    """
+    Kasi_all, зареден веднъж в паметта, с индекс по End_Data.
+
+    Редовете се пазят подредени по дата (numpy масив), така че заявка за
+    период е двоично търсене плюс вземане на редовете. Фонова нишка следи
+    отпечатъка на файла и презарежда данните при промяна; заявките винаги
+    ползват последния завършен снимков вариант (snapshot). Неуспешното
+    презареждане се пази в last_error/last_error_at (виждат се в /health)
+    и се записва в лога.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, file_path, watch_interval=5.0):
+        self.file_path = file_path
+        self.watch_interval = watch_interval
+        self.snapshot = None
+        self.last_error = None
+        self.last_error_at = None
+        self._stop = threading.Event()
+        self._watcher = None
+        self.reload()
+
+    def reload(self):
+        """Зарежда файла и атомарно подменя снимката"""
+        fingerprint = file_fingerprint(self.file_path)
+        df = load_source_dataframe(self.file_path)
+        if 'End_Data' not in df.columns:
+            raise RuntimeError("Колона 'End_Data' не е намерена в таблицата!")
+
+        parsed = parse_end_data(df['End_Data'])
+        order = np.argsort(parsed.values, kind='stable')
+        plan = compile_column_plan(tuple(df.columns))
+        self.snapshot = {
+            'fingerprint': fingerprint,
+            'df': df,
+            'plan': plan,
+            'order': order,
+            'sorted_dates': parsed.values[order],
+            'loaded_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        return self.snapshot
+
+    def query_positions(self, start, end, snapshot=None):
+        """Номерата на редовете с End_Data в [start, end], в реда от файла"""
+        snapshot = snapshot or self.snapshot
+        sorted_dates = snapshot['sorted_dates']
+        low = np.datetime64(start, 'D').astype(sorted_dates.dtype)
+        high = np.datetime64(end + timedelta(days=1), 'D').astype(sorted_dates.dtype)
+        left = np.searchsorted(sorted_dates, low, side='left')
+        right = np.searchsorted(sorted_dates, high, side='left')
+        return np.sort(snapshot['order'][left:right])
+
+    def project(self, positions, snapshot=None):
+        """Текстовите нужни колони само за редовете positions"""
+        snapshot = snapshot or self.snapshot
+        return project_columns(snapshot['df'].iloc[positions], snapshot['plan'])
+
+    def query(self, start, end, snapshot=None):
+        """Връща текстовите нужни колони за редовете с End_Data в [start, end]"""
+        snapshot = snapshot or self.snapshot
+        return self.project(self.query_positions(start, end, snapshot), snapshot)
+
+    def start_watching(self):
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.watch_interval):
+            try:
+                if file_fingerprint(self.file_path) != self.snapshot['fingerprint']:
+                    self.reload()
+                    self.last_error = self.last_error_at = None
+                    self.logger.info("Данните са презаредени: %s реда", f"{len(self.snapshot['df']):,}")
+            except Exception as e:
+                # Заявките продължават със старата снимка; същата грешка се логва веднъж
+                if str(e) != self.last_error:
+                    self.logger.warning("Неуспешно презареждане на %s: %s", self.file_path, e)
+                self.last_error = str(e)
+                self.last_error_at = datetime.now().isoformat(timespec='seconds')
+
+
+class ExtractionRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /clients?from=...&to=...&format=ndjson|csv|json - клиенти за периода
+    GET /health - информация за заредените данни и последната грешка при презареждане
+    """
+
+    protocol_version = 'HTTP/1.1'
+    dataset = None
+    BATCH_ROWS = 5000
+
+    CONTENT_TYPES = {
+        'ndjson': 'application/x-ndjson; charset=utf-8',
+        'csv': 'text/csv; charset=utf-8',
+        'json': 'application/json; charset=utf-8',
+    }
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/health':
+            return self._send_health()
+        if url.path != '/clients':
+            return self._send_error(404, "Непознат адрес")
+
+        params = parse_qs(url.query)
+        try:
+            start = parse_query_date(params['from'][0])
+            end = parse_query_date(params['to'][0])
+        except (KeyError, IndexError):
+            return self._send_error(400, "Параметрите 'from' и 'to' са задължителни")
+        except ValueError as e:
+            return self._send_error(400, str(e))
+        if start > end:
+            return self._send_error(400, "Крайната дата е преди началната")
+
+        output_format = params.get('format', ['ndjson'])[0]
+        if output_format not in self.CONTENT_TYPES:
+            return self._send_error(400, f"Неподдържан формат: {output_format}")
+
+        # Снимката се взима веднъж - презареждане по време на отговора не го смесва
+        snapshot = self.dataset.snapshot
+        positions = self.dataset.query_positions(start, end, snapshot)
+
+        self.send_response(200)
+        self.send_header('Content-Type', self.CONTENT_TYPES[output_format])
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('X-Total-Rows', str(len(positions)))
+        self.end_headers()
+        for chunk in self._render(snapshot, positions, output_format):
+            self._write_chunk(chunk)
+        self._write_chunk('')
+
+    def _render(self, snapshot, positions, output_format):
+        """Генерира отговора на партиди - колоните се превръщат в текст партида по партида"""
+        if output_format == 'csv':
+            yield '\n'.join(to_quoted_csv_lines(self.dataset.project(positions[:0], snapshot))) + '\n'
+        elif output_format == 'json':
+            yield '['
+
+        for offset in range(0, len(positions), self.BATCH_ROWS):
+            batch = self.dataset.project(positions[offset:offset + self.BATCH_ROWS], snapshot)
+            if output_format == 'csv':
+                yield '\n'.join(to_quoted_csv_lines(batch)[1:]) + '\n'
+                continue
+            columns = list(batch.columns)
+            rows = [json.dumps(dict(zip(columns, values)), ensure_ascii=False)
+                    for values in batch.itertuples(index=False, name=None)]
+            if output_format == 'ndjson':
+                yield '\n'.join(rows) + '\n'
+            else:
+                yield (',' if offset else '') + ','.join(rows)
+
+        if output_format == 'json':
+            yield ']'
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+
+    def _send_health(self):
+        snapshot = self.dataset.snapshot
+        body = json.dumps({
+            'file': self.dataset.file_path,
+            'rows': len(snapshot['df']),
+            'loaded_at': snapshot['loaded_at'],
+            'last_error': self.dataset.last_error,
+            'last_error_at': self.dataset.last_error_at,
+        }, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        body = json.dumps({'error': message}, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_extraction(file_path, host='127.0.0.1', port=8765, watch_interval=5.0):
+    """Стартира локалната услуга за извличане (блокира до Ctrl+C)"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    dataset = WarmDataset(file_path, watch_interval)
+    dataset.start_watching()
+    handler = type('BoundExtractionRequestHandler', (ExtractionRequestHandler,), {'dataset': dataset})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Заредени {len(dataset.snapshot['df']):,} реда. Услугата слуша на http://{host}:{port}/clients")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dataset.stop_watching()
+        server.server_close()
@@ -0,0 +1,524 @@
+"""
+Четене на източника (MDB чрез mdbtools или CSV) - цял, на части или поточно.
+"""
+
+from contextlib import nullcontext
+import os
+import subprocess
+import tempfile
+import platform
+import threading
+import queue
+import asyncio
+import re
+
+from .core import (DEFAULT_TABLE, arrow_text_dtype, detect_source_type, file_fingerprint,
+                   fix_dataframe_encoding, pd, use_arrow_strings)
+from .progress import CountingReader, read_csv_with_progress
+
+
+# Проверка дали сме на Windows и имаме mdbtools
+IS_WINDOWS = platform.system().lower() == 'windows'
+MDBTOOLS_AVAILABLE = False
+
+# Проверяваме дали mdbtools са налични в системата
+try:
+    if IS_WINDOWS:
+        # На Windows проверяваме с where команда
+        result = subprocess.run(['where', 'mdb-ver'], 
+                              capture_output=True, text=True, timeout=10)
+        MDBTOOLS_AVAILABLE = result.returncode == 0
+    else:
+        # На Linux проверяваме с which
+        result = subprocess.run(['which', 'mdb-ver'], 
+                              capture_output=True, text=True, timeout=5)
+        MDBTOOLS_AVAILABLE = result.returncode == 0
+        
+except (subprocess.TimeoutExpired, FileNotFoundError, subprocess.SubprocessError):
+    MDBTOOLS_AVAILABLE = False
+
+
+class OperationCancelled(Exception):
+    """Операцията е прекратена от потребителя"""
+
+
+class MdbToolsRunner:
+    """
+    Асинхронно изпълнение на mdb-ver, mdb-tables, mdb-schema и mdb-export.
+
+    Командите се пускат с asyncio, така че проверката на схемата и експортът
+    вървят едновременно. Изходът на mdb-export се записва на части, таймаутът
+    зависи от размера на файла, а cancel() спира текущите процеси (безопасно
+    е да се извика от GUI нишката).
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, file_path, poll=None):
+        self.file_path = file_path
+        self.poll = poll
+        self.file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
+        self._loop = None
+        self._task = None
+        self._cancelled = False
+
+    def adaptive_timeout(self, base, seconds_per_mb):
+        """Таймаут в секунди, пропорционален на размера на MDB файла"""
+        return base + seconds_per_mb * self.file_size_mb
+
+    async def _communicate(self, cmd, timeout):
+        """Изпълнява команда и връща (код, stdout, stderr); спира процеса при таймаут/отказ"""
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            await self._kill(process)
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        except asyncio.CancelledError:
+            await self._kill(process)
+            raise
+        return (process.returncode,
+                stdout.decode('utf-8', errors='replace'),
+                stderr.decode('utf-8', errors='replace'))
+
+    @staticmethod
+    async def _kill(process):
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+
+    async def version(self):
+        returncode, stdout, stderr = await self._communicate(
+            ['mdb-ver', self.file_path], self.adaptive_timeout(30, 0.1))
+        if returncode != 0:
+            raise RuntimeError(f"Грешка при четене на MDB файла:\n{stderr}")
+        return stdout.strip()
+
+    async def tables(self):
+        returncode, stdout, stderr = await self._communicate(
+            ['mdb-tables', self.file_path], self.adaptive_timeout(30, 0.2))
+        if returncode != 0:
+            raise RuntimeError(f"Грешка при четене на MDB файла:\n{stderr}")
+        return stdout.strip().split()
+
+    async def schema(self, table):
+        returncode, stdout, stderr = await self._communicate(
+            ['mdb-schema', '-T', table, self.file_path], self.adaptive_timeout(30, 0.2))
+        if returncode != 0:
+            raise RuntimeError(f"Грешка при четене на схемата на '{table}':\n{stderr}")
+        return stdout
+
+    async def export(self, table, output_path, on_chunk=None):
+        """
+        Стриймва mdb-export в output_path на части; on_chunk(bytes) се вика за
+        всяка част в работна нишка, така че бавен получател не спира цикъла.
+        При output_path=None изходът отива само към on_chunk. Таймаутът е за
+        бездействие: толкова секунди без нито един байт от mdb-export.
+        """
+        cmd = ['mdb-export', self.file_path, table]
+        timeout = self.adaptive_timeout(120, 2.0)
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+
+        async def pump():
+            written = 0
+            with open(output_path, 'wb') if output_path else nullcontext() as output_file:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(process.stdout.read(self.CHUNK_SIZE), timeout)
+                    except asyncio.TimeoutError:
+                        raise subprocess.TimeoutExpired(cmd, timeout) from None
+                    if not chunk:
+                        break
+                    if output_file is not None:
+                        output_file.write(chunk)
+                    written += len(chunk)
+                    if on_chunk:
+                        # Изчакването на получателя (пълна опашка) не се брои към таймаута
+                        await asyncio.to_thread(on_chunk, chunk)
+            return written
+
+        try:
+            # stderr се чете успоредно - пълен stderr буфер не блокира mdb-export
+            written, stderr = await asyncio.gather(pump(), process.stderr.read())
+            await process.wait()
+        except BaseException:
+            await self._kill(process)
+            raise
+
+        if process.returncode != 0:
+            raise RuntimeError(f"Грешка при експорт на MDB: {stderr.decode('utf-8', errors='replace')}")
+        return written
+
+    async def probe(self):
+        """Паралелно чете версията и списъка с таблици"""
+        return await asyncio.gather(self.version(), self.tables())
+
+    async def probe_and_export(self, table, output_path, on_chunk=None, with_schema=True):
+        """
+        Пуска mdb-tables, mdb-schema и mdb-export едновременно.
+        Ако таблицата липсва, експортът се прекратява веднага.
+        Връща (списък с таблици, текст на схемата или None, записани байтове).
+        """
+        export_task = asyncio.ensure_future(self.export(table, output_path, on_chunk))
+        try:
+            if with_schema:
+                tables, schema = await asyncio.gather(self.tables(), self.schema(table))
+            else:
+                tables, schema = await self.tables(), None
+            if table not in tables:
+                raise RuntimeError(f"Таблица '{table}' не е намерена!")
+            written = await export_task
+        finally:
+            if not export_task.done():
+                export_task.cancel()
+                await asyncio.gather(export_task, return_exceptions=True)
+        return tables, schema, written
+
+    def run(self, coro, use_poll=True):
+        """
+        Изпълнява корутина синхронно. Ако е зададен poll, цикълът върви в
+        отделна нишка, а poll() (напр. обновяване на GUI) се вика докато чакаме.
+        От работни нишки се вика с use_poll=False - тогава poll не се ползва.
+        """
+        if self._cancelled:
+            coro.close()
+            raise OperationCancelled()
+
+        outcome = {}
+
+        async def guarded():
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.current_task()
+            try:
+                if self._cancelled:
+                    raise asyncio.CancelledError()
+                return await coro
+            finally:
+                self._task = None
+
+        def target():
+            try:
+                outcome['result'] = asyncio.run(guarded())
+            except asyncio.CancelledError:
+                outcome['error'] = OperationCancelled()
+            except BaseException as e:
+                outcome['error'] = e
+
+        if self.poll is None or not use_poll:
+            target()
+        else:
+            worker = threading.Thread(target=target, daemon=True)
+            worker.start()
+            while worker.is_alive():
+                self.poll()
+                worker.join(0.05)
+
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['result']
+
+    def cancel(self):
+        """Прекратява текущата операция (и следващите run() извиквания)"""
+        self._cancelled = True
+        loop, task = self._loop, self._task
+        if loop is not None and task is not None:
+            loop.call_soon_threadsafe(task.cancel)
+
+
+# Типове от mdb-schema -> dtype за pd.read_csv
+MDB_INTEGER_TYPES = {'byte', 'integer', 'long integer'}
+MDB_FLOAT_TYPES = {'single', 'double', 'numeric', 'currency'}
+MDB_TEXT_TYPES = {'text', 'memo', 'memo/hyperlink', 'hyperlink', 'replication id'}
+MDB_DATE_TYPES = {'datetime', 'datetime (short)'}
+
+# [Колона]  Тип (размер) NOT NULL, - размерът и NOT NULL не са задължителни
+_SCHEMA_COLUMN_RE = re.compile(r'^\s*[\[\"`](?P<name>[^\]\"`]+)[\]\"`]\s+(?P<type>[A-Za-z/ ]+?)\s*(\(\s*\d+\s*\))?'
+                               r'(?:\s+NOT\s+NULL)?\s*,?\s*$')
+
+# Кеш на разчетените схеми: (отпечатък на файла, таблица) -> схема
+_MDB_SCHEMA_CACHE = {}
+
+
+def parse_mdb_schema(schema_text):
+    """
+    Разчита изхода на mdb-schema за една таблица и връща
+    {'dtype': {колона: dtype}, 'date_columns': [...], 'columns': [...]}.
+    Текстовите колони се четат като str (Number_EKA остава '0123', а не 123.0),
+    целочислените като Int64, а датите остават текст и се парсват отделно
+    с известния формат на mdb-export.
+    """
+    dtype = {}
+    date_columns = []
+    columns = []
+    for line in schema_text.splitlines():
+        match = _SCHEMA_COLUMN_RE.match(line)
+        if not match:
+            continue
+        name = match.group('name')
+        mdb_type = match.group('type').strip().lower()
+        columns.append(name)
+        if mdb_type in MDB_TEXT_TYPES:
+            dtype[name] = str
+        elif mdb_type in MDB_INTEGER_TYPES:
+            dtype[name] = 'Int64'
+        elif mdb_type in MDB_FLOAT_TYPES:
+            dtype[name] = 'float64'
+        elif mdb_type in MDB_DATE_TYPES:
+            dtype[name] = str
+            date_columns.append(name)
+    return {'dtype': dtype, 'date_columns': date_columns, 'columns': columns}
+
+
+def read_csv_with_schema(csv_path, schema, progress=None):
+    """Чете експорта с явни типове; при несъответствие пада обратно на автоматично разпознаване"""
+    if not schema or not schema['dtype']:
+        return use_arrow_strings(read_csv_with_progress(csv_path, progress))
+    try:
+        return read_csv_with_progress(csv_path, progress, dtype=schema_read_dtypes(schema))
+    except (ValueError, TypeError):
+        return use_arrow_strings(read_csv_with_progress(csv_path, progress))
+
+
+def schema_read_dtypes(schema, text_only=False):
+    """dtype картата за read_csv - текстовите колони се четат направо като Arrow низове"""
+    text_dtype = arrow_text_dtype() or str
+    dtypes = {}
+    for column, dtype in schema['dtype'].items():
+        if dtype is str:
+            dtypes[column] = text_dtype
+        elif not text_only:
+            dtypes[column] = dtype
+    return dtypes
+
+
+def start_export_progress(progress, file_path):
+    """Етап 'експорт от MDB' - общият размер е размерът на MDB файла (приблизително)"""
+    if progress is None:
+        return None
+    progress.start_phase("Експорт от MDB", os.path.getsize(file_path))
+    return progress.add
+
+
+def load_source_dataframe(file_path, file_type=None, runner=None, progress=None, table=DEFAULT_TABLE):
+    """
+    Зарежда целия източник като DataFrame.
+    CSV файловете се четат директно, а MDB таблицата (Kasi_all) се експортира
+    с mdb-export и кодировката на текстовите колони се поправя.
+    """
+    file_type = file_type or detect_source_type(file_path)
+    if file_type == 'csv':
+        return use_arrow_strings(read_csv_with_progress(file_path, progress))
+    if file_type != 'mdb':
+        raise RuntimeError("Неподдържан файлов формат!")
+
+    runner = runner or MdbToolsRunner(file_path)
+
+    # Експортираме цялата таблица временно
+    with tempfile.NamedTemporaryFile(suffix='.csv', delete=False, mode='w+', encoding='utf-8') as temp_file:
+        temp_csv_path = temp_file.name
+
+    schema_key = (file_fingerprint(file_path), table)
+    schema = _MDB_SCHEMA_CACHE.get(schema_key)
+
+    try:
+        # Проверяваме таблиците (и схемата, ако още не е в кеша) и експортираме едновременно
+        on_chunk = start_export_progress(progress, file_path)
+        _, schema_text, _ = runner.run(runner.probe_and_export(
+            table, temp_csv_path, on_chunk, with_schema=schema is None))
+        if progress is not None:
+            progress.finish()
+        if schema is None:
+            schema = parse_mdb_schema(schema_text)
+            _MDB_SCHEMA_CACHE[schema_key] = schema
+
+        # Четем CSV с pandas с типовете от схемата (без повторно разпознаване)
+        df = read_csv_with_schema(temp_csv_path, schema, progress)
+    finally:
+        # Почистваме временния файл
+        os.unlink(temp_csv_path)
+
+    # Поправяме кодировката на всички текстови колони
+    return fix_dataframe_encoding(df)
+
+
+def source_columns(file_path, runner=None, table=DEFAULT_TABLE):
+    """Имената на колоните на източника по реда им - от заглавието на CSV или от схемата на MDB"""
+    file_type = detect_source_type(file_path)
+    if file_type == 'csv':
+        return [str(col) for col in pd.read_csv(file_path, encoding='utf-8', nrows=0).columns]
+    if file_type != 'mdb':
+        raise RuntimeError("Неподдържан файлов формат!")
+    runner = runner or MdbToolsRunner(file_path)
+    schema_key = (file_fingerprint(file_path), table)
+    schema = _MDB_SCHEMA_CACHE.get(schema_key)
+    if schema is None:
+        schema = parse_mdb_schema(runner.run(runner.schema(table), use_poll=False))
+        _MDB_SCHEMA_CACHE[schema_key] = schema
+    return list(schema['columns'])
+
+
+def iter_source_chunks(file_path, chunksize=200000, runner=None, progress=None, table=DEFAULT_TABLE):
+    """
+    Чете източника на части (DataFrame по chunksize реда) с ограничена памет.
+    При MDB таблицата се експортира във временен файл, текстовите колони от
+    схемата се четат като str и кодировката се поправя за всяка част.
+    """
+    file_type = detect_source_type(file_path)
+    if file_type == 'csv':
+        for chunk in _progress_chunks(file_path, progress, chunksize=chunksize):
+            yield use_arrow_strings(chunk)
+        return
+    if file_type != 'mdb':
+        raise RuntimeError("Неподдържан файлов формат!")
+
+    runner = runner or MdbToolsRunner(file_path)
+    with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as temp_file:
+        temp_csv_path = temp_file.name
+
+    try:
+        on_chunk = start_export_progress(progress, file_path)
+        _, schema_text, _ = runner.run(runner.probe_and_export(table, temp_csv_path, on_chunk))
+        if progress is not None:
+            progress.finish()
+        schema = parse_mdb_schema(schema_text)
+        text_dtypes = schema_read_dtypes(schema, text_only=True)
+        for chunk in _progress_chunks(temp_csv_path, progress, chunksize=chunksize, dtype=text_dtypes):
+            yield fix_dataframe_encoding(chunk)
+    finally:
+        os.unlink(temp_csv_path)
+
+
+def _progress_chunks(csv_path, progress, **kwargs):
+    """Чете CSV на части и отчита напредъка; приключва етапа след последната част"""
+    if progress is None:
+        with pd.read_csv(csv_path, encoding='utf-8', **kwargs) as reader:
+            yield from reader
+        return
+
+    progress.start_phase("Четене на CSV", os.path.getsize(csv_path))
+    with open(csv_path, 'rb') as raw, \
+            pd.read_csv(CountingReader(raw, progress), encoding='utf-8', **kwargs) as reader:
+        yield from reader
+    progress.finish()
+
+
+class QueueReader:
+    """Двоичен файлов обект върху опашка от bytes части (None означава край)"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self._buffer = bytearray()
+        self._eof = False
+
+    def _fill(self, size):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self.chunks.get()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer += chunk
+
+    def read(self, size=-1):
+        self._fill(size)
+        if size < 0 or size >= len(self._buffer):
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+    def readline(self, size=-1):
+        while not self._eof and b'\n' not in self._buffer:
+            self._fill(len(self._buffer) + 1)
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        if 0 <= size < end:
+            end = size
+        return self.read(end)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def close(self):
+        pass
+
+
+def stream_source_chunks(file_path, chunksize=100000, runner=None, progress=None, table=DEFAULT_TABLE):
+    """
+    Като iter_source_chunks, но без временен файл: изходът на mdb-export се
+    подава през ограничена опашка направо на pandas, така че експортът и
+    парсването вървят едновременно. Кодировката НЕ се поправя тук - това е
+    отделен етап на конвейера (виж extract_date_range).
+    """
+    if detect_source_type(file_path) != 'mdb':
+        yield from iter_source_chunks(file_path, chunksize, progress=progress)
+        return
+
+    runner = runner or MdbToolsRunner(file_path)
+    schema_key = (file_fingerprint(file_path), table)
+    schema = _MDB_SCHEMA_CACHE.get(schema_key)
+    if schema is None:
+        schema = parse_mdb_schema(runner.run(runner.schema(table), use_poll=False))
+        _MDB_SCHEMA_CACHE[schema_key] = schema
+
+    chunks = queue.Queue(maxsize=64)
+    stopped = threading.Event()
+    outcome = {}
+    on_progress = start_export_progress(progress, file_path)
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise OperationCancelled()
+
+    def on_chunk(data):
+        if on_progress is not None:
+            on_progress(data)
+        put(data)
+
+    def export():
+        try:
+            runner.run(runner.export(table, None, on_chunk), use_poll=False)
+        except BaseException as e:
+            outcome['error'] = e
+        finally:
+            try:
+                put(None)
+            except OperationCancelled:
+                pass
+
+    exporter = threading.Thread(target=export, daemon=True)
+    exporter.start()
+    try:
+        try:
+            with pd.read_csv(QueueReader(chunks), encoding='utf-8', chunksize=chunksize,
+                             dtype=schema_read_dtypes(schema, text_only=True)) as reader:
+                yield from reader
+        except Exception:
+            # Експортът може да чака на пълната опашка - спира се преди join.
+            # Прекъснат експорт оставя непълен CSV - показваме истинската причина
+            stopped.set()
+            runner.cancel()
+            exporter.join()
+            if 'error' in outcome and not isinstance(outcome['error'], OperationCancelled):
+                raise outcome['error']
+            raise
+        exporter.join()
+        if 'error' in outcome:
+            raise outcome['error']
+        if progress is not None:
+            progress.finish()
+    finally:
+        if exporter.is_alive():
+            stopped.set()
+            runner.cancel()
+            exporter.join()
@@ -0,0 +1,463 @@
+"""
+Локални копия на Kasi_all за бързи заявки по дата: дялове по End_Data, SQLite
+и кеш на резултатите за сесията.
+"""
+
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from contextlib import closing
+import json
+import os
+import shutil
+import sqlite3
+
+from .core import PYARROW_AVAILABLE, file_fingerprint, parse_end_data, pd
+from .sources import load_source_dataframe
+
+
+class PartitionStore:
+    """
+    Разделено по дати хранилище на Kasi_all на диска.
+
+    Таблицата (с поправена кодировка) се записва в Hive-style директории
+    End_Data=YYYY-MM/ (или End_Data=YYYY-MM-DD/) - Parquet при наличен pyarrow,
+    иначе CSV. Манифестът _partitions.json пази отпечатъка на източника и
+    диапазона от дати на всеки дял, така че филтрирането чете само дяловете,
+    които се припокриват със заявения период.
+    """
+
+    MANIFEST_NAME = '_partitions.json'
+    NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+    ROW_ID_COLUMN = '_row_id'
+
+    def __init__(self, root):
+        self.root = root
+        self.manifest = None
+        manifest_path = os.path.join(root, self.MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+
+    @staticmethod
+    def default_root(source_path):
+        """Директория на хранилището до изходния файл"""
+        return os.path.splitext(source_path)[0] + '_partitions'
+
+    @classmethod
+    def for_source(cls, source_path):
+        return cls(cls.default_root(source_path))
+
+    def is_current(self, fingerprint):
+        """Проверява дали хранилището е построено от същата версия на файла"""
+        if not self.manifest:
+            return False
+        size, mtime_ns = self.manifest['source'][1:]
+        return size == fingerprint[1] and mtime_ns == fingerprint[2]
+
+    @property
+    def total_rows(self):
+        return self.manifest['total_rows'] if self.manifest else 0
+
+    @classmethod
+    def build(cls, df, root, fingerprint, granularity='month'):
+        """Записва DataFrame-а като дялове по End_Data и връща новото хранилище"""
+        if 'End_Data' not in df.columns:
+            raise RuntimeError("Колона 'End_Data' не е намерена в таблицата!")
+
+        file_format = 'parquet' if PYARROW_AVAILABLE else 'csv'
+        key_format = '%Y-%m' if granularity == 'month' else '%Y-%m-%d'
+
+        os.makedirs(root, exist_ok=True)
+        # Премахваме стари дялове (само директориите End_Data=...)
+        for name in os.listdir(root):
+            if name.startswith('End_Data='):
+                shutil.rmtree(os.path.join(root, name))
+
+        parsed = parse_end_data(df['End_Data'])
+        data = df.drop(columns=['End_Data_parsed'], errors='ignore').copy()
+        data.insert(0, cls.ROW_ID_COLUMN, range(len(data)))
+        keys = parsed.dt.strftime(key_format).fillna(cls.NULL_PARTITION)
+
+        partitions = []
+        for key, group in data.groupby(keys, sort=True):
+            part_dir = os.path.join(root, f"End_Data={key}")
+            os.makedirs(part_dir, exist_ok=True)
+            part_file = os.path.join(part_dir, f"part-0.{file_format}")
+            if file_format == 'parquet':
+                group.to_parquet(part_file, index=False)
+            else:
+                group.to_csv(part_file, index=False, encoding='utf-8')
+
+            group_dates = parsed.loc[group.index]
+            partitions.append({
+                'key': key,
+                'path': os.path.relpath(part_file, root),
+                'rows': len(group),
+                'min_date': group_dates.min().date().isoformat() if group_dates.notna().any() else None,
+                'max_date': group_dates.max().date().isoformat() if group_dates.notna().any() else None,
+            })
+
+        manifest = {
+            'source': list(fingerprint),
+            'granularity': granularity,
+            'format': file_format,
+            'columns': list(df.columns.drop('End_Data_parsed', errors='ignore')),
+            'total_rows': len(df),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'partitions': partitions,
+        }
+        temp_manifest = os.path.join(root, cls.MANIFEST_NAME + '.tmp')
+        with open(temp_manifest, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_manifest, os.path.join(root, cls.MANIFEST_NAME))
+
+        return cls(root)
+
+    def partitions_for_range(self, start, end):
+        """Връща дяловете, чийто диапазон от дати се припокрива с [start, end]"""
+        start_iso, end_iso = start.isoformat(), end.isoformat()
+        return [part for part in self.manifest['partitions']
+                if part['min_date'] is not None
+                and part['min_date'] <= end_iso and part['max_date'] >= start_iso]
+
+    def _read_partition(self, part):
+        part_file = os.path.join(self.root, part['path'])
+        if self.manifest['format'] == 'parquet':
+            return pd.read_parquet(part_file)
+        return pd.read_csv(part_file, encoding='utf-8')
+
+    def read_range(self, start, end):
+        """Чете само припокриващите се дялове и връща редовете с End_Data в периода"""
+        frames = [self._read_partition(part) for part in self.partitions_for_range(start, end)]
+        if frames:
+            df = pd.concat(frames, ignore_index=True)
+        else:
+            df = pd.DataFrame(columns=[self.ROW_ID_COLUMN] + self.manifest['columns'])
+
+        # Запазваме оригиналния ред и номерация на редовете от източника
+        df = df.set_index(self.ROW_ID_COLUMN).sort_index()
+        df.index.name = None
+        df['End_Data_parsed'] = parse_end_data(df['End_Data'])
+        end_dates = df['End_Data_parsed'].dt.date
+        return df[(end_dates >= start) & (end_dates <= end)]
+
+    def read_all(self):
+        """Чете всички дялове (включително редовете без дата)"""
+        frames = [self._read_partition(part) for part in self.manifest['partitions']]
+        if not frames:
+            return pd.DataFrame(columns=self.manifest['columns'])
+        df = pd.concat(frames, ignore_index=True).set_index(self.ROW_ID_COLUMN).sort_index()
+        df.index.name = None
+        return df
+
+
+class SqliteStore:
+    """
+    Kasi_all като локална SQLite база за бързи заявки.
+
+    Зареждането е на части с executemany в големи транзакции (WAL,
+    synchronous=OFF по време на зареждането), а индексите се създават след
+    него. End_Data остава в оригиналния си вид, а End_Data_iso
+    (YYYY-MM-DD HH:MM:SS) е индексирана колона за заявки по период.
+    Индексират се още Phone и bulst. Таблицата _meta пази отпечатъка на
+    източника.
+    """
+
+    TABLE = 'Kasi_all'
+    DATE_COLUMN = 'End_Data_iso'
+    INDEXED_COLUMNS = ('End_Data_iso', 'Phone', 'bulst')
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    @staticmethod
+    def default_path(source_path):
+        return os.path.splitext(source_path)[0] + '.sqlite'
+
+    @classmethod
+    def for_source(cls, source_path):
+        return cls(cls.default_path(source_path))
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path)
+
+    def metadata(self):
+        if not os.path.exists(self.db_path):
+            return None
+        try:
+            with closing(self._connect()) as connection:
+                return dict(connection.execute("SELECT key, value FROM _meta").fetchall())
+        except sqlite3.Error:
+            return None
+
+    def is_current(self, fingerprint):
+        meta = self.metadata()
+        return bool(meta) and meta.get('source_size') == str(fingerprint[1]) \
+            and meta.get('source_mtime_ns') == str(fingerprint[2])
+
+    @staticmethod
+    def _sql_type(series):
+        if pd.api.types.is_integer_dtype(series.dtype):
+            return 'INTEGER'
+        if pd.api.types.is_float_dtype(series.dtype):
+            return 'REAL'
+        return 'TEXT'
+
+    def build(self, chunks, fingerprint, on_progress=None):
+        """Зарежда частите (DataFrame-и с поправена кодировка) в нова база и връща броя редове"""
+        temp_path = self.db_path + '.tmp'
+        for path in (temp_path, temp_path + '-wal', temp_path + '-shm'):
+            if os.path.exists(path):
+                os.unlink(path)
+
+        total_rows = 0
+        connection = sqlite3.connect(temp_path, isolation_level=None)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute("PRAGMA temp_store=MEMORY")
+            connection.execute("PRAGMA cache_size=-200000")
+
+            insert_sql = None
+            columns = None
+            for chunk in chunks:
+                chunk = chunk.drop(columns=['End_Data_parsed'], errors='ignore')
+                if insert_sql is None:
+                    columns = list(chunk.columns)
+                    if 'End_Data' not in columns:
+                        raise RuntimeError("Колона 'End_Data' не е намерена в таблицата!")
+                    column_defs = ', '.join(f'"{col}" {self._sql_type(chunk[col])}' for col in columns)
+                    connection.execute(f'CREATE TABLE "{self.TABLE}" ({column_defs}, "{self.DATE_COLUMN}" TEXT)')
+                    placeholders = ', '.join('?' for _ in range(len(columns) + 1))
+                    insert_sql = f'INSERT INTO "{self.TABLE}" VALUES ({placeholders})'
+
+                iso_dates = parse_end_data(chunk['End_Data']).dt.strftime('%Y-%m-%d %H:%M:%S')
+                values = chunk[columns].astype(object).where(chunk[columns].notna(), None)
+                values[self.DATE_COLUMN] = iso_dates.astype(object).where(iso_dates.notna(), None)
+
+                connection.execute("BEGIN")
+                connection.executemany(insert_sql, values.itertuples(index=False, name=None))
+                connection.execute("COMMIT")
+                total_rows += len(chunk)
+                if on_progress:
+                    on_progress(total_rows)
+
+            if insert_sql is None:
+                raise RuntimeError("Източникът е празен!")
+
+            connection.execute("BEGIN")
+            for col in self.INDEXED_COLUMNS:
+                if col in columns or col == self.DATE_COLUMN:
+                    connection.execute(f'CREATE INDEX "idx_{self.TABLE}_{col}" ON "{self.TABLE}" ("{col}")')
+            connection.execute("CREATE TABLE _meta (key TEXT PRIMARY KEY, value TEXT)")
+            connection.executemany("INSERT INTO _meta VALUES (?, ?)", [
+                ('source_path', fingerprint[0]),
+                ('source_size', str(fingerprint[1])),
+                ('source_mtime_ns', str(fingerprint[2])),
+                ('total_rows', str(total_rows)),
+                ('created', datetime.now().isoformat(timespec='seconds')),
+            ])
+            connection.execute("COMMIT")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            connection.execute("ANALYZE")
+        finally:
+            connection.close()
+
+        os.replace(temp_path, self.db_path)
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(temp_path + suffix):
+                os.unlink(temp_path + suffix)
+        return total_rows
+
+    @property
+    def total_rows(self):
+        return int((self.metadata() or {}).get('total_rows', 0))
+
+    def read_range(self, start, end):
+        """Индексирана заявка по End_Data_iso; индексът на резултата е позицията на реда в източника"""
+        low = start.strftime('%Y-%m-%d')
+        high = (end + timedelta(days=1)).strftime('%Y-%m-%d')
+        with closing(self._connect()) as connection:
+            df = pd.read_sql_query(
+                f'SELECT rowid - 1 AS _row_id, * FROM "{self.TABLE}" '
+                f'WHERE "{self.DATE_COLUMN}" >= ? AND "{self.DATE_COLUMN}" < ? ORDER BY rowid',
+                connection, params=(low, high))
+        df = df.set_index('_row_id').drop(columns=[self.DATE_COLUMN])
+        df.index.name = None
+        df['End_Data_parsed'] = parse_end_data(df['End_Data'])
+        return df
+
+
+class QueryResultCache:
+    """
+    LRU кеш на резултатите от филтриране по дати за текущата сесия.
+
+    Резултатите се пазят като дневни кофи (ден по End_Data) с ключ
+    (отпечатък на файла, колони, ден). Покритите дни от заявения период идват
+    от кеша, а се четат само липсващите подпериоди - след "тази седмица"
+    заявката "последните 10 дни" чете само първите три дни.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self._buckets = OrderedDict()   # (fingerprint, columns, day) -> (DataFrame, size)
+        self._covered = {}              # (fingerprint, columns) -> set от покрити дни
+        self._templates = {}            # (fingerprint, columns) -> празен DataFrame
+        self._total_rows = {}           # fingerprint -> общ брой редове в източника
+
+    @staticmethod
+    def _columns_key(columns):
+        return tuple(columns) if columns is not None else None
+
+    @staticmethod
+    def _days(start, end):
+        return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+    def missing_ranges(self, fingerprint, start, end, columns=None):
+        """Подпериодите [(от, до), ...] на [start, end], чиито дни ги няма в кеша"""
+        covered = self._covered.get((fingerprint, self._columns_key(columns)), ())
+        ranges = []
+        for day in self._days(start, end):
+            if day in covered:
+                continue
+            if ranges and ranges[-1][1] == day - timedelta(days=1):
+                ranges[-1] = (ranges[-1][0], day)
+            else:
+                ranges.append((day, day))
+        return ranges
+
+    def get(self, fingerprint, start, end, columns=None, load_missing=None):
+        """
+        Връща (DataFrame, общо редове) за периода. Без load_missing връща None,
+        ако периодът не е изцяло в кеша. С load_missing(подпериоди) -> (DataFrame,
+        общо редове) се зареждат само липсващите дни, а останалите са от кеша.
+        """
+        key = (fingerprint, self._columns_key(columns))
+        missing = self.missing_ranges(fingerprint, start, end, columns)
+        if missing and load_missing is None:
+            self.misses += 1
+            return None
+
+        frames = []
+        for day in self._days(start, end):
+            bucket_key = key + (day,)
+            if bucket_key in self._buckets:
+                self._buckets.move_to_end(bucket_key)
+                frames.append(self._buckets[bucket_key][0])
+
+        if not missing:
+            self.hits += 1
+        elif missing == [(start, end)]:
+            self.misses += 1
+        else:
+            self.partial_hits += 1
+        if missing:
+            loaded_df, total_rows = load_missing(missing)
+            self._store(key, [day for first, last in missing for day in self._days(first, last)],
+                        loaded_df, total_rows)
+            frames.append(loaded_df)
+
+        total_rows = self._total_rows.get(fingerprint, 0)
+        if not frames:
+            return self._templates[key].copy(), total_rows
+        if len(frames) == 1 and missing:
+            return frames[0], total_rows
+        # Връщаме редовете в оригиналния ред от файла
+        return pd.concat(frames).sort_index(), total_rows
+
+    def put(self, fingerprint, start, end, filtered_df, total_rows, columns=None):
+        """Разделя филтрирания резултат по дни и го записва в кеша"""
+        key = (fingerprint, self._columns_key(columns))
+        self._store(key, self._days(start, end), filtered_df, total_rows)
+
+    def _store(self, key, days, filtered_df, total_rows):
+        """Записва редовете на filtered_df в кофите на days (дни без редове също са покрити)"""
+        self._templates[key] = filtered_df.iloc[0:0]
+        self._total_rows[key[0]] = total_rows
+        covered = self._covered.setdefault(key, set())
+
+        groups = {}
+        if len(filtered_df):
+            for day, group in filtered_df.groupby(filtered_df['End_Data_parsed'].dt.date, sort=False):
+                groups[day] = group
+
+        for day in days:
+            bucket_key = key + (day,)
+            if bucket_key in self._buckets:
+                self._buckets.move_to_end(bucket_key)
+                continue
+            group = groups.get(day)
+            if group is not None:
+                size = int(group.memory_usage(index=True, deep=True).sum())
+                if size > self.max_bytes:
+                    continue
+                self._buckets[bucket_key] = (group, size)
+                self.current_bytes += size
+            covered.add(day)
+
+        self._evict()
+
+    def _evict(self):
+        """Премахва най-отдавна използваните кофи при превишен лимит на паметта"""
+        while self.current_bytes > self.max_bytes and self._buckets:
+            (fingerprint, columns, day), (_, size) = self._buckets.popitem(last=False)
+            self.current_bytes -= size
+            covered = self._covered.get((fingerprint, columns))
+            if covered is not None:
+                covered.discard(day)
+
+    def invalidate(self, file_path=None):
+        """Изчиства кеша изцяло или само за даден файл"""
+        if file_path is None:
+            self._buckets.clear()
+            self._covered.clear()
+            self._templates.clear()
+            self._total_rows.clear()
+            self.current_bytes = 0
+            return
+
+        path = os.path.abspath(file_path)
+        for bucket_key in [k for k in self._buckets if k[0][0] == path]:
+            self.current_bytes -= self._buckets.pop(bucket_key)[1]
+        for key in [k for k in self._covered if k[0][0] == path]:
+            del self._covered[key]
+            self._templates.pop(key, None)
+        for fingerprint in [f for f in self._total_rows if f[0] == path]:
+            del self._total_rows[fingerprint]
+
+
+def load_date_window(file_path, start, end, cache=None, file_type=None, runner=None, progress=None):
+    """
+    Връща (редове с End_Data в [start, end], общо редове) - от хранилището
+    с дялове или SQLite, ако е актуално, иначе чрез пълно зареждане на
+    източника. С cache (QueryResultCache) се четат само дните, които ги няма
+    в кеша. runner и progress се подават на load_source_dataframe.
+    """
+    fingerprint = file_fingerprint(file_path)
+
+    def load_ranges(ranges):
+        store = PartitionStore.for_source(file_path)
+        if not store.is_current(fingerprint):
+            store = SqliteStore.for_source(file_path)
+        if store.is_current(fingerprint):
+            frames = [store.read_range(first, last) for first, last in ranges]
+            return (frames[0] if len(frames) == 1 else pd.concat(frames)), store.total_rows
+
+        df = load_source_dataframe(file_path, file_type, runner, progress)
+        if 'End_Data' not in df.columns:
+            raise RuntimeError("Колона 'End_Data' не е намерена в таблицата!")
+        df['End_Data_parsed'] = parse_end_data(df['End_Data'])
+        end_dates = df['End_Data_parsed'].dt.date
+        mask = pd.Series(False, index=df.index)
+        for first, last in ranges:
+            mask |= (end_dates >= first) & (end_dates <= last)
+        return df[mask], len(df)
+
+    if cache is None:
+        return load_ranges([(start, end)])
+    return cache.get(fingerprint, start, end, load_missing=load_ranges)
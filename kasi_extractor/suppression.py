@@ -0,0 +1,262 @@
+"""
+Кой да не получава SMS: списъци за отказ (Bloom филтър) и история на известията.
+"""
+
+import json
+import os
+import time
+import math
+
+from .core import PANDAS_AVAILABLE, file_fingerprint, mix64, np, pd
+from .validation import normalize_phone_numbers
+from .messages import notification_keys
+
+
+# Възможни имена на колоната с телефона във файловете за отказ
+OPT_OUT_PHONE_COLUMNS = ('Phone', 'phone', 'Телефон', 'телефон', 'GSM', 'Mobile', 'Number')
+
+
+class BloomFilter:
+    """
+    Bloom филтър върху numpy битов масив (int64 ключове, двойно хеширане).
+    Отговор 'не' е сигурен, 'да' е грешен с вероятност около error_rate.
+    """
+
+    def __init__(self, bits, hash_count):
+        self.bits = bits
+        self.size = len(bits) * 8
+        self.hash_count = hash_count
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        size = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        hash_count = max(1, int(round(size / capacity * math.log(2))))
+        return cls(np.zeros((size + 7) // 8, dtype=np.uint8), hash_count)
+
+    def _positions(self, keys):
+        first = mix64(keys)
+        second = mix64(keys ^ np.int64(0x5BD1E995)) | np.uint64(1)
+        steps = np.arange(self.hash_count, dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            return (first[:, None] + steps[None, :] * second[:, None]) % np.uint64(self.size)
+
+    def add(self, keys):
+        positions = self._positions(np.asarray(keys, dtype=np.int64)).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                         (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8)))
+
+    def might_contain(self, keys):
+        positions = self._positions(np.asarray(keys, dtype=np.int64))
+        found = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return found.all(axis=1)
+
+
+class SuppressionList:
+    """
+    Списък с телефони, отказали SMS известия.
+
+    Номерата се пазят като сортиран уникален int64 масив (8 байта на номер)
+    и се търсят с np.searchsorted, така че анти-join-ът на цяла колона е
+    векторизиран. Bloom филтърът отсява повечето номера, които не са в
+    списъка, преди двоичното търсене. Списъкът може да се запише в .npz
+    файл (номера + Bloom + отпечатъци на изходните файлове) - само при
+    изрично зададен cache_path - и при следващо зареждане на същите файлове
+    се чете директно от него.
+    """
+
+    def __init__(self, phones, bloom=None, sources=()):
+        self.phones = phones
+        self.bloom = bloom
+        self.sources = list(sources)
+
+    def __len__(self):
+        return len(self.phones)
+
+    @staticmethod
+    def _source_fingerprints(paths):
+        return sorted(list(file_fingerprint(path)) for path in paths)
+
+    @staticmethod
+    def read_opt_out_file(path, chunksize=500000):
+        """Чете номерата от CSV (колона Phone/Телефон/..., иначе първата) или текстов файл"""
+        with open(path, 'r', encoding='utf-8-sig', errors='replace') as f:
+            first_line = f.readline()
+        separator = next((sep for sep in (';', '\t', ',') if sep in first_line), ',')
+        header = [name.strip().strip('"') for name in first_line.split(separator)]
+        column = next((name for name in OPT_OUT_PHONE_COLUMNS if name in header), None)
+        has_header = column is not None or not any(ch.isdigit() for ch in first_line)
+        parts = []
+        with pd.read_csv(path, sep=separator, header=0 if has_header else None, dtype=str,
+                         chunksize=chunksize, encoding='utf-8-sig', keep_default_na=False) as reader:
+            for chunk in reader:
+                values = chunk[column] if column is not None else chunk.iloc[:, 0]
+                parts.append(normalize_phone_numbers(values))
+        phones = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        return phones[phones >= 0]
+
+    @classmethod
+    def build(cls, paths, bloom=True, error_rate=0.01):
+        phones = [cls.read_opt_out_file(path) for path in paths]
+        phones = np.unique(np.concatenate(phones)) if phones else np.empty(0, dtype=np.int64)
+        bloom_filter = None
+        if bloom:
+            bloom_filter = BloomFilter.for_capacity(len(phones), error_rate)
+            bloom_filter.add(phones)
+        return cls(phones, bloom_filter, cls._source_fingerprints(paths))
+
+    def save(self, path):
+        arrays = {'phones': self.phones,
+                  'sources': np.array(json.dumps(self.sources))}
+        if self.bloom is not None:
+            arrays['bloom_bits'] = self.bloom.bits
+            arrays['bloom_hashes'] = np.array(self.bloom.hash_count)
+        temp_path = path + '.tmp.npz'
+        np.savez(temp_path, **arrays)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def open(cls, path):
+        with np.load(path) as data:
+            bloom = None
+            if 'bloom_bits' in data:
+                bloom = BloomFilter(data['bloom_bits'], int(data['bloom_hashes']))
+            return cls(data['phones'], bloom, json.loads(str(data['sources'])))
+
+    @classmethod
+    def load(cls, paths, cache_path=None, bloom=True):
+        """
+        Зарежда файловете за отказ. С cache_path списъкът се чете от този .npz
+        кеш, ако изходните файлове не са променяни, и се записва в него след
+        изграждане; без cache_path до файловете на потребителя не се пише нищо.
+        """
+        paths = list(paths)
+        if len(paths) == 1 and paths[0].endswith('.npz'):
+            return cls.open(paths[0])
+        if cache_path is None:
+            return cls.build(paths, bloom)
+        if os.path.exists(cache_path):
+            try:
+                cached = cls.open(cache_path)
+                if cached.sources == cls._source_fingerprints(paths):
+                    return cached
+            except (OSError, ValueError, KeyError):
+                pass
+        suppression = cls.build(paths, bloom)
+        try:
+            suppression.save(cache_path)
+        except OSError:
+            pass
+        return suppression
+
+    def contains(self, phones):
+        """Булев масив - кои от нормализираните номера (int64) са в списъка"""
+        phones = np.asarray(phones, dtype=np.int64)
+        result = np.zeros(len(phones), dtype=bool)
+        if len(self.phones) == 0:
+            return result
+        candidates = np.flatnonzero(phones >= 0)
+        if self.bloom is not None and len(candidates):
+            candidates = candidates[self.bloom.might_contain(phones[candidates])]
+        positions = np.searchsorted(self.phones, phones[candidates])
+        positions = np.minimum(positions, len(self.phones) - 1)
+        result[candidates] = self.phones[positions] == phones[candidates]
+        return result
+
+    def anti_join(self, df, column='Phone'):
+        """Премахва редовете с телефон от списъка; връща (останалите редове, брой премахнати)"""
+        if column not in df.columns:
+            raise RuntimeError(f"Колона '{column}' липсва - списъкът за отказ не може да се приложи!")
+        suppressed = self.contains(normalize_phone_numbers(df[column]))
+        return df[~suppressed], int(suppressed.sum())
+
+
+class NotificationHistory:
+    """
+    История на изпратените известия - append-only двоичен дневник.
+
+    Всеки запис е 16 байта (ключ int64, време int64); ключът е от id-то на
+    съобщението (Phone|Number_EKA|End_Data), така че същият клиент,
+    устройство и дата се разпознават между отделните пускания, дори когато
+    периодите се застъпват. Записите се добавят хронологично, затова
+    прозорецът на паузата е краят на файла - намира се с двоично търсене
+    (memmap, без четене на целия файл), а ключовете му отиват в хеш индекс
+    (pd.Index). Проверката на всеки ред е O(1), независимо от размера на
+    историята.
+    """
+
+    RECORD = np.dtype([('key', '<i8'), ('notified_at', '<i8')]) if PANDAS_AVAILABLE else None
+    FILE_NAME = 'notification_history.bin'
+    DEFAULT_COOLDOWN_DAYS = 30
+
+    def __init__(self, path):
+        self.path = path
+        self._recent = {}
+
+    @classmethod
+    def default_path(cls, source_path):
+        """Една история за всички версии на базата в същата директория"""
+        return os.path.join(os.path.dirname(os.path.abspath(source_path)), cls.FILE_NAME)
+
+    @classmethod
+    def for_source(cls, source_path):
+        return cls(cls.default_path(source_path))
+
+    def _size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def __len__(self):
+        return self._size() // self.RECORD.itemsize
+
+    def _records(self):
+        count = len(self)
+        if count == 0:
+            return np.empty(0, dtype=self.RECORD)
+        return np.memmap(self.path, dtype=self.RECORD, mode='r', shape=(count,))
+
+    def record(self, keys, notified_at=None):
+        """Добавя известията в края на дневника (времето не намалява - дневникът остава сортиран)"""
+        keys = np.asarray(keys, dtype=np.int64)
+        if len(keys) == 0:
+            return 0
+        size = self._size()
+        if size % self.RECORD.itemsize:
+            # Недописан запис след срив
+            with open(self.path, 'r+b') as f:
+                f.truncate(size - size % self.RECORD.itemsize)
+        records = self._records()
+        last = int(records['notified_at'][-1]) if len(records) else 0
+        del records
+
+        entries = np.empty(len(keys), dtype=self.RECORD)
+        entries['key'] = keys
+        entries['notified_at'] = max(int(notified_at if notified_at is not None else time.time()), last)
+        with open(self.path, 'ab') as f:
+            f.write(entries.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._recent.clear()
+        return len(keys)
+
+    def record_rows(self, df):
+        return self.record(notification_keys(df))
+
+    def recent(self, cooldown_days, now=None):
+        """Хеш индекс на ключовете, известени през последните cooldown_days дни"""
+        since = int((now if now is not None else time.time()) - cooldown_days * 86400)
+        cache_key = (cooldown_days, since // 60, self._size())
+        if cache_key in self._recent:
+            return self._recent[cache_key]
+        records = self._records()
+        start = np.searchsorted(records['notified_at'], since, side='left')
+        index = pd.Index(pd.unique(np.array(records['key'][start:])))
+        del records
+        self._recent = {cache_key: index}
+        return index
+
+    def exclude_recent(self, df, cooldown_days=DEFAULT_COOLDOWN_DAYS):
+        """Премахва редовете, известени в паузата; връща (останалите, брой премахнати)"""
+        if len(df) == 0:
+            return df, 0
+        notified = self.recent(cooldown_days).get_indexer(notification_keys(df)) >= 0
+        return df[~notified], int(notified.sum())
@@ -0,0 +1,565 @@
+"""
+Изходни формати (CSV, XLSX, JSON, NDJSON, Parquet), разделяне на части и
+запис в няколко формата от едно минаване.
+"""
+
+from datetime import datetime
+from collections import OrderedDict
+import json
+import os
+import threading
+import queue
+import concurrent.futures
+import time
+import re
+import zipfile
+
+from .core import (PYARROW_AVAILABLE, REQUIRED_COLUMNS, column_as_text, concat_text, np, pa, pd, pq,
+                   quoted_csv_header, quoted_csv_series, utf8_lengths)
+
+
+class QuotedCsvWriter:
+    """Записва текстови DataFrame части като "a","b" редове (заглавието - веднъж)"""
+
+    def __init__(self, output_path, columns=REQUIRED_COLUMNS):
+        self.output_path = output_path
+        self.columns = list(columns)
+        self.rows = 0
+        self._file = open(output_path, 'wb')
+        self._header_written = False
+
+    @staticmethod
+    def encode(text_df):
+        """Текстът на всеки ред така, както ще бъде записан (за SplitWriter)"""
+        return quoted_csv_series(text_df) + '\n'
+
+    @staticmethod
+    def overhead_bytes(columns):
+        """Байтове във файла извън редовете - заглавието"""
+        return len((quoted_csv_header(columns) + '\n').encode('utf-8'))
+
+    def write_encoded(self, encoded, columns):
+        if not self._header_written:
+            self._file.write((quoted_csv_header(columns) + '\n').encode('utf-8'))
+            self._header_written = True
+        if len(encoded):
+            self._file.write(concat_text(encoded))
+        self.rows += len(encoded)
+
+    def write(self, text_df):
+        self.write_encoded(self.encode(text_df) if len(text_df) else pd.Series([], dtype=str), text_df.columns)
+
+    def close(self):
+        if not self._header_written:
+            self._file.write((quoted_csv_header(self.columns) + '\n').encode('utf-8'))
+        self._file.close()
+
+
+class XlsxWriter:
+    """
+    Записва текстови DataFrame части в .xlsx като поток: XML-ът на листа се
+    сглобява векторно (както to_quoted_csv_lines) и се пише направо в ZIP
+    архива, без модел на клетките в паметта. При MAX_ROWS реда (лимитът на
+    Excel, със заглавието) започва нов лист "Клиенти 2", "Клиенти 3" и т.н.
+    Клетките са inline низове - всички колони се записват като текст.
+    """
+
+    MAX_ROWS = 1_048_576
+    SHEET_TITLE = 'Клиенти'
+    MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+    REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+    PACKAGE_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+    # Контролните знаци са невалидни в XML
+    ILLEGAL_XML_RE = r'[\x00-\x08\x0b\x0c\x0e-\x1f]'
+
+    def __init__(self, output_path, columns=REQUIRED_COLUMNS):
+        self.output_path = output_path
+        self.columns = list(columns)
+        self.rows = 0
+        self.sheets = 0
+        self._zip = zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+        self._sheet = None
+        self._sheet_rows = 0
+
+    @staticmethod
+    def column_letter(index):
+        """0 -> A, 25 -> Z, 26 -> AA"""
+        letters = ''
+        index += 1
+        while index:
+            index, remainder = divmod(index - 1, 26)
+            letters = chr(ord('A') + remainder) + letters
+        return letters
+
+    @classmethod
+    def _escape(cls, text):
+        return (text.str.replace(cls.ILLEGAL_XML_RE, '', regex=True)
+                .str.replace('&', '&amp;', regex=False)
+                .str.replace('<', '&lt;', regex=False)
+                .str.replace('>', '&gt;', regex=False))
+
+    def _rows_xml(self, text_df, first_row):
+        """XML на редовете first_row, first_row+1, ... (номерата са 1-базирани)"""
+        numbers = pd.Series(np.arange(first_row, first_row + len(text_df)), index=text_df.index).astype(str)
+        xml = '<row r="' + numbers + '">'
+        for position, column in enumerate(text_df.columns):
+            cell = self._escape(column_as_text(text_df[column]))
+            xml = (xml + f'<c r="{self.column_letter(position)}' + numbers +
+                   '" t="inlineStr"><is><t xml:space="preserve">' + cell + '</t></is></c>')
+        return concat_text(xml + '</row>')
+
+    def _new_sheet(self, columns):
+        self._close_sheet()
+        self.sheets += 1
+        self._sheet = self._zip.open(f'xl/worksheets/sheet{self.sheets}.xml', 'w', force_zip64=True)
+        self._sheet.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                          f'<worksheet xmlns="{self.MAIN_NS}"><sheetData>'.encode('utf-8'))
+        self._sheet.write(self._rows_xml(pd.DataFrame([list(columns)], columns=list(columns)), 1))
+        self._sheet_rows = 1
+
+    def _close_sheet(self):
+        if self._sheet is not None:
+            self._sheet.write(b'</sheetData></worksheet>')
+            self._sheet.close()
+            self._sheet = None
+
+    def write(self, text_df):
+        start = 0
+        while start < len(text_df) or self._sheet is None:
+            if self._sheet is None or self._sheet_rows >= self.MAX_ROWS:
+                self._new_sheet(text_df.columns)
+            part = text_df.iloc[start:start + self.MAX_ROWS - self._sheet_rows]
+            self._sheet.write(self._rows_xml(part, self._sheet_rows + 1))
+            self._sheet_rows += len(part)
+            start += len(part)
+        self.rows += len(text_df)
+
+    def close(self):
+        if self._sheet is None:
+            self._new_sheet(self.columns)
+        self._close_sheet()
+        sheet_ids = range(1, self.sheets + 1)
+        names = [self.SHEET_TITLE if i == 1 else f"{self.SHEET_TITLE} {i}" for i in sheet_ids]
+        header = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        self._zip.writestr('[Content_Types].xml', header +
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>' +
+            ''.join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+                    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                    for i in sheet_ids) + '</Types>')
+        self._zip.writestr('_rels/.rels', header +
+            f'<Relationships xmlns="{self.PACKAGE_REL_NS}"><Relationship Id="rId1" '
+            f'Type="{self.REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+        self._zip.writestr('xl/workbook.xml', header +
+            f'<workbook xmlns="{self.MAIN_NS}" xmlns:r="{self.REL_NS}"><sheets>' +
+            ''.join(f'<sheet name="{name}" sheetId="{i}" r:id="rId{i}"/>' for i, name in zip(sheet_ids, names)) +
+            '</sheets></workbook>')
+        self._zip.writestr('xl/_rels/workbook.xml.rels', header +
+            f'<Relationships xmlns="{self.PACKAGE_REL_NS}">' +
+            ''.join(f'<Relationship Id="rId{i}" Type="{self.REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+                    for i in sheet_ids) + '</Relationships>')
+        self._zip.close()
+
+
+def json_string_literals(text):
+    """
+    JSON литерали ("...") за текстова колона - същите като json.dumps(...,
+    ensure_ascii=False), но векторно. Само стойностите с контролни знаци
+    минават през json.dumps.
+    """
+    literals = text.str.replace('\\', '\\\\', regex=False).str.replace('"', '\\"', regex=False)
+    control = text.str.contains(r'[\x00-\x1f]', regex=True).to_numpy(dtype=bool)
+    if control.any():
+        literals = literals.astype(object)
+        literals[control] = [json.dumps(value, ensure_ascii=False)[1:-1] for value in text[control]]
+    return '"' + literals + '"'
+
+
+class JsonWriter:
+    """
+    Записва текстови DataFrame части като JSON масив от обекти - същият
+    формат като json.dump(..., ensure_ascii=False, indent=2) на 'Запиши JSON',
+    но на части, без да държи всички обекти в паметта.
+    """
+
+    def __init__(self, output_path, columns=REQUIRED_COLUMNS):
+        self.output_path = output_path
+        self.columns = list(columns)
+        self.rows = 0
+        self._file = open(output_path, 'wb')
+
+    @staticmethod
+    def _objects(text_df):
+        keys = [json.dumps(str(col), ensure_ascii=False) for col in text_df.columns]
+        objects = None
+        for key, column in zip(keys, text_df.columns):
+            member = f'    {key}: ' + json_string_literals(column_as_text(text_df[column]))
+            objects = member if objects is None else objects + ',\n' + member
+        return '  {\n' + objects + '\n  }'
+
+    @classmethod
+    def encode(cls, text_df):
+        """Текстът на всеки обект така, както ще бъде записан (за SplitWriter)"""
+        return ',\n' + cls._objects(text_df)
+
+    @staticmethod
+    def overhead_bytes(columns):
+        # '[\n' заема мястото на запетаята пред първия обект, остава '\n]'
+        return 2
+
+    def write_encoded(self, encoded, columns=None):
+        if len(encoded) == 0:
+            return
+        data = memoryview(concat_text(encoded))
+        if self.rows == 0:
+            # Първият обект започва масива вместо да е след запетая
+            self._file.write(b'[\n')
+            data = data[2:]
+        self._file.write(data)
+        self.rows += len(encoded)
+
+    def write(self, text_df):
+        if len(text_df):
+            self.write_encoded(self.encode(text_df))
+
+    def close(self):
+        self._file.write(b'\n]' if self.rows else b'[]')
+        self._file.close()
+
+
+class NdjsonWriter(JsonWriter):
+    """По един JSON обект на ред (NDJSON) - за зареждане в други системи на части"""
+
+    @staticmethod
+    def _objects(text_df):
+        members = [json.dumps(str(col), ensure_ascii=False) + ': ' + json_string_literals(column_as_text(text_df[col]))
+                   for col in text_df.columns]
+        objects = members[0]
+        for member in members[1:]:
+            objects = objects + ', ' + member
+        return '{' + objects + '}'
+
+    @classmethod
+    def encode(cls, text_df):
+        return cls._objects(text_df) + '\n'
+
+    @staticmethod
+    def overhead_bytes(columns):
+        return 0
+
+    def write_encoded(self, encoded, columns=None):
+        if len(encoded):
+            self._file.write(concat_text(encoded))
+            self.rows += len(encoded)
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetTableWriter:
+    """Записва текстови DataFrame части в един Parquet файл (по една row group на част)"""
+
+    def __init__(self, output_path, columns=REQUIRED_COLUMNS):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError("pyarrow не е инсталиран - Parquet не е достъпен!")
+        self.output_path = output_path
+        self.columns = list(columns)
+        self.rows = 0
+        self._writer = None
+
+    def _table(self, text_df):
+        return pa.table({str(col): pa.array(column_as_text(text_df[col]), type=pa.string())
+                         for col in text_df.columns})
+
+    def write(self, text_df):
+        table = self._table(text_df)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.output_path, table.schema)
+        self._writer.write_table(table)
+        self.rows += len(text_df)
+
+    def close(self):
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.output_path, self._table(pd.DataFrame(columns=self.columns)).schema)
+        self._writer.close()
+
+
+# Разширение на изходния файл -> писач (за CSV е и всичко непознато)
+OUTPUT_WRITERS = {
+    '.csv': QuotedCsvWriter,
+    '.xlsx': XlsxWriter,
+    '.json': JsonWriter,
+    '.ndjson': NdjsonWriter,
+    '.jsonl': NdjsonWriter,
+    '.parquet': ParquetTableWriter,
+}
+
+
+def open_table_writer(output_path, columns=REQUIRED_COLUMNS, split=None):
+    """
+    Писач за изходния файл според разширението (.csv, .xlsx, .json, .ndjson,
+    .parquet). split (речник с max_rows/max_bytes/partition_by) връща
+    SplitWriter, който разделя изхода на номерирани части.
+    """
+    if split:
+        return SplitWriter(output_path, columns, **split)
+    extension = os.path.splitext(output_path)[1].lower()
+    return OUTPUT_WRITERS.get(extension, QuotedCsvWriter)(output_path, columns)
+
+
+def parse_byte_size(text):
+    """'10MB', '500k', '2.5 MB' или число -> байтове (int); празно -> None"""
+    text = str(text).strip().upper().replace(' ', '')
+    if not text:
+        return None
+    multipliers = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024 ** 2, 'MB': 1024 ** 2, 'G': 1024 ** 3, 'GB': 1024 ** 3}
+    match = re.fullmatch(r'(\d+(?:[.,]\d+)?)([KMG]?B?)', text)
+    if not match:
+        raise ValueError(f"Невалиден размер: {text}")
+    size = int(float(match.group(1).replace(',', '.')) * multipliers[match.group(2)])
+    if size <= 0:
+        raise ValueError(f"Размерът трябва да е положителен: {text}")
+    return size
+
+
+class SplitWriter:
+    """
+    Разделя изхода на номерирани части (klienti_001.csv, klienti_002.csv, ...)
+    за лимитите на SMS шлюзовете - до max_rows реда и/или до max_bytes байта
+    на файл. С partition_by всяка стойност на колоната (напр. Ime_Firma) има
+    свои части (klienti_<стойност>_001.csv). Частите от една порция се пишат
+    паралелно, а накрая до тях се записва манифест със списъка на
+    частите и броя редове във всяка (<изход>.manifest.json, напр.
+    klienti.csv.manifest.json).
+
+    Размерът се смята точно по байтовете на всеки ред, затова max_bytes е
+    възможен само за текстовите формати (CSV, JSON, NDJSON); XLSX и Parquet
+    са компресирани и за тях се разделя само по редове. Ред, по-голям от
+    max_bytes, остава сам в своя част.
+    """
+
+    MAX_OPEN_PARTS = 32
+
+    def __init__(self, output_path, columns=REQUIRED_COLUMNS, max_rows=None, max_bytes=None,
+                 partition_by=None, workers=4):
+        extension = os.path.splitext(output_path)[1].lower()
+        self.writer_class = OUTPUT_WRITERS.get(extension, QuotedCsvWriter)
+        if max_bytes and not hasattr(self.writer_class, 'encode'):
+            raise RuntimeError("Разделянето по размер е възможно само за CSV, JSON и NDJSON - "
+                               "за XLSX и Parquet задайте максимален брой редове")
+        if max_rows is not None and max_rows <= 0:
+            raise ValueError("Максималният брой редове трябва да е положителен")
+        if partition_by is not None and partition_by not in list(columns):
+            raise ValueError(f"Колоната за разделяне '{partition_by}' не е сред изходните колони")
+        self.output_path = output_path
+        self.columns = list(columns)
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.partition_by = partition_by
+        self.manifest_path = output_path + '.manifest.json'
+        self.parts = []
+        self._open = OrderedDict()
+        self._numbers = {}
+        self._closing = []
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers))
+
+    @property
+    def rows(self):
+        return sum(part['rows'] for part in self.parts)
+
+    def _part_path(self, key):
+        base, extension = os.path.splitext(self.output_path)
+        if self.partition_by is not None:
+            name = re.sub(r'[^\w\-]+', '_', str(key)).strip('_')[:60] or 'празно'
+            base = f"{base}_{name}"
+        # Номерацията е по името на файла - две стойности с еднакво
+        # "почистено" име продължават една и съща поредица
+        number = self._numbers[base] = self._numbers.get(base, 0) + 1
+        return f"{base}_{number:03d}{extension}"
+
+    def _open_part(self, key):
+        if len(self._open) >= self.MAX_OPEN_PARTS:
+            # Най-отдавна ползваната стойност се затваря; следващите ѝ редове
+            # отиват в нова част, за да не се надвиши лимитът на отворени файлове
+            _, state = self._open.popitem(last=False)
+            self._closing.append(state)
+        path = self._part_path(key)
+        entry = {'file': os.path.basename(path), 'key': key, 'rows': 0}
+        self.parts.append(entry)
+        state = {'writer': self.writer_class(path, self.columns), 'entry': entry,
+                 'bytes': self.writer_class.overhead_bytes(self.columns) if self.max_bytes else 0,
+                 'slices': []}
+        self._open[key] = state
+        return state
+
+    def _assign(self, key, text_df):
+        """Разпределя редовете на една стойност по части според лимитите"""
+        encoded = self.writer_class.encode(text_df) if hasattr(self.writer_class, 'encode') else None
+        sizes = utf8_lengths(encoded) if self.max_bytes else None
+        start, total = 0, len(text_df)
+        while start < total:
+            state = self._open.get(key) or self._open_part(key)
+            self._open.move_to_end(key)
+            stop = total if self.max_rows is None else min(total, start + self.max_rows - state['entry']['rows'])
+            if sizes is not None:
+                used = np.cumsum(sizes[start:stop])
+                fit = int(np.searchsorted(used, self.max_bytes - state['bytes'], side='right'))
+                if fit == 0 and state['entry']['rows'] == 0:
+                    fit = 1
+                stop = start + fit
+                if fit:
+                    state['bytes'] += int(used[fit - 1])
+            if stop > start:
+                part = encoded.iloc[start:stop] if encoded is not None else text_df.iloc[start:stop]
+                state['slices'].append(part)
+                state['entry']['rows'] += stop - start
+            if stop < total:
+                # Частта е пълна - затваря се след записа на порцията
+                self._closing.append(self._open.pop(key))
+            start = stop
+
+    def _flush(self, states):
+        def write_slices(state):
+            writer = state['writer']
+            for part in state['slices']:
+                if hasattr(writer, 'write_encoded'):
+                    writer.write_encoded(part, self.columns)
+                else:
+                    writer.write(part)
+            state['slices'] = []
+
+        def close(state):
+            write_slices(state)
+            state['writer'].close()
+            state['entry']['bytes'] = os.path.getsize(state['writer'].output_path)
+
+        closing, self._closing = self._closing, []
+        futures = [self._executor.submit(write_slices, state) for state in states if state['slices']]
+        futures += [self._executor.submit(close, state) for state in closing]
+        for future in futures:
+            future.result()
+
+    def write(self, text_df):
+        if len(text_df) == 0:
+            return
+        if self.partition_by is None:
+            self._assign(None, text_df)
+        else:
+            keys = column_as_text(text_df[self.partition_by]).fillna('')
+            for key, group in text_df.groupby(keys, sort=False):
+                self._assign(key, group)
+        self._flush(list(self._open.values()))
+
+    def close(self):
+        try:
+            if not self.parts and self.partition_by is None:
+                self._open_part(None)
+            self._closing.extend(self._open.values())
+            self._open.clear()
+            self._flush([])
+        finally:
+            self._executor.shutdown()
+        manifest = {
+            'output': os.path.basename(self.output_path),
+            'max_rows': self.max_rows,
+            'max_bytes': self.max_bytes,
+            'partition_by': self.partition_by,
+            'total_rows': self.rows,
+            'parts': self.parts,
+            'created': datetime.now().isoformat(timespec='seconds'),
+        }
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+class FanOutWriter:
+    """
+    Праща всяка част към няколко писача (напр. CSV + JSON + Parquet) при едно
+    четене на данните. С threaded=True всеки писач има своя нишка и опашка,
+    така че общото време е колкото на най-бавния, а не сумата. Грешка в
+    някой писач се вдига от close(); останалите се довършват.
+    """
+
+    def __init__(self, writers, threaded=True, maxsize=4):
+        self.writers = list(writers)
+        self.threaded = threaded and len(self.writers) > 1
+        self.writer_seconds = {writer.output_path: 0.0 for writer in self.writers}
+        self._errors = []
+        self._queues = []
+        self._threads = []
+        if self.threaded:
+            for writer in self.writers:
+                work = queue.Queue(maxsize=maxsize)
+                thread = threading.Thread(target=self._drain, args=(writer, work), daemon=True)
+                thread.start()
+                self._queues.append(work)
+                self._threads.append(thread)
+
+    @property
+    def output_path(self):
+        return self.writers[0].output_path
+
+    @property
+    def rows(self):
+        return self.writers[0].rows
+
+    def _timed(self, writer, method, *args):
+        started = time.perf_counter()
+        try:
+            method(*args)
+        finally:
+            self.writer_seconds[writer.output_path] += time.perf_counter() - started
+
+    def _drain(self, writer, work):
+        failed = False
+        while True:
+            chunk = work.get()
+            if chunk is None:
+                break
+            if failed:
+                continue
+            try:
+                self._timed(writer, writer.write, chunk)
+            except Exception as e:
+                failed = True
+                self._errors.append(e)
+        try:
+            self._timed(writer, writer.close)
+        except Exception as e:
+            self._errors.append(e)
+
+    def write(self, text_df):
+        if self._errors:
+            raise self._errors[0]
+        if self.threaded:
+            for work in self._queues:
+                work.put(text_df)
+        else:
+            for writer in self.writers:
+                self._timed(writer, writer.write, text_df)
+
+    def close(self):
+        if self.threaded:
+            for work in self._queues:
+                work.put(None)
+            for thread in self._threads:
+                thread.join()
+        else:
+            for writer in self.writers:
+                try:
+                    self._timed(writer, writer.close)
+                except Exception as e:
+                    self._errors.append(e)
+        if self._errors:
+            raise self._errors[0]
+
+
+def open_table_writers(output_paths, columns=REQUIRED_COLUMNS, threaded=True, split=None):
+    """Един писач за един път или FanOutWriter за няколко (split - виж open_table_writer)"""
+    if isinstance(output_paths, str):
+        return open_table_writer(output_paths, columns, split)
+    writers = [open_table_writer(path, columns, split) for path in output_paths]
+    return writers[0] if len(writers) == 1 else FanOutWriter(writers, threaded)
@@ -6,51 +6,188 @@ Kasi Extractor v2.0 - GUI Приложение за извличане на да
 from tkinter import ttk, filedialog, messagebox
 from datetime import datetime, date
 import tkinter as tk
-import json
 import csv
 import sys
-import io
 import os
 import subprocess
-import tempfile
-import platform
-
-try:
-    import pandas as pd
-    PANDAS_AVAILABLE = True
-except ImportError:
-    PANDAS_AVAILABLE = False
-
-# Проверка дали сме на Windows и имаме mdbtools
-IS_WINDOWS = platform.system().lower() == 'windows'
-MDBTOOLS_AVAILABLE = False
-
-# Проверяваме дали mdbtools са налични в системата
-try:
-    if IS_WINDOWS:
-        # На Windows проверяваме с where команда
-        result = subprocess.run(['where', 'mdb-ver'], 
-                              capture_output=True, text=True, timeout=10)
-        MDBTOOLS_AVAILABLE = result.returncode == 0
-    else:
-        # На Linux проверяваме с which
-        result = subprocess.run(['which', 'mdb-ver'], 
-                              capture_output=True, text=True, timeout=5)
-        MDBTOOLS_AVAILABLE = result.returncode == 0
-        
-except (subprocess.TimeoutExpired, FileNotFoundError, subprocess.SubprocessError):
-    MDBTOOLS_AVAILABLE = False
+import shutil
+import threading
+import time
+
+from kasi_extractor.core import (PANDAS_AVAILABLE, PYARROW_AVAILABLE, REQUIRED_COLUMNS, compile_column_plan,
+                                 file_fingerprint, fix_dataframe_encoding, fix_encoding_utf8_to_windows1251,
+                                 pd, project_columns, to_quoted_csv_lines)
+from kasi_extractor.progress import ProgressTracker, format_progress
+from kasi_extractor.sources import (IS_WINDOWS, MDBTOOLS_AVAILABLE, MdbToolsRunner, OperationCancelled,
+                                    iter_source_chunks, load_source_dataframe)
+from kasi_extractor.writers import (JsonWriter, XlsxWriter, open_table_writer, open_table_writers,
+                                    parse_byte_size)
+from kasi_extractor.validation import VALIDATION_COLUMN, validate_clients
+from kasi_extractor.messages import DEFAULT_SMS_TEMPLATE, MessageTemplate, estimate_sms_cost, render_messages
+from kasi_extractor.suppression import NotificationHistory, SuppressionList
+from kasi_extractor.extraction import export_table, extract_date_range, load_extraction_spec
+from kasi_extractor.profiling import (PROFILE_PROBLEM_FIELDS, PROFILE_REPORT_FIELDS, profile_source,
+                                      write_profile_report)
+from kasi_extractor.storage import PartitionStore, QueryResultCache, SqliteStore, load_date_window
+from kasi_extractor.indexes import LookupIndex, TrigramIndex
+from kasi_extractor.scheduling import (DEFAULT_WAVE_OFFSETS, compute_notification_waves, wave_window,
+                                       write_notification_waves)
+from kasi_extractor.dispatch import SmsDispatcher
+from kasi_extractor.preview import GridSource
+from kasi_extractor.cli import run_cli
+
+
+class TkProgressSink:
+    """
+    Приемник за GUI - показва напредъка в ttk.Progressbar и статус бара.
+    Ако е извикан от работна нишка (mdb-export), запазва последното
+    състояние и то се рисува от flush() в главната нишка.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._pending = None
+
+    def __call__(self, progress):
+        if threading.current_thread() is threading.main_thread():
+            self._render(progress)
+        else:
+            self._pending = progress
+
+    def flush(self):
+        progress, self._pending = self._pending, None
+        if progress is not None:
+            self._render(progress)
+
+    def _render(self, progress):
+        bar = self.app.progress_bar
+        if progress['fraction'] is None:
+            bar.config(mode='indeterminate')
+            bar.step(5)
+        else:
+            bar.config(mode='determinate', maximum=100)
+            bar['value'] = progress['fraction'] * 100
+        self.app.update_status_bar(format_progress(progress))
+
+
+class VirtualGrid:
+    """
+    ttk.Treeview, който показва милиони редове: в дървото има само толкова
+    елемента, колкото реда се виждат, а скролбарът е свързан с номера на
+    първия видим ред. Клик върху заглавие на колона сортира (▲/▼).
+    """
+
+    def __init__(self, parent, df, height=20):
+        self.source = GridSource(df)
+        self.height = height
+        self.top = 0
+
+        self.frame = ttk.Frame(parent)
+        self.frame.columnconfigure(0, weight=1)
+        self.frame.rowconfigure(0, weight=1)
+
+        self.tree = ttk.Treeview(self.frame, columns=self.source.columns, show="headings",
+                                 height=height, selectmode="browse")
+        for col in self.source.columns:
+            self.tree.heading(col, text=col, command=lambda c=col: self.toggle_sort(c))
+            self.tree.column(col, width=110, stretch=False)
+
+        self.y_scroll = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        x_scroll = ttk.Scrollbar(self.frame, orient=tk.HORIZONTAL, command=self.tree.xview)
+        self.tree.configure(xscrollcommand=x_scroll.set)
+        self.tree.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.W, tk.E))
+        self.y_scroll.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        x_scroll.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        self.info_label = ttk.Label(self.frame, text="", foreground="gray")
+        self.info_label.grid(row=2, column=0, sticky=tk.W, pady=(3, 0))
+
+        for sequence, delta in (('<Button-4>', -3), ('<Button-5>', 3), ('<Up>', -1), ('<Down>', 1),
+                                ('<Prior>', -height), ('<Next>', height)):
+            self.tree.bind(sequence, lambda e, d=delta: self.scroll_to(self.top + d) or "break")
+        self.tree.bind('<MouseWheel>', self.on_mousewheel)
+        self.tree.bind('<Home>', lambda e: self.scroll_to(0) or "break")
+        self.tree.bind('<End>', lambda e: self.scroll_to(len(self.source)) or "break")
+        self.render()
+
+    def grid(self, **kwargs):
+        self.frame.grid(**kwargs)
+
+    def scroll_to(self, top):
+        top = max(0, min(top, len(self.source) - self.height))
+        if top != self.top:
+            self.top = top
+            self.render()
+
+    def on_mousewheel(self, event):
+        # Windows дава кратни на 120, macOS - малки стойности
+        notches = event.delta // 120 if abs(event.delta) >= 120 else (event.delta > 0) - (event.delta < 0)
+        self.scroll_to(self.top - 3 * notches)
+        return "break"
+
+    def on_scrollbar(self, action, value, unit=None):
+        """Команда на скролбара: ('moveto', дял) или ('scroll', n, 'units'|'pages')"""
+        if action == 'moveto':
+            self.scroll_to(int(float(value) * len(self.source)))
+        elif action == 'scroll':
+            step = self.height if unit == 'pages' else 1
+            self.scroll_to(self.top + int(value) * step)
+
+    def render(self):
+        """Попълва видимите елементи на дървото с редовете от top нататък"""
+        rows = self.source.rows(self.top, self.height)
+        items = self.tree.get_children()
+        for slot, (label, values) in enumerate(rows):
+            if slot < len(items):
+                self.tree.item(items[slot], text=str(label), values=values)
+            else:
+                self.tree.insert('', tk.END, text=str(label), values=values)
+        if len(items) > len(rows):
+            self.tree.delete(*items[len(rows):])
+
+        total = len(self.source)
+        if total:
+            self.y_scroll.set(self.top / total, min(self.top + self.height, total) / total)
+            self.info_label.config(text=f"Редове {self.top + 1:,}-{self.top + len(rows):,} от {total:,}")
+        else:
+            self.y_scroll.set(0, 1)
+            self.info_label.config(text="Няма редове")
+
+    def toggle_sort(self, column):
+        """Сортира по колоната; втори клик обръща посоката"""
+        descending = self.source.sort_column == column and not self.source.descending
+        self.info_label.config(text="Сортиране...")
+        self.frame.update_idletasks()
+        self.source.sort_by(column, descending)
+        for col in self.source.columns:
+            mark = (' ▼' if descending else ' ▲') if col == column else ''
+            self.tree.heading(col, text=col + mark)
+        self.top = 0
+        self.render()
+
 
 class KasiExtractor:
     def __init__(self, root):
         self.root = root
         self.root.title("SMS Notification Clients v2.0 - CSV Support")
-        self.root.geometry("950x830")
+        self.root.geometry("950x930")
         self.root.resizable(True, True)
 
-        self.filtered_data_lines = []
+        self.filtered_df = None
+        self.extracted_df = None
+        self.quarantine_df = None
         self.current_file_type = None
+        self.result_cache = QueryResultCache()
+        self.active_runner = None
+        self.progress_sink = TkProgressSink(self)
+        self.suppression = None
+        self.lookup_index = None
+        self.text_index = None
+        self.text_index_build = None
+        self.text_search_after = None
+        self.text_search_matches = None
         self.file_path = tk.StringVar()
+        self.template_text = tk.StringVar(value=DEFAULT_SMS_TEMPLATE)
+        self.segment_price = tk.StringVar(value="0.08")
         self.start_date = tk.StringVar()
         self.end_date = tk.StringVar()
         
@@ -190,6 +327,28 @@ class KasiExtractor:
                                      state="disabled")
         self.test_button.grid(row=0, column=0, padx=(0, 10))
 
+        ttk.Label(test_frame, text="Търсене (номер, ЕКА, телефон, ЕИК):").grid(row=0, column=1, padx=(10, 5))
+        self.lookup_entry = tk.Entry(test_frame, width=20)
+        self.lookup_entry.grid(row=0, column=2, padx=(0, 5))
+        self.lookup_entry.bind('<Return>', lambda e: self.lookup_client())
+        self.lookup_button = ttk.Button(test_frame, text="🔎 Търси",
+                                        command=self.lookup_client, state="disabled")
+        self.lookup_button.grid(row=0, column=3)
+
+        ttk.Label(test_frame, text="Търсене по име/адрес (мин. 2 знака):").grid(
+            row=1, column=1, padx=(10, 5), pady=(8, 0))
+        self.text_search_entry = tk.Entry(test_frame, width=20)
+        self.text_search_entry.grid(row=1, column=2, padx=(0, 5), pady=(8, 0))
+        self.text_search_entry.bind('<KeyRelease>', self.on_text_search_change)
+        self.text_search_entry.bind('<FocusIn>', lambda e: self._ensure_text_index())
+        self.text_search_status = ttk.Label(test_frame, text="", foreground="gray")
+        self.text_search_status.grid(row=1, column=3, pady=(8, 0), sticky=tk.W)
+
+        self.text_search_results = tk.Listbox(test_frame, height=6, width=70)
+        self.text_search_results.grid(row=2, column=1, columnspan=3, pady=(5, 0), sticky=(tk.W, tk.E))
+        self.text_search_results.bind('<Double-Button-1>', lambda e: self.show_text_search_rows())
+        self.text_search_results.bind('<Return>', lambda e: self.show_text_search_rows())
+
         # 5. СЕКЦИЯ: ИЗБОР НА ДАТИ
         date_frame = ttk.LabelFrame(main_frame, text="📅 Филтриране по дати", padding="10")
         date_frame.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
@@ -215,7 +374,25 @@ class KasiExtractor:
         instruction_label.grid(row=1, column=0, columnspan=4, pady=(5, 0), sticky=tk.W)
         
         self.filter_result_label = ttk.Label(date_frame, text="", foreground="gray")
-        self.filter_result_label.grid(row=2, column=0, columnspan=5, pady=(10, 0), sticky=tk.W)
+        self.filter_result_label.grid(row=2, column=0, columnspan=4, pady=(10, 0), sticky=tk.W)
+
+        self.preview_button = ttk.Button(date_frame, text="👁 Преглед на резултата",
+                                         command=self.preview_filtered, state="disabled")
+        self.preview_button.grid(row=2, column=4, padx=(20, 0), pady=(10, 0))
+
+        ttk.Label(date_frame, text="Хоризонт (дни):").grid(row=3, column=0, padx=(0, 5), pady=(10, 0), sticky=tk.W)
+        self.horizon_entry = tk.Entry(date_frame, width=12)
+        self.horizon_entry.insert(0, "30")
+        self.horizon_entry.grid(row=3, column=1, padx=(0, 20), pady=(10, 0), sticky=tk.W)
+
+        ttk.Label(date_frame, text="Дни преди:").grid(row=3, column=2, padx=(0, 5), pady=(10, 0), sticky=tk.W)
+        self.offsets_entry = tk.Entry(date_frame, width=12)
+        self.offsets_entry.insert(0, ",".join(map(str, DEFAULT_WAVE_OFFSETS)))
+        self.offsets_entry.grid(row=3, column=3, padx=(0, 20), pady=(10, 0), sticky=tk.W)
+
+        self.schedule_button = ttk.Button(date_frame, text="📆 Планирай известия",
+                                         command=self.schedule_waves, state="disabled")
+        self.schedule_button.grid(row=3, column=4, padx=(20, 0), pady=(10, 0))
 
         # 6. СЕКЦИЯ: ИЗВЛИЧАНЕ НА КОНКРЕТНИ КОЛОНИ
         extract_frame = ttk.LabelFrame(main_frame, text="📋 Извличане на данни", padding="10")
@@ -239,8 +416,38 @@ class KasiExtractor:
                                           command=self.save_json, state="disabled")
         self.save_json_button.grid(row=1, column=2)
 
+        self.save_xlsx_button = ttk.Button(extract_frame, text="💾 Запиши XLSX",
+                                          command=self.save_xlsx, state="disabled")
+        self.save_xlsx_button.grid(row=1, column=3, padx=(10, 0))
+
+        self.save_many_button = ttk.Button(extract_frame, text="💾 Няколко формата",
+                                          command=self.save_multiple_formats, state="disabled")
+        self.save_many_button.grid(row=1, column=4, padx=(10, 0))
+
+        self.opt_out_button = ttk.Button(extract_frame, text="🚫 Списък за отказ",
+                                        command=self.choose_opt_out_files)
+        self.opt_out_button.grid(row=1, column=5, padx=(10, 0))
+
+        history_frame = ttk.Frame(extract_frame)
+        history_frame.grid(row=2, column=0, columnspan=6, pady=(10, 0), sticky=tk.W)
+        self.use_history = tk.BooleanVar(value=False)
+        ttk.Checkbutton(history_frame, text="🕓 Пропусни известените през последните",
+                        variable=self.use_history).grid(row=0, column=0, sticky=tk.W)
+        self.cooldown_entry = tk.Entry(history_frame, width=5)
+        self.cooldown_entry.insert(0, str(NotificationHistory.DEFAULT_COOLDOWN_DAYS))
+        self.cooldown_entry.grid(row=0, column=1, padx=(5, 5))
+        ttk.Label(history_frame, text="дни (записаните CSV/XLSX се отбелязват като известени)",
+                  foreground="gray", font=("TkDefaultFont", 8)).grid(row=0, column=2, sticky=tk.W)
+        self.use_validation = tk.BooleanVar(value=False)
+        ttk.Checkbutton(history_frame, text="✔ Отдели редовете с невалиден ЕИК или мобилен телефон",
+                        variable=self.use_validation).grid(row=1, column=0, columnspan=2, sticky=tk.W,
+                                                           pady=(5, 0))
+        self.save_quarantine_button = ttk.Button(history_frame, text="⚠️ Запиши невалидните",
+                                                command=self.save_quarantine, state="disabled")
+        self.save_quarantine_button.grid(row=1, column=2, sticky=tk.W, padx=(10, 0), pady=(5, 0))
+
         self.extract_result_label = ttk.Label(extract_frame, text="", foreground="gray")
-        self.extract_result_label.grid(row=2, column=0, columnspan=3, pady=(10, 0), sticky=tk.W)
+        self.extract_result_label.grid(row=3, column=0, columnspan=6, pady=(10, 0), sticky=tk.W)
         
         # 7. СЕКЦИЯ: ПЪЛЕН ЕКСПОРТ
         export_frame = ttk.LabelFrame(main_frame, text="📤 Пълен експорт", padding="10")
@@ -255,8 +462,51 @@ class KasiExtractor:
         self.full_export_button = ttk.Button(export_frame, text="📁 Експортирай цял файл", 
                                             command=self.export_full_table, state="disabled")
         self.full_export_button.grid(row=1, column=0, sticky=tk.W)
-        
-        # 8. СТАТУС БАР
+
+        self.partition_button = ttk.Button(export_frame, text="🗂 Раздели по месеци",
+                                          command=self.build_partition_store, state="disabled")
+        self.partition_button.grid(row=1, column=1, sticky=tk.W, padx=(10, 0))
+
+        self.sqlite_button = ttk.Button(export_frame, text="🗃 Експорт в SQLite",
+                                       command=self.export_to_sqlite, state="disabled")
+        self.sqlite_button.grid(row=1, column=2, sticky=tk.W, padx=(10, 0))
+
+        self.spec_button = ttk.Button(export_frame, text="📑 По спецификация",
+                                     command=self.extract_by_spec, state="disabled")
+        self.spec_button.grid(row=1, column=3, sticky=tk.W, padx=(10, 0))
+
+        self.profile_button = ttk.Button(export_frame, text="🩺 Профил на данните",
+                                        command=self.profile_data, state="disabled")
+        self.profile_button.grid(row=1, column=4, sticky=tk.W, padx=(10, 0))
+
+        # 8. СЕКЦИЯ: SMS ШАБЛОН
+        template_frame = ttk.LabelFrame(main_frame, text="✉️ SMS шаблон", padding="10")
+        template_frame.grid(row=7, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
+        template_frame.columnconfigure(1, weight=1)
+
+        ttk.Label(template_frame, text="Текст:").grid(row=0, column=0, padx=(0, 5), sticky=tk.W)
+        ttk.Entry(template_frame, textvariable=self.template_text).grid(row=0, column=1, columnspan=3,
+                                                                        sticky=(tk.W, tk.E))
+
+        ttk.Label(template_frame, text="Цена за SMS част:").grid(row=1, column=0, padx=(0, 5),
+                                                                 pady=(5, 0), sticky=tk.W)
+        ttk.Entry(template_frame, textvariable=self.segment_price, width=8).grid(row=1, column=1,
+                                                                                 pady=(5, 0), sticky=tk.W)
+
+        self.estimate_button = ttk.Button(template_frame, text="🧮 Оцени изпращането",
+                                         command=self.estimate_messages, state="disabled")
+        self.estimate_button.grid(row=1, column=3, pady=(5, 0), sticky=tk.E)
+
+        template_info_label = ttk.Label(template_frame,
+                                       text="Полета: {Ime_Obekt}, {Number_EKA}, {End_Data:%d.%m.%Y} ... "
+                                            "При запис на CSV съобщенията се записват и в *_messages.csv",
+                                       foreground="gray", font=("TkDefaultFont", 8))
+        template_info_label.grid(row=2, column=0, columnspan=4, pady=(5, 0), sticky=tk.W)
+
+        self.template_result_label = ttk.Label(template_frame, text="", foreground="gray")
+        self.template_result_label.grid(row=3, column=0, columnspan=4, pady=(5, 0), sticky=tk.W)
+
+        # 9. СТАТУС БАР
         status_bar_frame = ttk.Frame(main_frame)
         status_bar_frame.grid(row=10, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(20, 0))
         status_bar_frame.columnconfigure(0, weight=1)
@@ -265,8 +515,15 @@ class KasiExtractor:
                                    relief=tk.SUNKEN, anchor=tk.W, padding="5")
         self.status_bar.grid(row=0, column=0, sticky=(tk.W, tk.E))
         
+        self.progress_bar = ttk.Progressbar(status_bar_frame, mode='determinate', length=180)
+        self.progress_bar.grid(row=0, column=1, padx=(10, 0))
+
+        self.cancel_button = ttk.Button(status_bar_frame, text="⛔ Откажи",
+                                       command=self.cancel_operation, state="disabled")
+        self.cancel_button.grid(row=0, column=2, padx=(10, 0))
+
         ttk.Button(status_bar_frame, text="Изход", 
-                  command=self.exit_application).grid(row=0, column=1, padx=(10, 0))
+                  command=self.exit_application).grid(row=0, column=3, padx=(10, 0))
 
     def set_default_dates(self):
         """Задава днешна дата като период по подразбиране"""
@@ -313,23 +570,25 @@ class KasiExtractor:
             
             # Проверка дали mdbtools са налични за MDB
             if not MDBTOOLS_AVAILABLE:
-                self.filter_button.config(state="disabled")
-                self.full_export_button.config(state="disabled")
+                self._set_source_actions_state("disabled")
                 self.update_status_bar("⚠️ За MDB файлове са необходими mdbtools")
             else:
-                self.filter_button.config(state="normal")
-                self.full_export_button.config(state="normal")
+                self._set_source_actions_state("normal")
                 
         elif file_extension == '.csv':
             self.current_file_type = 'csv'
             self.test_button.config(text="📋 Прегледай CSV файла")
-            self.filter_button.config(state="normal")
-            self.full_export_button.config(state="normal")
+            self._set_source_actions_state("normal")
         else:
             self.current_file_type = 'unknown'
             self.test_button.config(text="❓ Прегледай файла")
-            self.filter_button.config(state="disabled")
-            self.full_export_button.config(state="disabled")
+            self._set_source_actions_state("disabled")
+
+    def _set_source_actions_state(self, state):
+        """Активира/деактивира бутоните, които работят с целия източник"""
+        for button in (self.filter_button, self.full_export_button, self.partition_button,
+                       self.sqlite_button, self.schedule_button, self.spec_button, self.profile_button):
+            button.config(state=state)
     
     def update_file_status(self, file_path):
         """Обновява статуса на избрания файл"""
@@ -342,10 +601,12 @@ class KasiExtractor:
             self.status_label.config(text=status_text, foreground="green")
             
             self.test_button.config(state="normal")
+            self.lookup_button.config(state="normal")
             
         else:
             self.status_label.config(text="❌ Файлът не съществува", foreground="red")
             self.test_button.config(state="disabled")
+            self.lookup_button.config(state="disabled")
 
     def test_file_connection(self):
         """Тества файла и показва информация за него"""
@@ -375,8 +636,7 @@ class KasiExtractor:
             
             has_end_data = 'End_Data' in df.columns
             
-            required_columns = ['Number', 'End_Data', 'Model', 'Number_EKA', 'Ime_Obekt', 
-                              'Adres_Obekt', 'Dan_Number', 'Phone', 'Ime_Firma', 'bulst']
+            required_columns = REQUIRED_COLUMNS
             found_columns = [col for col in required_columns if col in df.columns]
             
             messagebox.showinfo("Информация за CSV файла", 
@@ -429,21 +689,15 @@ class KasiExtractor:
             )
             return
         
+        runner = self._start_runner()
         try:
-            # Използваме mdb-tables за получаване на списък с таблици
-            result = subprocess.run(['mdb-tables', self.file_path.get()], 
-                                  capture_output=True, text=True, timeout=30)
-            
-            if result.returncode != 0:
-                messagebox.showerror("Грешка", 
-                                   f"Грешка при четене на MDB файла:\n{result.stderr}")
-                return
-            
-            tables = result.stdout.strip().split()
+            # Версията и списъкът с таблици се четат паралелно
+            version, tables = runner.run(runner.probe())
             
             if "Kasi_all" in tables:
                 messagebox.showinfo("Успех", 
                                 f"✅ Връзката е успешна!\n\n"
+                                f"Версия: {version}\n"
                                 f"Намерени таблици: {len(tables)}\n"
                                 f"Таблица 'Kasi_all': ✅ Намерена\n\n"
                                 f"Други таблици:\n" + "\n".join(tables))
@@ -457,9 +711,16 @@ class KasiExtractor:
         except subprocess.TimeoutExpired:
             messagebox.showerror("Грешка", "Таймаут при четене на MDB файла!")
             self.update_status_bar("Таймаут при тестване на MDB")
+        except OperationCancelled:
+            self.update_status_bar("Операцията е прекратена от потребителя")
+        except RuntimeError as e:
+            messagebox.showerror("Грешка", str(e))
+            self.update_status_bar("Грешка при четене на MDB файла")
         except Exception as e:
             messagebox.showerror("Грешка", f"Неочаквана грешка:\n{str(e)}")
             self.update_status_bar(f"Грешка: {str(e)}")
+        finally:
+            self._finish_runner()
 
     def filter_data(self):
         """Филтрира данните по избраните дати"""
@@ -500,30 +761,17 @@ class KasiExtractor:
         self.update_status_bar(f"Филтриране от {start_date_str} до {end_date_str}...")
         
         try:
-            df = pd.read_csv(self.file_path.get(), encoding='utf-8')
             start_date = datetime.strptime(start_date_str, '%d.%m.%Y')
             end_date = datetime.strptime(end_date_str, '%d.%m.%Y')
-            
-            if 'End_Data' not in df.columns:
-                messagebox.showerror("Грешка", "Колона 'End_Data' не е намерена в CSV файла!")
+
+            result = self._query_date_range(start_date.date(), end_date.date())
+            if result is None:
                 return False
-            
-            try:
-                df['End_Data_parsed'] = pd.to_datetime(df['End_Data'], format='%m/%d/%y %H:%M:%S', errors='coerce')
-            except:
-                try:
-                    df['End_Data_parsed'] = pd.to_datetime(df['End_Data'], format='%m/%d/%Y %H:%M:%S', errors='coerce')
-                except:
-                    df['End_Data_parsed'] = pd.to_datetime(df['End_Data'], errors='coerce')
-            
-            mask = (df['End_Data_parsed'].dt.date >= start_date.date()) & \
-                (df['End_Data_parsed'].dt.date <= end_date.date())
-            filtered_df = df[mask]
-            
-            self._save_filtered_data_as_lines(filtered_df)
-            
+            filtered_df, original_rows = result
+
+            self._save_filtered_data(filtered_df)
+
             total_rows = len(filtered_df)
-            original_rows = len(df)
             percent = (total_rows/original_rows*100) if original_rows > 0 else 0
             
             result_text = f"✅ Филтрирани {total_rows} от общо {original_rows} реда"
@@ -533,6 +781,7 @@ class KasiExtractor:
             messagebox.showinfo("Резултат", f"Филтрирането е завършено!\n\nПериод: {start_date_str} - {end_date_str}\nОбщо редове: {original_rows}\nФилтрирани редове: {total_rows}")
             
             self.extract_button.config(state="normal")
+            self.preview_button.config(state="normal")
             return True
             
         except Exception as e:
@@ -565,57 +814,17 @@ class KasiExtractor:
         self.update_status_bar(f"Филтриране от {start_date_str} до {end_date_str}...")
         
         try:
-            # Експортираме цялата таблица временно
-            with tempfile.NamedTemporaryFile(suffix='.csv', delete=False, mode='w+', encoding='utf-8') as temp_file:
-                temp_csv_path = temp_file.name
-            
-            # Експортираме таблицата с mdb-export
-            cmd = ['mdb-export', self.file_path.get(), 'Kasi_all']
-            
-            with open(temp_csv_path, 'w', encoding='utf-8') as output_file:
-                result = subprocess.run(cmd, stdout=output_file, stderr=subprocess.PIPE, text=True, timeout=120)
-            
-            if result.returncode != 0:
-                messagebox.showerror("Грешка", f"Грешка при експорт на MDB: {result.stderr}")
-                os.unlink(temp_csv_path)
-                return False
-            
-            # Четем CSV с pandas и поправяме кодировката
-            df = pd.read_csv(temp_csv_path, encoding='utf-8')
-            
-            # Поправяме кодировката на всички текстови колони
-            for column in df.columns:
-                if df[column].dtype == 'object':
-                    df[column] = df[column].astype(str).apply(
-                        lambda x: self.fix_encoding_utf8_to_windows1251(x) if x != 'nan' else ''
-                    )
-            
-            # Почистваме временния файл
-            os.unlink(temp_csv_path)
-            
             start_date = datetime.strptime(start_date_str, '%d.%m.%Y')
             end_date = datetime.strptime(end_date_str, '%d.%m.%Y')
-            
-            if 'End_Data' not in df.columns:
-                messagebox.showerror("Грешка", "Колона 'End_Data' не е намерена в таблицата!")
+
+            result = self._query_date_range(start_date.date(), end_date.date())
+            if result is None:
                 return False
-            
-            try:
-                df['End_Data_parsed'] = pd.to_datetime(df['End_Data'], format='%m/%d/%y %H:%M:%S', errors='coerce')
-            except:
-                try:
-                    df['End_Data_parsed'] = pd.to_datetime(df['End_Data'], format='%m/%d/%Y %H:%M:%S', errors='coerce')
-                except:
-                    df['End_Data_parsed'] = pd.to_datetime(df['End_Data'], errors='coerce')
-            
-            mask = (df['End_Data_parsed'].dt.date >= start_date.date()) & \
-                (df['End_Data_parsed'].dt.date <= end_date.date())
-            filtered_df = df[mask]
-            
-            self._save_filtered_data_as_lines(filtered_df)
-            
+            filtered_df, original_rows = result
+
+            self._save_filtered_data(filtered_df)
+
             total_rows = len(filtered_df)
-            original_rows = len(df)
             percent = (total_rows/original_rows*100) if original_rows > 0 else 0
             
             result_text = f"✅ Филтрирани {total_rows} от общо {original_rows} реда"
@@ -625,6 +834,7 @@ class KasiExtractor:
             messagebox.showinfo("Резултат", f"Филтрирането е завършено!\n\nПериод: {start_date_str} - {end_date_str}\nОбщо редове: {original_rows}\nФилтрирани редове: {total_rows}")
             
             self.extract_button.config(state="normal")
+            self.preview_button.config(state="normal")
             return True
             
         except subprocess.TimeoutExpired:
@@ -636,101 +846,180 @@ class KasiExtractor:
             self.update_status_bar(f"Грешка: {str(e)}")
             return False
 
-    def _save_filtered_data_as_lines(self, filtered_df):
-        """Запазва филтрираните данни като CSV lines"""
-        self.filtered_data_lines = []
-        
-        columns = list(filtered_df.columns)
-        if 'End_Data_parsed' in columns:
-            columns.remove('End_Data_parsed')
-        self.filtered_data_lines.append(','.join(f'"{col}"' for col in columns))
-        
-        for _, row in filtered_df.iterrows():
-            csv_row = []
-            for col in columns:
-                value = row[col]
-                if pd.isna(value):
-                    csv_row.append('""')
-                else:
-                    str_value = str(value).replace('"', '""')
-                    csv_row.append(f'"{str_value}"')
-            self.filtered_data_lines.append(','.join(csv_row))
+    def _query_date_range(self, start, end):
+        """Връща (филтриран DataFrame, общо редове) за периода - липсващите в кеша на сесията дни
+        се четат от дяловете/SQLite, ако са актуални, иначе от източника"""
+        hits = self.result_cache.hits
+        runner = self._start_runner() if self.current_file_type == 'mdb' else None
+        try:
+            result = load_date_window(self.file_path.get(), start, end, cache=self.result_cache,
+                                      file_type=self.current_file_type, runner=runner,
+                                      progress=self._new_progress())
+        except OperationCancelled:
+            self.update_status_bar("Операцията е прекратена от потребителя")
+            return None
+        except RuntimeError as e:
+            messagebox.showerror("Грешка", str(e))
+            return None
+        finally:
+            self._finish_runner()
+
+        if self.result_cache.hits > hits:
+            self.update_status_bar(f"Резултат от кеша за {start.strftime('%d.%m.%Y')} - {end.strftime('%d.%m.%Y')}")
+        return result
+
+    def schedule_waves(self):
+        """Изчислява вълните известия (напр. 30/14/7/1 дни преди End_Data) за следващите N дни"""
+        if not self.file_path.get():
+            messagebox.showerror("Грешка", "Моля изберете файл първо!")
+            return
+
+        if not PANDAS_AVAILABLE:
+            messagebox.showerror("Грешка", "pandas не е инсталиран!")
+            return
+
+        try:
+            horizon_days = int(self.horizon_entry.get().strip())
+            offsets = [int(x) for x in self.offsets_entry.get().split(',') if x.strip()]
+            if horizon_days < 1 or not offsets or min(offsets) < 0:
+                raise ValueError()
+        except ValueError:
+            messagebox.showerror("Грешка", "Невалиден хоризонт или списък с дни (напр. 30,14,7,1)!")
+            return
+
+        output_dir = filedialog.askdirectory(title="Избери директория за вълните известия")
+        if not output_dir:
+            return
+
+        try:
+            today = date.today()
+            window_start, window_end = wave_window(today, horizon_days, offsets)
+            self.update_status_bar(f"Планиране на известия за {horizon_days} дни...")
+
+            # Едно четене на нужния период (през кеша/дяловете), после една сортировка
+            result = self._query_date_range(window_start, window_end)
+            if result is None:
+                return
+            waves = compute_notification_waves(result[0], today, horizon_days, offsets)
+            summary = write_notification_waves(waves, output_dir)
+
+            self.update_status_bar(f"Планирани {len(summary)} вълни ({len(waves)} известия)")
+
+            preview = "\n".join(f"{send_date.strftime('%d.%m.%Y')}  T-{days_before}: {rows} клиента"
+                                for send_date, days_before, rows, _ in summary[:15])
+            if len(summary) > 15:
+                preview += f"\n... и още {len(summary) - 15} вълни"
+
+            messagebox.showinfo("Успех",
+                              f"Планирането е завършено!\n\n"
+                              f"📆 Вълни: {len(summary)}\n"
+                              f"📨 Известия: {len(waves)}\n"
+                              f"🔗 Път: {output_dir}\n\n{preview}")
+
+        except subprocess.TimeoutExpired:
+            messagebox.showerror("Грешка", "Таймаут при четене на MDB файла!")
+            self.update_status_bar("Таймаут при планиране")
+        except Exception as e:
+            messagebox.showerror("Грешка", f"Грешка при планиране на известията:\n{str(e)}")
+            self.update_status_bar(f"Грешка: {str(e)}")
+
+    def _load_source_dataframe(self):
+        """Зарежда целия източник (CSV или MDB таблицата Kasi_all) като DataFrame"""
+        runner = self._start_runner() if self.current_file_type == 'mdb' else None
+        try:
+            return load_source_dataframe(self.file_path.get(), self.current_file_type, runner,
+                                         self._new_progress())
+        except OperationCancelled:
+            self.update_status_bar("Операцията е прекратена от потребителя")
+            return None
+        except RuntimeError as e:
+            messagebox.showerror("Грешка", str(e))
+            return None
+        finally:
+            self._finish_runner()
+
+    def _start_runner(self):
+        """Създава MdbToolsRunner, който държи GUI-то отзивчиво и може да бъде прекратен"""
+        self.active_runner = MdbToolsRunner(self.file_path.get(), poll=self._poll_runner)
+        self.cancel_button.config(state="normal")
+        return self.active_runner
+
+    def _poll_runner(self):
+        self.progress_sink.flush()
+        self.root.update()
+
+    def _new_progress(self):
+        """ProgressTracker, който рисува в прогрес бара на прозореца"""
+        self.progress_bar['value'] = 0
+        return ProgressTracker([self.progress_sink])
+
+    def _finish_runner(self):
+        self.active_runner = None
+        self.cancel_button.config(state="disabled")
+
+    def cancel_operation(self):
+        """Прекратява текущата операция с mdbtools"""
+        if self.active_runner is not None:
+            self.active_runner.cancel()
+            self.update_status_bar("Прекратяване...")
+
+    def _save_filtered_data(self, filtered_df):
+        """Запазва филтрираните данни (без помощната колона End_Data_parsed)"""
+        self.filtered_df = filtered_df.drop(columns=['End_Data_parsed'], errors='ignore')
 
     def extract_specific_columns(self):
         """Извлича конкретните 10 колони от филтрираните данни"""
-        if not hasattr(self, 'filtered_data_lines') or len(self.filtered_data_lines) < 2:
+        if self.filtered_df is None or len(self.filtered_df) == 0:
             messagebox.showerror("Грешка", "Няма филтрирани данни! Първо направете филтрация.")
             return False
         
         self.update_status_bar("Извличане на конкретни колони...")
         
-        required_columns = ['Number', 'End_Data', 'Model', 'Number_EKA', 'Ime_Obekt', 
-                        'Adres_Obekt', 'Dan_Number', 'Phone', 'Ime_Firma', 'bulst']
-        
         try:
-            header_line = self.filtered_data_lines[0]
-            header_reader = csv.reader(io.StringIO(header_line))
-            headers = next(header_reader)
-            
-            column_indices = {}
-            missing_columns = []
-            
-            for col_name in required_columns:
-                found_index = None
-                for i, header in enumerate(headers):
-                    if col_name.lower() in header.lower():
-                        found_index = i
-                        break
-                
-                if found_index is not None:
-                    column_indices[col_name] = found_index
-                else:
-                    missing_columns.append(col_name)
+            plan = compile_column_plan(tuple(self.filtered_df.columns))
             
-            if missing_columns:
+            if plan.missing:
                 messagebox.showwarning("Внимание", 
-                                    f"Следните колони не са намерени:\n{', '.join(missing_columns)}\n\n"
+                                    f"Следните колони не са намерени:\n{', '.join(plan.missing)}\n\n"
                                     f"Ще бъдат извлечени само намерените колони.")
             
-            new_header = [col for col in required_columns if col in column_indices]
-            extracted_data = []
-            extracted_data.append(','.join(f'"{col}"' for col in new_header))
-            
-            for line in self.filtered_data_lines[1:]:
-                try:
-                    reader = csv.reader(io.StringIO(line))
-                    fields = next(reader)
-                    
-                    new_row = []
-                    for col_name in new_header:
-                        if column_indices[col_name] < len(fields):
-                            field_value = fields[column_indices[col_name]]
-                            
-                            if field_value.endswith('.0') and field_value.replace('.0', '').replace('-', '').isdigit():
-                                field_value = field_value[:-2]
-                            
-                            new_row.append(f'"{field_value}"')
-                        else:
-                            new_row.append('""')
-                    
-                    extracted_data.append(','.join(new_row))
-                
-                except Exception as e:
-                    continue
-            
-            self.extracted_data_lines = extracted_data
-            total_extracted = len(extracted_data) - 1
+            new_header = list(plan.names)
+            extracted_df = project_columns(self.filtered_df, plan)
+            self.quarantine_df = None
+            if self.use_validation.get():
+                valid, reasons = validate_clients(extracted_df)
+                self.quarantine_df = extracted_df[~valid].assign(**{VALIDATION_COLUMN: reasons[~valid]})
+                extracted_df = extracted_df[valid]
+            self.save_quarantine_button.config(
+                state="normal" if self.quarantine_df is not None and len(self.quarantine_df) else "disabled")
+            suppressed = 0
+            if self.suppression is not None and 'Phone' in extracted_df.columns:
+                extracted_df, suppressed = self.suppression.anti_join(extracted_df)
+            history = self._notification_history()
+            already_notified = 0
+            if history is not None:
+                extracted_df, already_notified = history.exclude_recent(extracted_df, self._cooldown_days())
+            self.extracted_df = extracted_df
+            self.extracted_data_lines = to_quoted_csv_lines(self.extracted_df)
+            total_extracted = len(self.extracted_df)
             
             result_text = f"✅ Извлечени {len(new_header)} колони от {total_extracted} реда"
-            if hasattr(self, 'filtered_data_lines'):
-                original_rows = len(self.filtered_data_lines) - 1
-                result_text += f" (от {original_rows} филтрирани)"
+            result_text += f" (от {len(self.filtered_df)} филтрирани)"
+            if self.quarantine_df is not None:
+                result_text += f", ⚠️ {len(self.quarantine_df)} с невалиден ЕИК/телефон"
+            if self.suppression is not None:
+                result_text += f", 🚫 {suppressed} с отказ от SMS"
+            if history is not None:
+                result_text += f", 🕓 {already_notified} вече известени"
             
             self.extract_result_label.config(text=result_text, foreground="green")
             self.update_status_bar(f"Извличане завършено: {total_extracted} реда с {len(new_header)} колони")
             
             self.save_csv_button.config(state="normal")
             self.save_json_button.config(state="normal")
+            self.save_xlsx_button.config(state="normal")
+            self.save_many_button.config(state="normal")
+            self.estimate_button.config(state="normal")
             
             messagebox.showinfo("Успех", 
                             f"Извличането е успешно!\n\n"
@@ -774,16 +1063,11 @@ class KasiExtractor:
             self.update_status_bar("Експортиране на целия CSV файл...")
             
             if not PANDAS_AVAILABLE:
-                import shutil
                 shutil.copy2(self.file_path.get(), file_path)
             else:
                 df = pd.read_csv(self.file_path.get(), encoding='utf-8')
                 
-                for column in df.columns:
-                    if df[column].dtype == 'object':
-                        df[column] = df[column].astype(str).apply(
-                            lambda x: self.fix_encoding_utf8_to_windows1251(x) if x != 'nan' else ''
-                        )
+                fix_dataframe_encoding(df)
                 
                 df.to_csv(file_path, index=False, encoding='utf-8')
             
@@ -828,49 +1112,29 @@ class KasiExtractor:
         try:
             self.update_status_bar("Експортиране на цялата таблица...")
             
-            # Създаваме временен файл за експорт
-            with tempfile.NamedTemporaryFile(suffix='.csv', delete=False, mode='w+', encoding='utf-8') as temp_file:
-                temp_csv_path = temp_file.name
-            
-            # Експортираме с mdb-export
-            cmd = ['mdb-export', self.file_path.get(), 'Kasi_all']
-            
-            with open(temp_csv_path, 'w', encoding='utf-8') as output_file:
-                result = subprocess.run(cmd, stdout=output_file, stderr=subprocess.PIPE, text=True, timeout=300)
-            
-            if result.returncode != 0:
-                messagebox.showerror("Грешка", f"Грешка при експорт на MDB: {result.stderr}")
-                os.unlink(temp_csv_path)
-                return
-            
-            # Четем експортирания CSV и поправяме кодировката
             if PANDAS_AVAILABLE:
-                df = pd.read_csv(temp_csv_path, encoding='utf-8')
-                
-                # Поправяме кодировката на всички текстови колони
-                for column in df.columns:
-                    if df[column].dtype == 'object':
-                        df[column] = df[column].astype(str).apply(
-                            lambda x: self.fix_encoding_utf8_to_windows1251(x) if x != 'nan' else ''
-                        )
-                
-                # Записваме с поправената кодировка
-                df.to_csv(file_path, index=False, encoding='utf-8')
-                total_rows = len(df)
-                total_columns = len(df.columns)
+                # Експорт, поправка на кодировката и запис вървят едновременно на части
+                runner = self._start_runner()
+                try:
+                    stats = export_table(self.file_path.get(), file_path, runner=runner,
+                                         progress=self._new_progress(), poll=self._poll_runner)
+                finally:
+                    self._finish_runner()
+                total_rows = stats['rows']
+                total_columns = stats['columns']
             else:
                 # Ако няма pandas, копираме директно (но кодировката ще е грешна)
-                import shutil
-                shutil.copy2(temp_csv_path, file_path)
+                runner = self._start_runner()
+                try:
+                    runner.run(runner.export('Kasi_all', file_path))
+                finally:
+                    self._finish_runner()
                 
                 # Броим редове без header
                 with open(file_path, 'r', encoding='utf-8') as f:
                     total_rows = sum(1 for _ in f) - 1
                 total_columns = "unknown"
             
-            # Почистваме временния файл
-            os.unlink(temp_csv_path)
-            
             file_size = os.path.getsize(file_path)
             
             self.update_status_bar(f"Пълен експорт завършен: {os.path.basename(file_path)}")
@@ -886,10 +1150,456 @@ class KasiExtractor:
         except subprocess.TimeoutExpired:
             messagebox.showerror("Грешка", "Таймаут при експорт на MDB файла!")
             self.update_status_bar("Таймаут при експорт")
+        except OperationCancelled:
+            self.update_status_bar("Експортът е прекратен от потребителя")
         except Exception as e:
             messagebox.showerror("Грешка", f"Грешка при пълен експорт:\n{str(e)}")
             self.update_status_bar(f"Грешка: {str(e)}")
 
+    def export_to_sqlite(self):
+        """Зарежда цялата таблица в SQLite база с индекси по End_Data, Phone и bulst"""
+        if not self.file_path.get():
+            messagebox.showerror("Грешка", "Моля изберете файл първо!")
+            return
+
+        if not PANDAS_AVAILABLE:
+            messagebox.showerror("Грешка", "pandas не е инсталиран!")
+            return
+
+        source_path = self.file_path.get()
+        db_path = filedialog.asksaveasfilename(
+            title="Експортирай в SQLite база",
+            defaultextension=".sqlite",
+            filetypes=[("SQLite бази", "*.sqlite *.db"), ("Всички файлове", "*.*")],
+            initialdir=os.path.dirname(source_path),
+            initialfile=os.path.basename(SqliteStore.default_path(source_path))
+        )
+
+        if not db_path:
+            return
+
+        runner = self._start_runner() if self.current_file_type == 'mdb' else None
+        try:
+            self.update_status_bar("Експортиране в SQLite...")
+
+            store = SqliteStore(db_path)
+            total_rows = store.build(
+                iter_source_chunks(source_path, runner=runner, progress=self._new_progress()),
+                file_fingerprint(source_path))
+            file_size = os.path.getsize(db_path)
+
+            self.update_status_bar(f"SQLite експорт завършен: {os.path.basename(db_path)}")
+
+            messagebox.showinfo("Успех",
+                            f"SQLite базата е създадена успешно!\n\n"
+                            f"📁 Файл: {os.path.basename(db_path)}\n"
+                            f"📊 Редове: {total_rows:,}\n"
+                            f"🔎 Индекси: End_Data, Phone, bulst\n"
+                            f"💾 Размер: {file_size / 1024 / 1024:.1f} MB\n"
+                            f"🔗 Път: {db_path}")
+
+        except subprocess.TimeoutExpired:
+            messagebox.showerror("Грешка", "Таймаут при експорт на MDB файла!")
+            self.update_status_bar("Таймаут при експорт")
+        except OperationCancelled:
+            self.update_status_bar("Експортът е прекратен от потребителя")
+        except Exception as e:
+            messagebox.showerror("Грешка", f"Грешка при експорт в SQLite:\n{str(e)}")
+            self.update_status_bar(f"Грешка: {str(e)}")
+        finally:
+            if runner is not None:
+                self._finish_runner()
+
+    def _cooldown_days(self):
+        try:
+            return max(int(self.cooldown_entry.get().strip()), 0)
+        except ValueError:
+            return NotificationHistory.DEFAULT_COOLDOWN_DAYS
+
+    def _notification_history(self):
+        """Историята на известията до източника, ако проверката е включена"""
+        if not self.use_history.get() or not self.file_path.get():
+            return None
+        return NotificationHistory.for_source(self.file_path.get())
+
+    def choose_opt_out_files(self):
+        """Избор на файлове с телефони, отказали SMS - премахват се от всяко извличане"""
+        paths = filedialog.askopenfilenames(
+            title="Избери файлове със списъци за отказ",
+            filetypes=[("CSV/TXT файлове", "*.csv *.txt"), ("Списък за отказ", "*.npz"),
+                       ("Всички файлове", "*.*")]
+        )
+        if not paths:
+            if self.suppression is not None and messagebox.askyesno(
+                    "Списък за отказ", "Да се изключи ли списъкът за отказ?"):
+                self.suppression = None
+                self.opt_out_button.config(text="🚫 Списък за отказ")
+                self.update_status_bar("Списъкът за отказ е изключен")
+            return
+
+        try:
+            self.update_status_bar("Зареждане на списъка за отказ...")
+            self.suppression = SuppressionList.load(paths)
+            self.opt_out_button.config(text=f"🚫 Отказали: {len(self.suppression):,}")
+            self.update_status_bar(f"Списък за отказ: {len(self.suppression):,} номера от {len(paths)} файла")
+        except Exception as e:
+            messagebox.showerror("Грешка", f"Грешка при четене на списъка за отказ:\n{str(e)}")
+            self.update_status_bar(f"Грешка: {str(e)}")
+
+    def profile_data(self):
+        """Профил на качеството на целия източник с едно минаване - HTML или JSON отчет"""
+        if not self.file_path.get():
+            messagebox.showerror("Грешка", "Моля изберете файл първо!")
+            return
+
+        if not PANDAS_AVAILABLE:
+            messagebox.showerror("Грешка", "pandas не е инсталиран!")
+            return
+
+        source_path = self.file_path.get()
+        output_path = filedialog.asksaveasfilename(
+            title="Запиши профила на данните",
+            defaultextension=".html",
+            filetypes=[("HTML отчет", "*.html"), ("JSON файлове", "*.json"), ("Всички файлове", "*.*")],
+            initialdir=os.path.dirname(source_path),
+            initialfile=os.path.splitext(os.path.basename(source_path))[0] + "_profile.html"
+        )
+        if not output_path:
+            return
+
+        try:
+            self.update_status_bar("Профилиране на данните...")
+            runner = self._start_runner()
+            try:
+                report = profile_source(source_path, runner=runner, progress=self._new_progress(),
+                                        poll=self._poll_runner)
+            finally:
+                self._finish_runner()
+            write_profile_report(report, output_path)
+
+            problems = []
+            for name, column in report['columns'].items():
+                for key, title in PROFILE_REPORT_FIELDS:
+                    if key in PROFILE_PROBLEM_FIELDS and column.get(key):
+                        problems.append(f"• {name}: {title.lower()} - {column[key]:,}")
+            problems_text = "\n".join(problems[:12]) if problems else "Не са открити проблеми"
+
+            self.update_status_bar(f"Профилът е записан: {os.path.basename(output_path)}")
+            messagebox.showinfo("Профил на данните",
+                            f"📊 Редове: {report['rows']:,}\n"
+                            f"⏱ Време: {report['wall_seconds']:.1f} сек.\n\n"
+                            f"{problems_text}\n\n"
+                            f"📁 Отчет: {output_path}")
+
+        except subprocess.TimeoutExpired:
+            messagebox.showerror("Грешка", "Таймаут при експорт на MDB файла!")
+            self.update_status_bar("Таймаут при профилиране")
+        except OperationCancelled:
+            self.update_status_bar("Профилирането е прекратено от потребителя")
+        except Exception as e:
+            messagebox.showerror("Грешка", f"Грешка при профилиране:\n{str(e)}")
+            self.update_status_bar(f"Грешка: {str(e)}")
+
+    def extract_by_spec(self):
+        """Извличане по JSON спецификация (таблица, колони, филтри, join-ове) за избрания период"""
+        if not self.file_path.get():
+            messagebox.showerror("Грешка", "Моля изберете файл първо!")
+            return
+
+        if not PANDAS_AVAILABLE:
+            messagebox.showerror("Грешка", "pandas не е инсталиран!")
+            return
+
+        spec_path = filedialog.askopenfilename(
+            title="Избери спецификация за извличане",
+            filetypes=[("JSON файлове", "*.json"), ("Всички файлове", "*.*")]
+        )
+        if not spec_path:
+            return
+
+        try:
+            spec = load_extraction_spec(spec_path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Грешка", f"Невалидна спецификация:\n{str(e)}")
+            return
+
+        # Периодът е по избор - без дати се извличат всички редове
+        start_text = self.start_date_entry.get().strip()
+        end_text = self.end_date_entry.get().strip()
+        start_date = end_date = None
+        if start_text or end_text:
+            if (self.validate_date_input(start_text) != "valid" or
+                    self.validate_date_input(end_text) != "valid" or not self.validate_date_range()):
+                messagebox.showerror("Грешка", "Невалиден период! Оставете двете дати празни за всички редове.")
+                return
+            start_date = datetime.strptime(start_text, '%d.%m.%Y').date()
+            end_date = datetime.strptime(end_text, '%d.%m.%Y').date()
+
+        output_path = filedialog.asksaveasfilename(
+            title="Запиши извлечените данни",
+            defaultextension=".csv",
+            filetypes=[("CSV файлове", "*.csv"), ("Excel файлове", "*.xlsx"), ("JSON файлове", "*.json"),
+                       ("NDJSON файлове", "*.ndjson"), ("Parquet файлове", "*.parquet"),
+                       ("Всички файлове", "*.*")],
+            initialfile=os.path.splitext(os.path.basename(spec_path))[0] + "_extract.csv"
+        )
+        if not output_path:
+            return
+
+        try:
+            self.update_status_bar(f"Извличане по спецификация {os.path.basename(spec_path)}...")
+            runner = self._start_runner()
+            try:
+                stats = extract_date_range(self.file_path.get(), start_date, end_date, output_path,
+                                           runner=runner, progress=self._new_progress(),
+                                           poll=self._poll_runner, spec=spec,
+                                           suppression=self.suppression,
+                                           history=self._notification_history(),
+                                           cooldown_days=self._cooldown_days(),
+                                           record_history=self.use_history.get(),
+                                           validate='quarantine' if self.use_validation.get() else None)
+            finally:
+                self._finish_runner()
+
+            missing_text = ""
+            if stats['missing_columns']:
+                missing_text = f"⚠️ Липсващи колони: {', '.join(stats['missing_columns'])}\n"
+            if stats['quarantine_path']:
+                missing_text += (f"⚠️ Невалиден ЕИК/телефон: {stats['invalid_rows']:,} реда в "
+                                 f"{os.path.basename(stats['quarantine_path'])}\n")
+            self.update_status_bar(f"Извлечени {stats['rows_written']:,} реда в {os.path.basename(output_path)}")
+            messagebox.showinfo("Успех",
+                            f"Извличането по спецификация е завършено!\n\n"
+                            f"📊 Редове: {stats['rows_written']:,} (от {stats['rows_read']:,})\n"
+                            f"🔗 Join-ове: {len(spec['joins'])}\n"
+                            f"🚫 С отказ от SMS: {stats['suppressed']:,}\n"
+                            f"{missing_text}"
+                            f"📁 Файл: {output_path}")
+
+        except subprocess.TimeoutExpired:
+            messagebox.showerror("Грешка", "Таймаут при експорт на MDB файла!")
+            self.update_status_bar("Таймаут при извличане")
+        except OperationCancelled:
+            self.update_status_bar("Извличането е прекратено от потребителя")
+        except Exception as e:
+            messagebox.showerror("Грешка", f"Грешка при извличане по спецификация:\n{str(e)}")
+            self.update_status_bar(f"Грешка: {str(e)}")
+
+    def build_partition_store(self):
+        """Записва таблицата като дялове по месеци за бързо филтриране по дати"""
+        if not self.file_path.get():
+            messagebox.showerror("Грешка", "Моля изберете файл първо!")
+            return
+
+        if not PANDAS_AVAILABLE:
+            messagebox.showerror("Грешка", "pandas не е инсталиран!")
+            return
+
+        source_path = self.file_path.get()
+        root = PartitionStore.default_root(source_path)
+
+        try:
+            self.update_status_bar("Разделяне на таблицата по месеци...")
+
+            df = self._load_source_dataframe()
+            if df is None:
+                return
+
+            store = PartitionStore.build(df, root, file_fingerprint(source_path))
+            self.result_cache.invalidate(source_path)
+            # Индексите за търсене се обновяват заедно с дяловете (един експорт)
+            self.lookup_index = LookupIndex.build(df, LookupIndex.default_root(source_path),
+                                                  file_fingerprint(source_path))
+            self.text_index = TrigramIndex.build(df, TrigramIndex.default_root(source_path),
+                                                 file_fingerprint(source_path))
+
+            self.update_status_bar(f"Хранилището с дялове е създадено: {root}")
+
+            messagebox.showinfo("Успех",
+                            f"Таблицата е разделена успешно!\n\n"
+                            f"📊 Редове: {store.total_rows:,}\n"
+                            f"🗂 Дялове: {len(store.manifest['partitions'])} ({store.manifest['format'].upper()})\n"
+                            f"🔗 Път: {root}\n\n"
+                            f"Следващите филтрирания ще четат само нужните месеци.")
+
+        except subprocess.TimeoutExpired:
+            messagebox.showerror("Грешка", "Таймаут при експорт на MDB файла!")
+            self.update_status_bar("Таймаут при разделяне")
+        except Exception as e:
+            messagebox.showerror("Грешка", f"Грешка при разделяне на таблицата:\n{str(e)}")
+            self.update_status_bar(f"Грешка: {str(e)}")
+
+    def _current_lookup_index(self):
+        """LookupIndex за избрания файл - изгражда се при първото търсене или след промяна"""
+        source_path = self.file_path.get()
+        fingerprint = file_fingerprint(source_path)
+        index = self.lookup_index
+        if index is None or index.root != LookupIndex.default_root(source_path):
+            index = LookupIndex.for_source(source_path)
+        if not index.is_current(fingerprint):
+            self.update_status_bar("Изграждане на индекса за търсене...")
+            df = self._load_source_dataframe()
+            if df is None:
+                return None
+            index = LookupIndex.build(df, LookupIndex.default_root(source_path), fingerprint)
+        self.lookup_index = index
+        return index
+
+    def _ensure_text_index(self):
+        """
+        Връща готовия TrigramIndex за избрания файл или стартира изграждането
+        му (и на LookupIndex за показване на редовете) във фонова нишка.
+        """
+        source_path = self.file_path.get()
+        if not source_path or not PANDAS_AVAILABLE or not os.path.exists(source_path):
+            return None
+        fingerprint = file_fingerprint(source_path)
+        index = self.text_index
+        if (index is not None and index.root == TrigramIndex.default_root(source_path)
+                and index.is_current(fingerprint)
+                and self.lookup_index is not None and self.lookup_index.is_current(fingerprint)):
+            return index
+        if self.text_index_build is not None and self.text_index_build['source'] == (source_path, fingerprint):
+            return None
+
+        build = {'source': (source_path, fingerprint)}
+        file_type = self.current_file_type
+
+        def work():
+            try:
+                lookup = LookupIndex.for_source(source_path)
+                text_index = TrigramIndex.for_source(source_path)
+                if not (lookup.is_current(fingerprint) and text_index.is_current(fingerprint)):
+                    df = load_source_dataframe(source_path, file_type)
+                    if not lookup.is_current(fingerprint):
+                        lookup = LookupIndex.build(df, lookup.root, fingerprint)
+                    if not text_index.is_current(fingerprint):
+                        text_index = TrigramIndex.build(df, text_index.root, fingerprint)
+                build['result'] = (lookup, text_index.load())
+            except Exception as e:
+                build['error'] = e
+
+        self.text_index_build = build
+        build['thread'] = threading.Thread(target=work, daemon=True)
+        build['thread'].start()
+        self.text_search_status.config(text="⏳ Индексиране...")
+        self.root.after(200, self._check_text_index_build)
+        return None
+
+    def _check_text_index_build(self):
+        """Проверява (от GUI нишката) дали фоновото индексиране е завършило"""
+        build = self.text_index_build
+        if build is None:
+            return
+        if build['thread'].is_alive():
+            self.root.after(200, self._check_text_index_build)
+            return
+
+        self.text_index_build = None
+        if 'error' in build:
+            self.text_search_status.config(text="❌ Грешка")
+            messagebox.showerror("Грешка", f"Грешка при индексиране за търсене:\n{build['error']}")
+            return
+        if build['source'][0] != self.file_path.get():
+            return
+        self.lookup_index, self.text_index = build['result']
+        self.text_search_status.config(text=f"{self.text_index.manifest['values']:,} стойности")
+        self.run_text_search()
+
+    def on_text_search_change(self, event=None):
+        """Търсене докато се пише - изчаква кратко след последния натиснат клавиш"""
+        if self.text_search_after is not None:
+            self.root.after_cancel(self.text_search_after)
+        self.text_search_after = self.root.after(150, self.run_text_search)
+
+    def run_text_search(self):
+        """Показва най-добрите съвпадения за въведения текст в списъка"""
+        self.text_search_after = None
+        query = self.text_search_entry.get().strip()
+        self.text_search_results.delete(0, tk.END)
+        self.text_search_matches = None
+        if len(query) < 2:
+            return
+
+        index = self._ensure_text_index()
+        if index is None:
+            return
+        try:
+            started = time.perf_counter()
+            matches = index.search(query)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        except Exception as e:
+            self.update_status_bar(f"Грешка при търсене: {str(e)}")
+            return
+
+        self.text_search_matches = matches
+        for column, value, rows in zip(matches['Колона'], matches['Стойност'], matches['Редове']):
+            self.text_search_results.insert(tk.END, f"{value}   [{column}, {rows:,} реда]")
+        self.text_search_status.config(text=f"{len(matches)} съвпадения ({elapsed_ms:.0f} ms)")
+
+    def show_text_search_rows(self):
+        """Показва редовете на избраната от списъка стойност"""
+        selection = self.text_search_results.curselection()
+        if not selection or self.text_search_matches is None:
+            return
+        match = self.text_search_matches.iloc[selection[0]]
+        positions = self.text_index.rows_for(int(match['value_id']))
+        rows = self.lookup_index.take(positions)
+        self.show_rows_window(rows, f"{match['Колона']}: {match['Стойност']} ({len(rows)} реда)")
+
+    def lookup_client(self):
+        """Търси клиент/устройство по Number, Number_EKA, Phone или bulst"""
+        value = self.lookup_entry.get().strip()
+        if not self.file_path.get():
+            messagebox.showerror("Грешка", "Моля изберете файл първо!")
+            return
+        if not value:
+            messagebox.showerror("Грешка", "Въведете номер, ЕКА, телефон или ЕИК за търсене!")
+            return
+        if not PANDAS_AVAILABLE:
+            messagebox.showerror("Грешка", "pandas не е инсталиран!")
+            return
+
+        try:
+            index = self._current_lookup_index()
+            if index is None:
+                return
+            started = time.perf_counter()
+            result = index.search(value)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            self.update_status_bar(f"Търсене '{value}': {len(result)} реда ({elapsed_ms:.1f} ms)")
+            if len(result) == 0:
+                messagebox.showinfo("Търсене", f"Няма намерени записи за '{value}'.")
+                return
+            self.show_rows_window(result, f"Резултати за '{value}' ({len(result)} реда)")
+
+        except subprocess.TimeoutExpired:
+            messagebox.showerror("Грешка", "Таймаут при четене на MDB файла!")
+            self.update_status_bar("Таймаут при търсене")
+        except Exception as e:
+            messagebox.showerror("Грешка", f"Грешка при търсене:\n{str(e)}")
+            self.update_status_bar(f"Грешка: {str(e)}")
+
+    def show_rows_window(self, df, title):
+        """Показва редовете в отделен прозорец (VirtualGrid - само видимите редове)"""
+        window = tk.Toplevel(self.root)
+        window.title(title)
+        window.columnconfigure(0, weight=1)
+        window.rowconfigure(0, weight=1)
+
+        grid = VirtualGrid(window, df, height=min(25, max(len(df), 5)))
+        grid.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.W, tk.E), padx=5, pady=5)
+        grid.tree.focus_set()
+        return grid
+
+    def preview_filtered(self):
+        """Преглед на филтрираните редове без запис в CSV"""
+        if self.filtered_df is None:
+            messagebox.showerror("Грешка", "Няма филтрирани данни! Първо направете филтрация.")
+            return
+        self.show_rows_window(self.filtered_df, f"Филтрирани данни ({len(self.filtered_df):,} реда)")
+
     def update_status_bar(self, message):
         """Обновява статус бара"""
         self.status_bar.config(text=message)
@@ -923,6 +1633,18 @@ class KasiExtractor:
             
             total_rows = len(self.extracted_data_lines) - 1
             file_size = os.path.getsize(file_path)
+
+            # Записаният списък отива за изпращане - отбелязваме клиентите като известени
+            history = self._notification_history()
+            if history is not None and self.extracted_df is not None:
+                history.record_rows(self.extracted_df)
+
+            messages_text = ""
+            if self.template_text.get().strip():
+                messages_path = os.path.splitext(file_path)[0] + "_messages.csv"
+                rendered = render_messages(self.extracted_df, self.template_text.get())
+                rendered.to_csv(messages_path, index=False, encoding='utf-8', quoting=csv.QUOTE_ALL)
+                messages_text = f"✉️ Съобщения: {os.path.basename(messages_path)}\n"
             
             self.update_status_bar(f"CSV файл записан успешно: {os.path.basename(file_path)}")
             
@@ -931,15 +1653,235 @@ class KasiExtractor:
                                f"📁 Файл: {os.path.basename(file_path)}\n"
                                f"📊 Редове: {total_rows}\n"
                                f"💾 Размер: {file_size / 1024:.1f} KB\n"
+                               f"{messages_text}"
                                f"🔗 Път: {file_path}")
             
         except Exception as e:
             messagebox.showerror("Грешка", f"Грешка при записване на CSV:\n{str(e)}")
             self.update_status_bar("Грешка при записване на CSV")
     
+    def save_xlsx(self):
+        """Запис в XLSX формат (поток на части, нов лист на всеки 1 048 576 реда)"""
+        if self.extracted_df is None or len(self.extracted_df) == 0:
+            messagebox.showerror("Грешка", "Няма извлечени данни за запис!")
+            return
+
+        file_path = filedialog.asksaveasfilename(
+            title="Запиши като XLSX",
+            defaultextension=".xlsx",
+            filetypes=[("Excel файлове", "*.xlsx"), ("Всички файлове", "*.*")]
+        )
+
+        if not file_path:
+            return
+
+        try:
+            self.update_status_bar("Записване на XLSX файл...")
+
+            total_rows = len(self.extracted_df)
+            writer = XlsxWriter(file_path, self.extracted_df.columns)
+            try:
+                for start in range(0, total_rows, 100000):
+                    writer.write(self.extracted_df.iloc[start:start + 100000])
+                    self.update_status_bar(f"Записване на XLSX файл... {writer.rows:,} от {total_rows:,} реда")
+            finally:
+                writer.close()
+
+            file_size = os.path.getsize(file_path)
+
+            # Записаният списък отива за изпращане - отбелязваме клиентите като известени
+            history = self._notification_history()
+            if history is not None:
+                history.record_rows(self.extracted_df)
+
+            self.update_status_bar(f"XLSX файл записан успешно: {os.path.basename(file_path)}")
+
+            messagebox.showinfo("Успех",
+                               f"XLSX файлът е записан успешно!\n\n"
+                               f"📁 Файл: {os.path.basename(file_path)}\n"
+                               f"📊 Редове: {writer.rows}\n"
+                               f"📑 Листове: {writer.sheets}\n"
+                               f"💾 Размер: {file_size / 1024:.1f} KB\n"
+                               f"🔗 Път: {file_path}")
+
+        except Exception as e:
+            messagebox.showerror("Грешка", f"Грешка при записване на XLSX:\n{str(e)}")
+            self.update_status_bar("Грешка при записване на XLSX")
+
+    def save_quarantine(self):
+        """Записва отделените редове с невалиден ЕИК/телефон и причината за всеки"""
+        if self.quarantine_df is None or len(self.quarantine_df) == 0:
+            messagebox.showerror("Грешка", "Няма отделени невалидни редове!")
+            return
+
+        file_path = filedialog.asksaveasfilename(
+            title="Запиши невалидните редове",
+            defaultextension=".csv",
+            filetypes=[("CSV файлове", "*.csv"), ("Excel файлове", "*.xlsx"), ("Всички файлове", "*.*")],
+            initialfile="klienti_quarantine.csv"
+        )
+        if not file_path:
+            return
+
+        try:
+            writer = open_table_writer(file_path, self.quarantine_df.columns)
+            try:
+                writer.write(self.quarantine_df)
+            finally:
+                writer.close()
+            counts = self.quarantine_df[VALIDATION_COLUMN].value_counts()
+            reasons_text = "\n".join(f"• {reason}: {count:,}" for reason, count in counts.items())
+            self.update_status_bar(f"Невалидните редове са записани: {os.path.basename(file_path)}")
+            messagebox.showinfo("Успех",
+                               f"Невалидните редове са записани!\n\n"
+                               f"📊 Редове: {len(self.quarantine_df):,}\n"
+                               f"{reasons_text}\n\n"
+                               f"🔗 Път: {file_path}")
+        except Exception as e:
+            messagebox.showerror("Грешка", f"Грешка при записване на невалидните редове:\n{str(e)}")
+            self.update_status_bar("Грешка при записване")
+
+    def save_multiple_formats(self):
+        """Избор на няколко формата - данните се минават веднъж, всеки формат в своя нишка"""
+        if self.extracted_df is None or len(self.extracted_df) == 0:
+            messagebox.showerror("Грешка", "Няма извлечени данни за запис!")
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Запис в няколко формата")
+        dialog.transient(self.root)
+        formats = [('.csv', "CSV"), ('.json', "JSON"), ('.ndjson', "NDJSON (по обект на ред)"),
+                   ('.xlsx', "Excel (XLSX)")]
+        if PYARROW_AVAILABLE:
+            formats.append(('.parquet', "Parquet"))
+        selected = {}
+        for row, (extension, label) in enumerate(formats):
+            selected[extension] = tk.BooleanVar(value=extension in ('.csv', '.json'))
+            ttk.Checkbutton(dialog, text=label, variable=selected[extension]).grid(
+                row=row, column=0, columnspan=2, sticky=tk.W, padx=10, pady=2)
+
+        # Разделяне на номерирани части - за лимитите на SMS шлюза
+        split_frame = ttk.LabelFrame(dialog, text="Разделяне на части (по желание)", padding="5")
+        split_frame.grid(row=len(formats), column=0, columnspan=2, sticky=(tk.W, tk.E), padx=10, pady=(8, 0))
+        ttk.Label(split_frame, text="Макс. редове на файл:").grid(row=0, column=0, sticky=tk.W)
+        max_rows_entry = ttk.Entry(split_frame, width=12)
+        max_rows_entry.grid(row=0, column=1, sticky=tk.W, padx=(5, 0))
+        ttk.Label(split_frame, text="Макс. размер (напр. 10MB):").grid(row=1, column=0, sticky=tk.W)
+        max_bytes_entry = ttk.Entry(split_frame, width=12)
+        max_bytes_entry.grid(row=1, column=1, sticky=tk.W, padx=(5, 0))
+        ttk.Label(split_frame, text="Отделни файлове по:").grid(row=2, column=0, sticky=tk.W)
+        partition_combo = ttk.Combobox(split_frame, state='readonly', width=20,
+                                       values=[''] + [str(col) for col in self.extracted_df.columns])
+        partition_combo.grid(row=2, column=1, sticky=tk.W, padx=(5, 0))
+
+        def save():
+            extensions = [ext for ext, var in selected.items() if var.get()]
+            if not extensions:
+                messagebox.showerror("Грешка", "Изберете поне един формат!", parent=dialog)
+                return
+            try:
+                max_rows = int(max_rows_entry.get()) if max_rows_entry.get().strip() else None
+                max_bytes = parse_byte_size(max_bytes_entry.get())
+                if max_rows is not None and max_rows <= 0:
+                    raise ValueError("Максималният брой редове трябва да е положителен")
+            except ValueError as e:
+                messagebox.showerror("Грешка", f"Невалидно разделяне: {e}", parent=dialog)
+                return
+            if max_bytes and {'.xlsx', '.parquet'} & set(extensions):
+                messagebox.showerror("Грешка", "Разделянето по размер е възможно само за CSV, JSON и NDJSON!",
+                                     parent=dialog)
+                return
+            split = None
+            if max_rows or max_bytes or partition_combo.get():
+                split = {'max_rows': max_rows, 'max_bytes': max_bytes,
+                         'partition_by': partition_combo.get() or None}
+            base_path = filedialog.asksaveasfilename(title="Име на файловете (без разширение)",
+                                                     parent=dialog)
+            if not base_path:
+                return
+            dialog.destroy()
+            base_path = os.path.splitext(base_path)[0]
+            self._write_formats([base_path + ext for ext in extensions], split)
+
+        ttk.Button(dialog, text="💾 Запиши", command=save).grid(
+            row=len(formats) + 1, column=0, padx=10, pady=(10, 10), sticky=tk.W)
+
+    def _write_formats(self, output_paths, split=None):
+        """
+        Записва извлечените редове във всички файлове с едно минаване
+        (FanOutWriter); със split всеки файл се разделя на части (SplitWriter)
+        """
+        try:
+            total_rows = len(self.extracted_df)
+            self.update_status_bar(f"Записване на {len(output_paths)} файла...")
+            started = time.perf_counter()
+            writer = open_table_writers(output_paths, self.extracted_df.columns, split=split)
+            try:
+                for start in range(0, total_rows, 100000):
+                    writer.write(self.extracted_df.iloc[start:start + 100000])
+            finally:
+                writer.close()
+            elapsed = time.perf_counter() - started
+
+            history = self._notification_history()
+            if history is not None:
+                history.record_rows(self.extracted_df)
+
+            if split:
+                part_writers = getattr(writer, 'writers', [writer])
+                files_text = "\n".join(f"📁 {os.path.basename(part_writer.output_path)}: "
+                                       f"{len(part_writer.parts)} части "
+                                       f"(списък в {os.path.basename(part_writer.manifest_path)})"
+                                       for part_writer in part_writers)
+            else:
+                files_text = "\n".join(f"📁 {os.path.basename(path)} ({os.path.getsize(path) / 1024:.1f} KB)"
+                                       for path in output_paths)
+            self.update_status_bar(f"Записани {len(output_paths)} файла за {elapsed:.1f} сек.")
+            messagebox.showinfo("Успех",
+                               f"Файловете са записани успешно!\n\n"
+                               f"📊 Редове: {total_rows:,}\n"
+                               f"⏱ Време: {elapsed:.1f} сек.\n\n"
+                               f"{files_text}\n\n"
+                               f"🔗 Път: {os.path.dirname(output_paths[0])}")
+
+        except Exception as e:
+            messagebox.showerror("Грешка", f"Грешка при записване на файловете:\n{str(e)}")
+            self.update_status_bar("Грешка при записване")
+
+    def estimate_messages(self):
+        """Показва кодировка, брой SMS части, цена и време за изпращане по шаблона"""
+        if self.extracted_df is None or len(self.extracted_df) == 0:
+            messagebox.showerror("Грешка", "Няма извлечени данни!")
+            return
+
+        try:
+            price = float(self.segment_price.get().replace(',', '.') or 0)
+            template = MessageTemplate(self.template_text.get())
+            rendered = render_messages(self.extracted_df, template)
+            estimate = estimate_sms_cost(rendered, price, rate=SmsDispatcher.DEFAULT_RATE)
+
+            result_text = (f"✅ {estimate['messages']} съобщения, {estimate['segments']} SMS части, "
+                           f"цена ≈ {estimate['cost']:.2f}, време ≈ {estimate['seconds'] // 60} мин.")
+            self.template_result_label.config(text=result_text, foreground="green")
+
+            messagebox.showinfo("Оценка на изпращането",
+                              f"📨 Съобщения: {estimate['messages']:,}\n"
+                              f"🧩 SMS части: {estimate['segments']:,}\n"
+                              f"🔤 UCS-2 (кирилица): {estimate['ucs2_messages']:,}\n"
+                              f"📏 Многочастови: {estimate['multipart_messages']:,}\n"
+                              f"💰 Цена: {estimate['cost']:.2f}\n"
+                              f"⏱ Време при {SmsDispatcher.DEFAULT_RATE:.0f} SMS/сек: "
+                              f"{estimate['seconds'] // 60} мин. {estimate['seconds'] % 60} сек.\n\n"
+                              f"Пример:\n{rendered['text'].iloc[0]}")
+
+        except KeyError as e:
+            messagebox.showerror("Грешка", str(e).strip("'\""))
+        except Exception as e:
+            messagebox.showerror("Грешка", f"Грешка в шаблона:\n{str(e)}")
+
     def save_json(self):
         """Запис в JSON формат"""
-        if not hasattr(self, 'extracted_data_lines') or len(self.extracted_data_lines) < 2:
+        if self.extracted_df is None or len(self.extracted_df) == 0:
             messagebox.showerror("Грешка", "Няма извлечени данни за запис!")
             return
         
@@ -955,34 +1897,15 @@ class KasiExtractor:
         try:
             self.update_status_bar("Записване на JSON файл...")
             
-            header_line = self.extracted_data_lines[0]
-            header_reader = csv.reader(io.StringIO(header_line))
-            headers = next(header_reader)
-            
-            json_data = []
-            
-            for line in self.extracted_data_lines[1:]:
-                try:
-                    reader = csv.reader(io.StringIO(line))
-                    fields = next(reader)
-                    
-                    row_object = {}
-                    for i, header in enumerate(headers):
-                        if i < len(fields):
-                            row_object[header] = fields[i]
-                        else:
-                            row_object[header] = ""
-                    
-                    json_data.append(row_object)
-                
-                except Exception as e:
-                    continue
-            
-            import json
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(json_data, f, ensure_ascii=False, indent=2)
-            
-            total_objects = len(json_data)
+            # Пишем направо от извлечените колони - без повторно парсване на CSV редовете
+            writer = JsonWriter(file_path, self.extracted_df.columns)
+            try:
+                for start in range(0, len(self.extracted_df), 100000):
+                    writer.write(self.extracted_df.iloc[start:start + 100000])
+            finally:
+                writer.close()
+
+            total_objects = writer.rows
             file_size = os.path.getsize(file_path)
             
             self.update_status_bar(f"JSON файл записан успешно: {os.path.basename(file_path)}")
@@ -1002,20 +1925,18 @@ class KasiExtractor:
         """
         Поправя текст използвайки работещия метод: UTF-8→Latin-1→Windows-1251
         """
-        try:
-            step1 = text.encode('latin-1', errors='ignore')
-            result = step1.decode('windows-1251', errors='ignore')
-            return result
-        except:
-            return text
+        return fix_encoding_utf8_to_windows1251(text)
 
 
 def main():
     """Главна функция"""
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
+
     root = tk.Tk()
     app = KasiExtractor(root)
     root.mainloop()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
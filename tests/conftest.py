@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kasi_extractor.core import REQUIRED_COLUMNS  # noqa: E402
+
+
+def make_clients(count, start='2024-01-01', step_days=1):
+    """Kasi_all редове като от mdb-export (End_Data е текст mm/dd/yy hh:mm:ss)"""
+    dates = pd.date_range(start, periods=count, freq=f'{step_days}D')
+    return pd.DataFrame({
+        'Number': [str(i) for i in range(count)],
+        'End_Data': dates.strftime('%m/%d/%y 00:00:00'),
+        'Model': [f'M{i % 3}' for i in range(count)],
+        'Number_EKA': [str(1000000 + i) for i in range(count)],
+        'Ime_Obekt': [f'Обект {i}' for i in range(count)],
+        'Adres_Obekt': [f'ул. {i}' for i in range(count)],
+        'Dan_Number': ['1'] * count,
+        'Phone': [f'0888{i:06d}' for i in range(count)],
+        'Ime_Firma': [f'Фирма {i % 5}' for i in range(count)],
+        'bulst': [str(100000000 + i) for i in range(count)],
+    }, columns=list(REQUIRED_COLUMNS))
+
+
+@pytest.fixture
+def clients():
+    return make_clients(40)
+
+
+@pytest.fixture
+def clients_csv(tmp_path, clients):
+    path = tmp_path / 'kasi.csv'
+    clients.to_csv(path, index=False, encoding='utf-8')
+    return str(path)
@@ -0,0 +1,25 @@
+import pytest
+
+from kasi_extractor.cli import run_cli
+
+
+@pytest.fixture
+def clients_text_csv(tmp_path, clients):
+    path = tmp_path / 'klienti.csv'
+    clients.to_csv(path, index=False, encoding='utf-8')
+    return str(path)
+
+
+@pytest.mark.parametrize('rate', ['0', '-5', 'nan'])
+def test_render_rejects_a_rate_that_is_not_positive(clients_text_csv, rate, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        run_cli(['render', clients_text_csv, '--rate', rate])
+    assert exit_info.value.code == 2
+    assert '--rate' in capsys.readouterr().err
+
+
+def test_render_prints_the_sending_time(clients_text_csv, tmp_path, capsys):
+    output = tmp_path / 'messages.csv'
+    assert run_cli(['render', clients_text_csv, '--rate', '8', '--output', str(output)]) == 0
+    assert 'време при 8 SMS/сек: 5 сек.' in capsys.readouterr().out
+    assert output.exists()
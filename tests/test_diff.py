@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from kasi_extractor.diff import diff_snapshots
+
+
+def read_output(output_dir, name):
+    return pd.read_csv(output_dir / f'{name}.csv', dtype=str, keep_default_na=False)
+
+
+@pytest.fixture
+def snapshots(tmp_path, clients):
+    old = clients.head(10)
+    new = clients.iloc[2:12].copy()
+    new.loc[5, 'Phone'] = '0899111222'
+    old.to_csv(tmp_path / 'old.csv', index=False)
+    new.to_csv(tmp_path / 'new.csv', index=False)
+    return tmp_path / 'old.csv', tmp_path / 'new.csv'
+
+
+def test_added_removed_and_changed_rows(snapshots, tmp_path):
+    old_path, new_path = snapshots
+    counts = diff_snapshots(str(old_path), str(new_path), str(tmp_path / 'out'), partitions=4)
+
+    assert counts == {'added': 2, 'removed': 2, 'changed': 1, 'unchanged': 7,
+                      'duplicates_old': 0, 'duplicates_new': 0}
+    assert sorted(read_output(tmp_path / 'out', 'added')['Number']) == ['10', '11']
+    assert sorted(read_output(tmp_path / 'out', 'removed')['Number']) == ['0', '1']
+    changed = read_output(tmp_path / 'out', 'changed')
+    # CSV източникът се чете с извеждане на типовете - водещата нула на Phone отпада
+    assert changed[['Number', 'Changed_Columns', 'Phone', 'old_Phone']].values.tolist() == \
+        [['5', 'Phone', '899111222', '888000005']]
+
+
+def test_column_order_and_extra_columns_are_not_changes(tmp_path, clients):
+    clients.to_csv(tmp_path / 'old.csv', index=False)
+    reordered = clients[list(reversed(clients.columns))].assign(Note='нова колона')
+    reordered.to_csv(tmp_path / 'new.csv', index=False)
+
+    counts = diff_snapshots(str(tmp_path / 'old.csv'), str(tmp_path / 'new.csv'), str(tmp_path / 'out'))
+    assert counts['changed'] == 0
+    assert counts['unchanged'] == len(clients)
+
+
+def test_compare_columns_limit_the_comparison(snapshots, tmp_path):
+    old_path, new_path = snapshots
+    counts = diff_snapshots(str(old_path), str(new_path), str(tmp_path / 'out'), compare_columns=['Model'])
+    assert counts['changed'] == 0
+    assert list(read_output(tmp_path / 'out', 'changed').columns)[-1] == 'old_Model'
+
+
+def test_duplicate_keys_are_counted_and_the_last_row_wins(tmp_path, clients):
+    clients.to_csv(tmp_path / 'old.csv', index=False)
+    duplicate = clients.iloc[[3]].assign(Phone='0877000000')
+    pd.concat([clients, duplicate]).to_csv(tmp_path / 'new.csv', index=False)
+
+    counts = diff_snapshots(str(tmp_path / 'old.csv'), str(tmp_path / 'new.csv'), str(tmp_path / 'out'))
+    assert counts['duplicates_new'] == 1
+    assert counts['changed'] == 1
+    assert read_output(tmp_path / 'out', 'changed')['Phone'].tolist() == ['877000000']
+
+
+def test_missing_key_column_is_an_error(tmp_path, clients):
+    clients.to_csv(tmp_path / 'old.csv', index=False)
+    clients.drop(columns=['Number_EKA']).to_csv(tmp_path / 'new.csv', index=False)
+    with pytest.raises(RuntimeError, match='Number_EKA'):
+        diff_snapshots(str(tmp_path / 'old.csv'), str(tmp_path / 'new.csv'), str(tmp_path / 'out'))
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from kasi_extractor.dispatch import DispatchJournal, MockSmsGateway, SmsDispatcher
+
+
+def make_messages(count):
+    return [{'id': f'id{i}', 'to': f'0888{i:06d}', 'text': f'съобщение {i}'} for i in range(count)]
+
+
+@pytest.fixture
+def gateway():
+    gateway = MockSmsGateway().start()
+    yield gateway
+    gateway.stop()
+
+
+class ScriptedGateway:
+    """Шлюз, който връща отговорите от списъка по ред, а после приема всичко"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = 0
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                gateway.requests += 1
+                if gateway.responses:
+                    status, body = gateway.responses.pop(0)
+                else:
+                    status, body = 200, json.dumps({'results': [
+                        {'id': m['id'], 'status': 'accepted'} for m in payload['messages']]}).encode()
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/send"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def journal_states(path):
+    journal = DispatchJournal(path)
+    journal.close()
+    return journal.states
+
+
+def dispatch(url, journal, messages, **kwargs):
+    options = dict(batch_size=10, rate=10000, backoff=0.01)
+    options.update(kwargs)
+    dispatcher = SmsDispatcher(url, journal, **options)
+    return dispatcher, asyncio.run(dispatcher.dispatch(messages))
+
+
+def test_sends_everything_and_skips_it_on_the_next_run(gateway, tmp_path):
+    journal_path = str(tmp_path / 'journal.jsonl')
+    journal = DispatchJournal(journal_path)
+    _, stats = dispatch(gateway.url, journal, make_messages(25))
+    journal.close()
+    assert stats['sent'] == 25
+    assert len(gateway.delivered) == 25
+
+    journal = DispatchJournal(journal_path)
+    _, stats = dispatch(gateway.url, journal, make_messages(25))
+    journal.close()
+    assert stats == {'sent': 0, 'rejected': 0, 'skipped': 25, 'failed': 0}
+    assert gateway.requests == 3
+
+
+def test_resume_resends_pending_messages_with_the_same_id(gateway, tmp_path):
+    journal_path = str(tmp_path / 'journal.jsonl')
+    messages = make_messages(6)
+    # Прекъснато пускане: id0-id2 изпратени, id3 е 'pending' (шлюзът го е приел), последният ред е недописан
+    with open(journal_path, 'w', encoding='utf-8') as f:
+        for message in messages[:3]:
+            f.write(json.dumps({'id': message['id'], 'status': 'sent'}) + '\n')
+        f.write(json.dumps({'id': 'id3', 'status': 'pending'}) + '\n')
+        f.write('{"id": "id4", "sta')
+    gateway.delivered['id3'] = messages[3]
+
+    journal = DispatchJournal(journal_path)
+    _, stats = dispatch(gateway.url, journal, messages)
+    journal.close()
+
+    assert stats['skipped'] == 3
+    assert stats['sent'] == 3
+    assert gateway.duplicates == 1
+    assert journal_states(journal_path) == {m['id']: 'sent' for m in messages}
+
+
+def test_malformed_gateway_responses_are_retried(tmp_path):
+    gateway = ScriptedGateway([(200, b'<html>bad gateway</html>'), (200, b'[1, 2]'),
+                               (200, b'{"results": [1]}'), (503, b'')])
+    try:
+        journal = DispatchJournal(str(tmp_path / 'journal.jsonl'))
+        _, stats = dispatch(gateway.url, journal, make_messages(5))
+        journal.close()
+    finally:
+        gateway.stop()
+    assert stats['sent'] == 5 and stats['failed'] == 0
+    assert gateway.requests == 5
+
+
+def test_every_attempt_takes_rate_limit_tokens(tmp_path):
+    gateway = ScriptedGateway([(429, b''), (503, b'')])
+    acquired = []
+
+    class CountingLimiter:
+        async def acquire(self, tokens=1):
+            acquired.append(tokens)
+
+    try:
+        journal = DispatchJournal(str(tmp_path / 'journal.jsonl'))
+        dispatcher = SmsDispatcher(gateway.url, journal, batch_size=4, backoff=0.01)
+        dispatcher.rate_limiter = CountingLimiter()
+        stats = asyncio.run(dispatcher.dispatch(make_messages(4)))
+        journal.close()
+    finally:
+        gateway.stop()
+    assert stats['sent'] == 4
+    assert acquired == [4, 4, 4]
+
+
+def test_permanent_error_rejects_the_batch(tmp_path):
+    gateway = ScriptedGateway([(400, b'{}')])
+    try:
+        journal = DispatchJournal(str(tmp_path / 'journal.jsonl'))
+        _, stats = dispatch(gateway.url, journal, make_messages(3))
+        journal.close()
+    finally:
+        gateway.stop()
+    assert stats['rejected'] == 3
+    assert gateway.requests == 1
+
+
+def test_exhausted_retries_leave_messages_pending(tmp_path):
+    gateway = ScriptedGateway([(503, b'')] * 3)
+    try:
+        journal = DispatchJournal(str(tmp_path / 'journal.jsonl'))
+        _, stats = dispatch(gateway.url, journal, make_messages(2), max_retries=2)
+        journal.close()
+    finally:
+        gateway.stop()
+    assert stats['failed'] == 2
+    assert set(journal_states(str(tmp_path / 'journal.jsonl')).values()) == {'pending'}
@@ -0,0 +1,109 @@
+import json
+
+import pandas as pd
+import pytest
+
+from kasi_extractor.extraction import (DEFAULT_EXTRACTION_SPEC, HashJoin, apply_spec_filter,
+                                       load_extraction_spec)
+
+
+@pytest.fixture
+def firmi_csv(tmp_path):
+    """Справочна таблица: ЕИК 100000001 е два пъти, един ред е без ЕИК"""
+    path = tmp_path / 'firmi.csv'
+    pd.DataFrame({
+        'EIK': ['100000001', '100000002', '100000001', '', '100000005'],
+        'Ime': ['Първа', 'Втора', 'Дубликат', 'Без ЕИК', 'Пета'],
+        'Grad': ['София', 'Варна', 'Русе', 'Бургас', 'Плевен'],
+    }).to_csv(path, index=False, encoding='utf-8')
+    return str(path)
+
+
+def firmi_join(firmi_csv, **options):
+    join = dict({'source': firmi_csv, 'on': 'bulst', 'right_on': 'EIK', 'prefix': 'Firma_'}, **options)
+    return HashJoin(join, 'kasi.csv').build()
+
+
+def test_left_join_keeps_rows_without_a_match(clients, firmi_csv):
+    joined = firmi_join(firmi_csv).probe(clients.head(4))
+    assert list(joined.index) == [0, 1, 2, 3]
+    assert list(joined['Number']) == ['0', '1', '2', '3']
+    assert joined['Firma_Ime'].tolist()[1:3] == ['Първа', 'Втора']
+    assert joined['Firma_Ime'].isna().tolist() == [True, False, False, True]
+    assert joined['Firma_Grad'].iloc[2] == 'Варна'
+
+
+def test_inner_join_drops_rows_without_a_match(clients, firmi_csv):
+    joined = firmi_join(firmi_csv, how='inner', columns=['Ime']).probe(clients.head(8))
+    assert list(joined['Number']) == ['1', '2', '5']
+    assert list(joined['Firma_Ime']) == ['Първа', 'Втора', 'Пета']
+    assert 'Firma_Grad' not in joined.columns
+
+
+def test_duplicate_lookup_keys_use_the_first_row(clients, firmi_csv):
+    joined = firmi_join(firmi_csv).probe(clients.iloc[[1, 1]])
+    assert list(joined['Firma_Ime']) == ['Първа', 'Първа']
+
+
+def test_empty_keys_are_never_joined(clients, firmi_csv):
+    clients.loc[0, 'bulst'] = ''
+    joined = firmi_join(firmi_csv).probe(clients.head(1))
+    assert joined['Firma_Ime'].isna().all()
+
+
+def test_numeric_and_text_keys_are_compared_as_text(clients, firmi_csv):
+    # В CSV ЕИК се чете като число, а bulst в основната таблица е текст
+    clients['bulst'] = clients['bulst'].astype('int64')
+    joined = firmi_join(firmi_csv, how='inner').probe(clients.head(3))
+    assert list(joined['Firma_Ime']) == ['Първа', 'Втора']
+
+
+@pytest.mark.parametrize('options, message', [
+    ({'right_on': 'Bulstat'}, "'Bulstat'"),
+    ({'columns': ['Ime', 'Telefon']}, 'Telefon'),
+])
+def test_build_reports_missing_lookup_columns(firmi_csv, options, message):
+    with pytest.raises(RuntimeError, match=message):
+        firmi_join(firmi_csv, **options)
+
+
+def test_probe_reports_a_missing_key_column(clients, firmi_csv):
+    with pytest.raises(RuntimeError, match="'bulst'"):
+        firmi_join(firmi_csv).probe(clients.drop(columns=['bulst']))
+
+
+def test_spec_defaults_and_json_file(tmp_path):
+    assert load_extraction_spec() == DEFAULT_EXTRACTION_SPEC
+    path = tmp_path / 'spec.json'
+    path.write_text(json.dumps({'columns': ['Number', 'Phone'], 'date_column': None}), encoding='utf-8')
+    spec = load_extraction_spec(str(path))
+    assert spec['columns'] == ['Number', 'Phone']
+    assert spec['date_column'] is None
+    assert spec['table'] == DEFAULT_EXTRACTION_SPEC['table']
+
+
+@pytest.mark.parametrize('spec, message', [
+    ([], 'JSON обект'),
+    ({'columns': []}, 'колони'),
+    ({'filters': [{'column': 'Model', 'op': 'like', 'value': 'D'}]}, 'Невалиден филтър'),
+    ({'filters': [{'op': 'eq', 'value': 'D'}]}, 'Невалиден филтър'),
+    ({'filters': [{'column': 'Model', 'op': 'in', 'value': 'Datecs'}]}, 'списък'),
+    ({'joins': [{'table': 'Firmi'}]}, 'Невалиден join'),
+    ({'joins': [{'on': 'bulst'}]}, 'Невалиден join'),
+    ({'joins': [{'table': 'Firmi', 'on': 'bulst', 'how': 'outer'}]}, 'outer'),
+])
+def test_invalid_specs(spec, message):
+    with pytest.raises(ValueError, match=message):
+        load_extraction_spec(spec)
+
+
+@pytest.mark.parametrize('spec_filter, numbers', [
+    ({'column': 'Model', 'op': 'eq', 'value': 'M1'}, ['1', '4']),
+    ({'column': 'Model', 'op': 'not_in', 'value': ['M0', 'M1']}, ['2', '5']),
+    ({'column': 'Dan_Number', 'op': 'in', 'value': [1]}, ['0', '1', '2', '3', '4', '5']),
+    ({'column': 'Ime_Obekt', 'op': 'startswith', 'value': 'Обект 5'}, ['5']),
+    ({'column': 'Phone', 'op': 'isnull'}, ['3']),
+])
+def test_spec_filters_compare_text(clients, spec_filter, numbers):
+    clients.loc[3, 'Phone'] = None
+    assert list(apply_spec_filter(clients.head(6), spec_filter)['Number']) == numbers
@@ -0,0 +1,43 @@
+import os
+import time
+
+from kasi_extractor.cli import run_cli
+from kasi_extractor.suppression import NotificationHistory
+
+DAY = 86400
+
+
+def test_recent_rows_are_excluded_until_the_cooldown_ends(tmp_path, clients):
+    history = NotificationHistory(str(tmp_path / 'history.bin'))
+    now = time.time()
+    history.record_rows(clients.head(5))
+
+    kept, removed = history.exclude_recent(clients, cooldown_days=30)
+    assert removed == 5
+    assert list(kept['Number']) == list(clients['Number'][5:])
+    assert len(history.recent(30, now=now + 31 * DAY)) == 0
+
+
+def test_torn_record_is_dropped_before_appending(tmp_path, clients):
+    path = tmp_path / 'history.bin'
+    history = NotificationHistory(str(path))
+    history.record_rows(clients.head(2))
+    with open(path, 'ab') as f:
+        f.write(b'\x01\x02\x03')
+
+    history.record_rows(clients.iloc[2:3])
+    assert len(history) == 3
+    assert os.path.getsize(path) == 3 * NotificationHistory.RECORD.itemsize
+
+
+def test_cli_record_without_history_uses_the_file_next_to_the_source(clients_csv, tmp_path):
+    output = str(tmp_path / 'out.csv')
+    args = ['extract', clients_csv, '01.01.2024', '31.12.2024', '--output', output, '--record']
+    assert run_cli(args) == 0
+    history = NotificationHistory.for_source(clients_csv)
+    assert history.path == str(tmp_path / NotificationHistory.FILE_NAME)
+    assert len(history) == 40
+
+    assert run_cli(args) == 0
+    with open(output, encoding='utf-8') as f:
+        assert len(f.read().splitlines()) == 1
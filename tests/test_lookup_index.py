@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_clients
+from kasi_extractor.indexes import LookupIndex
+
+
+@pytest.fixture
+def index(tmp_path, clients):
+    return LookupIndex.build(clients, str(tmp_path / 'lookup'), ('kasi.csv', 1, 1))
+
+
+@pytest.mark.parametrize('column, value', [
+    ('Number', '7'),
+    ('Number_EKA', ' 1000007 '),
+    ('Phone', '+359 888 000 007'),
+    ('bulst', '100000007'),
+])
+def test_lookup_by_each_column(index, column, value):
+    rows = index.lookup(column, value)
+    assert list(rows['Number']) == ['7']
+    assert list(rows.index) == [7]
+
+
+def test_text_keys_ignore_case_and_spaces(tmp_path, clients):
+    clients.loc[4, 'Number_EKA'] = 'ab-12'
+    index = LookupIndex.build(clients, str(tmp_path / 'lookup'), ('kasi.csv', 1, 1))
+    assert list(index.lookup('Number_EKA', ' AB-12')['Number']) == ['4']
+
+
+def test_hash_collisions_are_filtered_by_the_normalized_value(index):
+    # Кандидатите от хеш индекса се проверяват по стойността, а не по хеша
+    index.lookup_positions = lambda column, value: np.array([2, 7, 9])
+    assert list(index.lookup('Phone', '0888000007')['Number']) == ['7']
+    assert list(index.lookup('Number_EKA', '1000009')['Number']) == ['9']
+
+
+def test_missing_and_empty_values(index):
+    assert len(index.lookup('Number', '12345')) == 0
+    assert len(index.lookup('Phone', '')) == 0
+    assert len(index.lookup('Dan_Number', '1')) == 0
+
+
+def test_search_reports_where_the_value_was_found(tmp_path, clients):
+    clients.loc[2, 'bulst'] = '1000005'
+    index = LookupIndex.build(clients, str(tmp_path / 'lookup'), ('kasi.csv', 1, 1))
+    result = index.search('1000005')
+    assert result[['Number', 'Намерено_в']].values.tolist() == [['2', 'bulst'], ['5', 'Number_EKA']]
+
+
+def test_reopened_index_is_current_for_the_same_source(tmp_path, clients):
+    source = str(tmp_path / 'kasi.csv')
+    LookupIndex.build(clients, LookupIndex.default_root(source), ('kasi.csv', 1, 1))
+    reopened = LookupIndex.for_source(source)
+    assert reopened.is_current(('kasi.csv', 1, 1))
+    assert not reopened.is_current(('kasi.csv', 2, 1))
+    assert reopened.total_rows == 40
+
+
+def test_lookup_in_rows_written_from_a_chunked_frame(tmp_path):
+    # pd.concat оставя Arrow колоните на парчета - партидите във файла не са по BATCH_ROWS реда
+    clients = pd.concat([make_clients(70000), make_clients(70000)], ignore_index=True)
+    index = LookupIndex.build(clients, str(tmp_path / 'lookup'), ('kasi.csv', 1, 1))
+    for number in ('5', '69999', '66000'):
+        rows = index.lookup('Number', number)
+        assert list(rows['Number']) == [number, number]
+        assert list(rows.index) == [int(number), 70000 + int(number)]
@@ -0,0 +1,41 @@
+from kasi_extractor.sources import parse_mdb_schema
+
+SCHEMA = """-- ----------------------------------------------------------
+-- MDB Tools - A library for reading MS Access database files
+-- ----------------------------------------------------------
+
+CREATE TABLE [Kasi_all]
+ (
+\t[Number]\t\t\tLong Integer NOT NULL, 
+\t[End_Data]\t\t\tDateTime, 
+\t[Model]\t\t\tText (50), 
+\t[Number_EKA]\t\t\tText (20) NOT NULL, 
+\t[Ime_Obekt]\t\t\tMemo/Hyperlink (255), 
+\t[Dan_Number]\t\t\tLong Integer, 
+\t[Suma]\t\t\tCurrency NOT NULL, 
+\t[Phone]\t\t\tText (50)
+);
+"""
+
+
+def test_columns_with_and_without_size_and_not_null():
+    schema = parse_mdb_schema(SCHEMA)
+    assert schema['columns'] == ['Number', 'End_Data', 'Model', 'Number_EKA', 'Ime_Obekt',
+                                 'Dan_Number', 'Suma', 'Phone']
+    assert schema['dtype'] == {
+        'Number': 'Int64', 'End_Data': str, 'Model': str, 'Number_EKA': str,
+        'Ime_Obekt': str, 'Dan_Number': 'Int64', 'Suma': 'float64', 'Phone': str,
+    }
+    assert schema['date_columns'] == ['End_Data']
+
+
+def test_quoted_names_and_unknown_types():
+    schema = parse_mdb_schema('CREATE TABLE "t" (\n "Ime Firma" Text (255) NOT NULL,\n `Snimka` OLE\n);')
+    assert schema['columns'] == ['Ime Firma', 'Snimka']
+    # Непознатият тип остава без dtype - pandas го разпознава сам
+    assert schema['dtype'] == {'Ime Firma': str}
+
+
+def test_lines_that_are_not_columns_are_skipped():
+    schema = parse_mdb_schema('CREATE TABLE [Kasi_all]\n (\n);\nCREATE INDEX [Number] ON [Kasi_all] ([Number]);')
+    assert schema == {'dtype': {}, 'date_columns': [], 'columns': []}
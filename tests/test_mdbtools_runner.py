@@ -0,0 +1,63 @@
+import os
+import stat
+import sys
+import time
+
+import pytest
+
+from kasi_extractor.sources import MdbToolsRunner
+
+FAKE_EXPORT = """#!{python}
+import os
+import sys
+import time
+sys.stderr.write('предупреждение\\n' * 20000)
+sys.stderr.flush()
+for i in range(8):
+    sys.stdout.write('Number,Phone\\n' if i == 0 else f'{{i}},0888{{i:06d}}\\n')
+    sys.stdout.flush()
+    time.sleep(float(os.environ.get('FAKE_EXPORT_PAUSE', '0')))
+"""
+
+
+@pytest.fixture
+def mdb_path(tmp_path, monkeypatch):
+    """Фалшив mdb-export в PATH: пише много в stderr и няколко реда в stdout"""
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    script = bin_dir / 'mdb-export'
+    script.write_text(FAKE_EXPORT.format(python=sys.executable), encoding='utf-8')
+    script.chmod(script.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv('PATH', str(bin_dir) + os.pathsep + os.environ['PATH'])
+    path = tmp_path / 'kasi.mdb'
+    path.write_bytes(b'stub')
+    return str(path)
+
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='фалшивият mdb-export е скрипт с shebang')
+
+
+def test_export_drains_stderr_while_reading_stdout(mdb_path, tmp_path):
+    runner = MdbToolsRunner(mdb_path)
+    runner.adaptive_timeout = lambda base, seconds_per_mb: 5
+    output = tmp_path / 'kasi.csv'
+    written = runner.run(runner.export('Kasi_all', str(output)))
+    assert output.read_bytes().decode().splitlines()[:2] == ['Number,Phone', '1,0888000001']
+    assert written == output.stat().st_size
+
+
+def test_slow_consumer_does_not_count_against_the_timeout(mdb_path, monkeypatch):
+    # Редовете идват на всеки 0.05 сек., получателят чака по 0.2 сек. на част -
+    # общо над таймаута, но mdb-export никога не мълчи толкова дълго
+    monkeypatch.setenv('FAKE_EXPORT_PAUSE', '0.05')
+    runner = MdbToolsRunner(mdb_path)
+    runner.adaptive_timeout = lambda base, seconds_per_mb: 0.5
+    chunks = []
+
+    def on_chunk(chunk):
+        time.sleep(0.2)
+        chunks.append(chunk)
+
+    runner.run(runner.export('Kasi_all', None, on_chunk))
+    assert b''.join(chunks).count(b'\n') == 8
+    assert len(chunks) >= 3
@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+
+from kasi_extractor.messages import DEFAULT_SMS_TEMPLATE, MessageTemplate, render_messages
+
+
+def test_default_template_formats_the_end_date(clients):
+    texts = MessageTemplate(DEFAULT_SMS_TEMPLATE).render(clients.head(2))
+    assert texts.iloc[1] == "Уважаеми клиенти, срокът на фискалното устройство 1000001 в Обект 1 изтича на 02.01.2024."
+
+
+def test_text_format_specs_and_conversions_are_applied(clients):
+    texts = MessageTemplate('[{Number:>3}] {Model!r} {Ime_Firma:.3}').render(clients.head(2))
+    assert list(texts) == ["[  0] 'M0' Фир", "[  1] 'M1' Фир"]
+
+
+def test_missing_values_render_as_empty_text(clients):
+    clients.loc[0, 'End_Data'] = None
+    clients.loc[0, 'Ime_Obekt'] = None
+    texts = MessageTemplate('{Ime_Obekt}|{End_Data:%d.%m.%Y}').render(clients.head(2))
+    assert list(texts) == ['|', 'Обект 1|02.01.2024']
+
+
+@pytest.mark.parametrize('text', ['{Number:.2f}', '{}', '{0}', '{End_Data!r:%d.%m.%Y}', '{Number!x}'])
+def test_unusable_fields_fail_when_the_template_is_compiled(text):
+    with pytest.raises(ValueError):
+        MessageTemplate(text)
+
+
+def test_missing_columns_are_reported(clients):
+    with pytest.raises(KeyError, match='Bonus'):
+        MessageTemplate('{Number} {Bonus}').render(clients)
+
+
+@pytest.mark.parametrize('text, encoding, length, segments', [
+    ('', 'GSM-7', 0, 0),
+    ('a' * 160, 'GSM-7', 160, 1),
+    ('a' * 161, 'GSM-7', 161, 2),
+    ('a' * 306, 'GSM-7', 306, 2),
+    ('a' * 307, 'GSM-7', 307, 3),
+    # Символите от разширението (€, [, ...) заемат по 2 септета
+    ('a' * 159 + '€', 'GSM-7', 161, 2),
+    ('a' * 158 + '[', 'GSM-7', 160, 1),
+    ('ж' * 70, 'UCS-2', 70, 1),
+    ('ж' * 71, 'UCS-2', 71, 2),
+    ('ж' * 134, 'UCS-2', 134, 2),
+    ('ж' * 135, 'UCS-2', 135, 3),
+    # Един кирилски знак прави цялото съобщение UCS-2
+    ('a' * 69 + 'ж', 'UCS-2', 70, 1),
+    # Символ извън BMP е две UTF-16 единици
+    ('ж' * 69 + '😀', 'UCS-2', 71, 2),
+])
+def test_segment_info_boundaries(text, encoding, length, segments):
+    info = MessageTemplate.segment_info(pd.Series([text]))
+    assert info.iloc[0].tolist() == [encoding, length, segments]
+
+
+def test_render_messages_adds_ids_and_segments(clients):
+    rendered = render_messages(clients.head(3), '{Number}: {Ime_Obekt}')
+    assert list(rendered['text']) == ['0: Обект 0', '1: Обект 1', '2: Обект 2']
+    assert set(rendered['encoding']) == {'UCS-2'}
+    assert rendered['id'].is_unique
@@ -0,0 +1,53 @@
+import json
+import os
+from datetime import date
+
+from kasi_extractor.core import file_fingerprint
+from kasi_extractor.storage import PartitionStore
+
+
+def test_build_writes_one_partition_per_month(clients, clients_csv, tmp_path):
+    store = PartitionStore.build(clients, str(tmp_path / 'parts'), file_fingerprint(clients_csv))
+
+    keys = [part['key'] for part in store.manifest['partitions']]
+    assert keys == ['2024-01', '2024-02']
+    assert sum(part['rows'] for part in store.manifest['partitions']) == len(clients)
+    assert all(os.path.isdir(tmp_path / 'parts' / f'End_Data={key}') for key in keys)
+
+
+def test_read_range_reads_only_overlapping_partitions(clients, clients_csv, tmp_path):
+    store = PartitionStore.build(clients, str(tmp_path / 'parts'), file_fingerprint(clients_csv))
+
+    assert [part['key'] for part in store.partitions_for_range(date(2024, 2, 1), date(2024, 2, 3))] == ['2024-02']
+    result = store.read_range(date(2024, 1, 30), date(2024, 2, 2))
+    assert list(result['Number']) == ['29', '30', '31', '32']
+    # Номерата на редовете са тези от източника
+    assert list(result.index) == [29, 30, 31, 32]
+
+
+def test_rows_without_date_go_to_the_null_partition(clients, clients_csv, tmp_path):
+    clients.loc[3, 'End_Data'] = ''
+    store = PartitionStore.build(clients, str(tmp_path / 'parts'), file_fingerprint(clients_csv))
+
+    null_part = [p for p in store.manifest['partitions'] if p['key'] == PartitionStore.NULL_PARTITION]
+    assert len(null_part) == 1 and null_part[0]['rows'] == 1
+    assert len(store.read_all()) == len(clients)
+    assert '3' not in set(store.read_range(date(2024, 1, 1), date(2024, 12, 31))['Number'])
+
+
+def test_day_granularity(clients, clients_csv, tmp_path):
+    store = PartitionStore.build(clients, str(tmp_path / 'parts'), file_fingerprint(clients_csv), granularity='day')
+    assert len(store.manifest['partitions']) == len(clients)
+
+
+def test_is_current_follows_the_source(clients, clients_csv, tmp_path):
+    root = str(tmp_path / 'parts')
+    PartitionStore.build(clients, root, file_fingerprint(clients_csv))
+    store = PartitionStore(root)
+    assert store.is_current(file_fingerprint(clients_csv))
+
+    with open(clients_csv, 'a', encoding='utf-8') as f:
+        f.write('\n')
+    assert not store.is_current(file_fingerprint(clients_csv))
+    with open(os.path.join(root, PartitionStore.MANIFEST_NAME), encoding='utf-8') as f:
+        assert json.load(f)['total_rows'] == len(clients)
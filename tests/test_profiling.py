@@ -0,0 +1,106 @@
+import json
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from conftest import make_clients
+from kasi_extractor.profiling import (DataProfiler, HyperLogLog, profile_source, text_hashes,
+                                      write_profile_report)
+from kasi_extractor.validation import valid_eik
+
+
+@pytest.mark.parametrize('distinct', [50, 5_000, 300_000])
+def test_hyperloglog_error_is_within_bounds(distinct):
+    rng = np.random.default_rng(distinct)
+    hashes = rng.integers(0, 2 ** 64, size=distinct, dtype=np.uint64)
+    exact = len(np.unique(hashes))
+    hll = HyperLogLog()
+    # Повторенията не трябва да променят оценката
+    hll.add_hashes(hashes)
+    hll.add_hashes(hashes[: distinct // 2])
+    # Стандартна грешка 1.04 / sqrt(2**14) ≈ 0.8% - допускаме 4 сигми
+    assert abs(hll.count() - exact) <= max(2, 0.033 * exact)
+
+
+def test_empty_hyperloglog_counts_zero():
+    hll = HyperLogLog()
+    hll.add_hashes([])
+    assert hll.count() == 0
+
+
+def test_text_hashes_depend_only_on_the_value():
+    first = pa.chunked_array([['Обект 1', '', 'abc'], ['xyz', 'Обект 1']])
+    second = pa.array(['abc', 'Обект 1', 'abd', ''])
+    a, b = text_hashes(first), text_hashes(second)
+    assert a[0] == a[4] == b[1]
+    assert a[2] == b[0] and a[1] == b[3]
+    assert len({a[0], a[1], a[2], a[3], b[2]}) == 5
+
+
+def test_profiler_counts_per_column(clients):
+    clients.loc[[0, 1], 'Phone'] = [None, '+359 2 981 1111']
+    clients.loc[2, 'End_Data'] = 'не е дата'
+    clients.loc[3, 'Ime_Obekt'] = 'РЎРѕС„РёСЏ'
+    profiler = DataProfiler()
+    profiler.update(clients.iloc[:25])
+    profiler.update(clients.iloc[25:])
+    report = profiler.report()
+
+    assert report['rows'] == 40
+    phone = report['columns']['Phone']
+    assert (phone['nulls'], phone['null_rate'], phone['distinct'], phone['invalid_phones']) == (1, 0.025, 39, 1)
+    end_data = report['columns']['End_Data']
+    assert (end_data['parse_failures'], end_data['min_date'], end_data['max_date']) == (1, '2024-01-01', '2024-02-09')
+    assert report['columns']['Ime_Obekt']['mojibake'] == 1
+    assert report['columns']['Model']['distinct'] == 3
+    assert report['columns']['bulst']['invalid_eik'] == int((~valid_eik(clients['bulst'])).sum())
+    assert not any(column['distinct_approx'] for column in report['columns'].values())
+
+
+def test_object_columns_give_the_same_report(clients):
+    arrow, plain = DataProfiler(), DataProfiler()
+    arrow.update(clients)
+    plain.update(clients.astype(object))
+    assert plain.report() == arrow.report()
+
+
+def test_distinct_switches_to_hyperloglog_past_the_exact_limit(monkeypatch):
+    monkeypatch.setattr(DataProfiler, 'EXACT_DISTINCT_LIMIT', 1000)
+    profiler = DataProfiler()
+    clients = make_clients(5000)
+    for offset in range(0, 5000, 1000):
+        profiler.update(clients.iloc[offset:offset + 1000])
+    number = profiler.report()['columns']['Number']
+    assert number['distinct_approx']
+    assert abs(number['distinct'] - 5000) <= 0.033 * 5000
+    assert not profiler.report()['columns']['Model']['distinct_approx']
+
+
+def test_json_report_shape(clients_csv, tmp_path):
+    report = profile_source(clients_csv, chunksize=16)
+    output = tmp_path / 'profile.json'
+    write_profile_report(report, str(output))
+    saved = json.loads(output.read_text(encoding='utf-8'))
+
+    assert set(saved) == {'rows', 'columns', 'source', 'table', 'created', 'stage_seconds', 'wall_seconds'}
+    assert saved['rows'] == 40
+    assert set(saved['stage_seconds']) == {'source', 'encoding', 'profile'}
+    assert list(saved['columns']) == list(make_clients(1).columns)
+    common = {'nulls', 'null_rate', 'distinct', 'distinct_approx', 'mojibake'}
+    assert set(saved['columns']['Model']) == common
+    assert set(saved['columns']['End_Data']) == common | {'parse_failures', 'min_date', 'max_date'}
+    assert set(saved['columns']['Phone']) == common | {'invalid_phones'}
+    assert set(saved['columns']['bulst']) == common | {'invalid_eik'}
+
+
+def test_html_report_marks_problems(clients, tmp_path):
+    clients.loc[0, 'Phone'] = '12'
+    profiler = DataProfiler()
+    profiler.update(clients)
+    report = dict(profiler.report(), source='kasi.csv', table='Kasi_all', created='2026-01-01T10:00:00')
+    output = tmp_path / 'profile.html'
+    write_profile_report(report, str(output))
+    document = output.read_text(encoding='utf-8')
+    assert '<th>Невалидни телефони</th>' in document
+    assert '<td class="problem">1</td>' in document
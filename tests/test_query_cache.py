@@ -0,0 +1,118 @@
+import os
+from datetime import date
+
+import pandas as pd
+
+from kasi_extractor.core import file_fingerprint, parse_end_data
+from kasi_extractor.storage import PartitionStore, QueryResultCache, load_date_window
+
+
+def filtered(clients, start, end):
+    df = clients.copy()
+    df['End_Data_parsed'] = parse_end_data(df['End_Data'])
+    days = df['End_Data_parsed'].dt.date
+    return df[(days >= start) & (days <= end)]
+
+
+def test_overlapping_range_is_served_from_cache(clients, clients_csv):
+    cache = QueryResultCache()
+    fingerprint = file_fingerprint(clients_csv)
+    cache.put(fingerprint, date(2024, 1, 1), date(2024, 1, 20),
+              filtered(clients, date(2024, 1, 1), date(2024, 1, 20)), len(clients))
+
+    result, total_rows = cache.get(fingerprint, date(2024, 1, 5), date(2024, 1, 9))
+    assert total_rows == len(clients)
+    assert list(result['Number']) == ['4', '5', '6', '7', '8']
+    assert cache.hits == 1
+
+
+def test_range_outside_cached_days_is_a_miss(clients, clients_csv):
+    cache = QueryResultCache()
+    fingerprint = file_fingerprint(clients_csv)
+    cache.put(fingerprint, date(2024, 1, 1), date(2024, 1, 10),
+              filtered(clients, date(2024, 1, 1), date(2024, 1, 10)), len(clients))
+
+    assert cache.get(fingerprint, date(2024, 1, 5), date(2024, 1, 11)) is None
+    assert cache.misses == 1
+
+
+def test_empty_days_are_cached_too(clients, clients_csv):
+    cache = QueryResultCache()
+    fingerprint = file_fingerprint(clients_csv)
+    empty = filtered(clients, date(2030, 1, 1), date(2030, 1, 31))
+    cache.put(fingerprint, date(2030, 1, 1), date(2030, 1, 31), empty, len(clients))
+
+    result, _ = cache.get(fingerprint, date(2030, 1, 10), date(2030, 1, 12))
+    assert len(result) == 0
+    assert list(result.columns) == list(empty.columns)
+
+
+def test_invalidate_drops_only_that_file(clients, clients_csv, tmp_path):
+    other_csv = tmp_path / 'other.csv'
+    clients.to_csv(other_csv, index=False)
+    cache = QueryResultCache()
+    df = filtered(clients, date(2024, 1, 1), date(2024, 1, 5))
+    for path in (clients_csv, str(other_csv)):
+        cache.put(file_fingerprint(path), date(2024, 1, 1), date(2024, 1, 5), df, len(clients))
+
+    cache.invalidate(os.path.abspath(clients_csv))
+    assert cache.get(file_fingerprint(clients_csv), date(2024, 1, 1), date(2024, 1, 5)) is None
+    assert cache.get(file_fingerprint(str(other_csv)), date(2024, 1, 1), date(2024, 1, 5)) is not None
+
+
+def test_eviction_keeps_memory_under_limit(clients, clients_csv):
+    df = filtered(clients, date(2024, 1, 1), date(2024, 2, 9))
+    one_day = int(df.iloc[:1].memory_usage(index=True, deep=True).sum())
+    cache = QueryResultCache(max_bytes=one_day * 5)
+    fingerprint = file_fingerprint(clients_csv)
+    cache.put(fingerprint, date(2024, 1, 1), date(2024, 2, 9), df, len(clients))
+
+    assert cache.current_bytes <= cache.max_bytes
+    assert cache.get(fingerprint, date(2024, 1, 1), date(2024, 2, 9)) is None
+
+
+def test_partial_hit_loads_only_the_missing_days(clients, clients_csv):
+    cache = QueryResultCache()
+    fingerprint = file_fingerprint(clients_csv)
+    cache.put(fingerprint, date(2024, 1, 5), date(2024, 1, 11),
+              filtered(clients, date(2024, 1, 5), date(2024, 1, 11)), len(clients))
+    loaded = []
+
+    def load_missing(ranges):
+        loaded.extend(ranges)
+        df = pd.concat([filtered(clients, start, end) for start, end in ranges])
+        return df, len(clients)
+
+    result, total_rows = cache.get(fingerprint, date(2024, 1, 2), date(2024, 1, 14), load_missing=load_missing)
+    assert loaded == [(date(2024, 1, 2), date(2024, 1, 4)), (date(2024, 1, 12), date(2024, 1, 14))]
+    assert list(result['Number']) == [str(i) for i in range(1, 14)]
+    assert total_rows == len(clients)
+    assert cache.partial_hits == 1
+
+    # Вече целият период е в кеша
+    assert cache.missing_ranges(fingerprint, date(2024, 1, 2), date(2024, 1, 14)) == []
+
+
+def test_load_date_window_reads_only_uncached_days_from_the_store(clients, clients_csv, monkeypatch):
+    PartitionStore.build(clients, PartitionStore.default_root(clients_csv), file_fingerprint(clients_csv))
+    read = []
+    read_range = PartitionStore.read_range
+    monkeypatch.setattr(PartitionStore, 'read_range',
+                        lambda self, start, end: read.append((start, end)) or read_range(self, start, end))
+    cache = QueryResultCache()
+
+    load_date_window(clients_csv, date(2024, 1, 8), date(2024, 1, 14), cache=cache)
+    result, total_rows = load_date_window(clients_csv, date(2024, 1, 5), date(2024, 1, 14), cache=cache)
+    assert read == [(date(2024, 1, 8), date(2024, 1, 14)), (date(2024, 1, 5), date(2024, 1, 7))]
+    assert list(result['Number']) == [str(i) for i in range(4, 14)]
+    assert total_rows == len(clients)
+
+
+def test_load_date_window_filters_the_source_for_each_missing_range(clients, clients_csv):
+    cache = QueryResultCache()
+    load_date_window(clients_csv, date(2024, 1, 10), date(2024, 1, 12), cache=cache)
+    result, total_rows = load_date_window(clients_csv, date(2024, 1, 8), date(2024, 1, 15), cache=cache)
+    # Номерата на редовете от двата прочита и от кеша са в реда на източника
+    assert list(result.index) == list(range(7, 15))
+    assert total_rows == len(clients)
+    assert (cache.hits, cache.partial_hits, cache.misses) == (0, 1, 1)
@@ -0,0 +1,78 @@
+import csv
+import os
+from datetime import date
+
+import pytest
+
+from kasi_extractor.core import parse_end_data
+from kasi_extractor.scheduling import compute_notification_waves, wave_window, write_notification_waves
+
+TODAY = date(2024, 1, 1)
+
+
+def wave_rows(waves):
+    return [(send_date.day, days_before, number)
+            for send_date, days_before, number in zip(waves['Send_Date'], waves['Days_Before'], waves['Number'])]
+
+
+def test_waves_are_ordered_by_send_date_then_largest_offset(clients):
+    # End_Data на ред i е 01.01.2024 + i дни
+    waves = compute_notification_waves(clients, TODAY, 3, offsets=(1, 7))
+    assert wave_rows(waves) == [(1, 7, '7'), (1, 1, '1'),
+                                (2, 7, '8'), (2, 1, '2'),
+                                (3, 7, '9'), (3, 1, '3')]
+
+
+@pytest.mark.parametrize('offset', [0, 1, 7, 14, 30])
+def test_each_offset_covers_exactly_the_horizon(clients, offset):
+    waves = compute_notification_waves(clients, TODAY, 5, offsets=(offset,))
+    # Първият ден е днес (End_Data = днес + отстъп), последният - днес + хоризонт - 1
+    assert list(waves['Number']) == [str(offset + day) for day in range(5)]
+    assert list(waves['Send_Date']) == [date(2024, 1, 1 + day) for day in range(5)]
+
+
+def test_send_dates_before_today_and_after_the_horizon_are_left_out(clients):
+    waves = compute_notification_waves(clients, date(2024, 1, 10), 1, offsets=(7,))
+    assert wave_rows(waves) == [(10, 7, '16')]
+
+
+def test_time_of_day_in_end_data_does_not_move_the_wave(clients):
+    clients.loc[8, 'End_Data'] = '01/09/24 23:59:59'
+    waves = compute_notification_waves(clients, TODAY, 1, offsets=(8,))
+    assert wave_rows(waves) == [(1, 8, '8')]
+
+
+def test_wave_window_is_enough_for_all_waves(clients):
+    offsets, horizon = (30, 14, 7, 1), 5
+    start, end = wave_window(TODAY, horizon, offsets)
+    assert (start, end) == (date(2024, 1, 2), date(2024, 2, 4))
+
+    days = parse_end_data(clients['End_Data']).dt.date
+    window = clients[(days >= start) & (days <= end)]
+    expected = compute_notification_waves(clients, TODAY, horizon, offsets)
+    assert wave_rows(compute_notification_waves(window, TODAY, horizon, offsets)) == wave_rows(expected)
+
+
+def test_no_waves_gives_an_empty_frame_with_the_wave_columns(clients):
+    waves = compute_notification_waves(clients, date(2030, 1, 1), 10)
+    assert len(waves) == 0
+    assert {'Send_Date', 'Days_Before'} <= set(waves.columns)
+
+
+def test_write_notification_waves(clients, tmp_path):
+    waves = compute_notification_waves(clients, TODAY, 2, offsets=(7, 1))
+    summary = write_notification_waves(waves, str(tmp_path))
+
+    assert [(send_date, days, rows, os.path.basename(path)) for send_date, days, rows, path in summary] == [
+        (date(2024, 1, 1), 7, 1, 'wave_2024-01-01_T-7.csv'),
+        (date(2024, 1, 1), 1, 1, 'wave_2024-01-01_T-1.csv'),
+        (date(2024, 1, 2), 7, 1, 'wave_2024-01-02_T-7.csv'),
+        (date(2024, 1, 2), 1, 1, 'wave_2024-01-02_T-1.csv'),
+    ]
+    with open(tmp_path / 'wave_2024-01-02_T-7.csv', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert [(row['Number'], row['Send_Date'], row['Days_Before']) for row in rows] == [('8', '02.01.2024', '7')]
+    with open(tmp_path / '_schedule.csv', encoding='utf-8') as f:
+        schedule = list(csv.reader(f))
+    assert schedule[0] == ['Send_Date', 'Days_Before', 'Rows', 'File']
+    assert schedule[1] == ['01.01.2024', '7', '1', 'wave_2024-01-01_T-7.csv']
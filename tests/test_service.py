@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import date
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from conftest import make_clients
+from kasi_extractor.service import ExtractionRequestHandler, WarmDataset
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'условието не се изпълни навреме'
+        time.sleep(0.02)
+
+
+def rewrite(path, df):
+    """Презаписва CSV източника и мести mtime напред, за да се смени отпечатъкът"""
+    df.to_csv(path, index=False, encoding='utf-8')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+@pytest.fixture
+def dataset(clients_csv):
+    dataset = WarmDataset(clients_csv, watch_interval=0.02)
+    yield dataset
+    dataset.stop_watching()
+
+
+@pytest.fixture
+def server(dataset):
+    handler = type('BoundHandler', (ExtractionRequestHandler,), {'dataset': dataset, 'BATCH_ROWS': 3,
+                                                                 'log_message': lambda self, *args: None})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, response.headers, response.read().decode('utf-8')
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read().decode('utf-8')
+
+
+def test_query_returns_text_columns_in_file_order(dataset):
+    result = dataset.query(date(2024, 1, 3), date(2024, 1, 9))
+    assert list(result['Number']) == [str(i) for i in range(2, 9)]
+    assert list(dataset.query_positions(date(2024, 1, 3), date(2024, 1, 9))) == list(range(2, 9))
+    assert len(dataset.query(date(2030, 1, 1), date(2030, 1, 31))) == 0
+
+
+def test_watcher_reloads_a_changed_file(dataset, clients_csv):
+    dataset.start_watching()
+    rewrite(clients_csv, make_clients(50))
+    wait_for(lambda: len(dataset.snapshot['df']) == 50)
+    assert len(dataset.query(date(2024, 2, 10), date(2024, 2, 19))) == 10
+    assert dataset.last_error is None
+
+
+def test_failed_reload_keeps_the_old_snapshot_and_logs_once(dataset, clients_csv, caplog):
+    snapshot = dataset.snapshot
+    rewrite(clients_csv, make_clients(5).drop(columns=['End_Data']))
+    with caplog.at_level(logging.WARNING, logger=WarmDataset.logger.name):
+        dataset.start_watching()
+        wait_for(lambda: dataset.last_error is not None)
+        time.sleep(0.1)
+    assert dataset.snapshot is snapshot
+    assert 'End_Data' in dataset.last_error
+    assert len([r for r in caplog.records if 'Неуспешно презареждане' in r.getMessage()]) == 1
+
+    # След поправка на файла грешката се изчиства
+    rewrite(clients_csv, make_clients(45))
+    wait_for(lambda: dataset.last_error is None and len(dataset.snapshot['df']) == 45)
+
+
+@pytest.mark.parametrize('output_format', ['ndjson', 'json', 'csv'])
+def test_clients_are_streamed_in_batches(server, output_format):
+    status, headers, body = get(f"{server}/clients?from=03.01.2024&to=2024-01-09&format={output_format}")
+    assert status == 200
+    assert headers['X-Total-Rows'] == '7'
+    if output_format == 'ndjson':
+        numbers = [json.loads(line)['Number'] for line in body.splitlines()]
+    elif output_format == 'json':
+        numbers = [row['Number'] for row in json.loads(body)]
+    else:
+        lines = body.splitlines()
+        assert lines[0].startswith('"Number","End_Data"')
+        numbers = [line.split(',')[0].strip('"') for line in lines[1:]]
+    assert numbers == [str(i) for i in range(2, 9)]
+
+
+def test_empty_period_is_a_valid_document(server):
+    status, headers, body = get(f"{server}/clients?from=01.01.2030&to=31.01.2030&format=json")
+    assert (status, headers['X-Total-Rows'], json.loads(body)) == (200, '0', [])
+
+
+@pytest.mark.parametrize('query, status', [
+    ('/clients?from=01.01.2024', 400),
+    ('/clients?from=01.13.2024&to=01.01.2025', 400),
+    ('/clients?from=10.01.2024&to=01.01.2024', 400),
+    ('/clients?from=01.01.2024&to=10.01.2024&format=xml', 400),
+    ('/unknown', 404),
+])
+def test_bad_requests(server, query, status):
+    code, _, body = get(server + query)
+    assert code == status
+    assert 'error' in json.loads(body)
+
+
+def test_health_reports_the_last_reload_error(server, dataset):
+    dataset.last_error, dataset.last_error_at = 'счупен файл', '2026-01-01T10:00:00'
+    status, _, body = get(f"{server}/health")
+    health = json.loads(body)
+    assert status == 200
+    assert (health['rows'], health['last_error'], health['last_error_at']) == (40, 'счупен файл', '2026-01-01T10:00:00')
@@ -0,0 +1,87 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from kasi_extractor.writers import SplitWriter, open_table_writer, parse_byte_size
+
+
+def split(path, chunks, columns, **options):
+    writer = SplitWriter(str(path), columns, **options)
+    for chunk in chunks:
+        writer.write(chunk)
+    writer.close()
+    with open(writer.manifest_path, encoding='utf-8') as f:
+        return writer, json.load(f)
+
+
+def read_part(directory, name):
+    return pd.read_csv(directory / name, dtype=str, keep_default_na=False)
+
+
+def test_split_by_row_count_across_chunks(tmp_path, clients):
+    data = clients[['Number', 'Phone']]
+    writer, manifest = split(tmp_path / 'klienti.csv', [data.iloc[:15], data.iloc[15:]], data.columns, max_rows=16)
+
+    assert [part['file'] for part in manifest['parts']] == ['klienti_001.csv', 'klienti_002.csv', 'klienti_003.csv']
+    assert [part['rows'] for part in manifest['parts']] == [16, 16, 8]
+    assert manifest['total_rows'] == writer.rows == 40
+    parts = [read_part(tmp_path, part['file']) for part in manifest['parts']]
+    assert pd.concat(parts)['Number'].tolist() == data['Number'].tolist()
+    assert all(part['bytes'] == os.path.getsize(tmp_path / part['file']) for part in manifest['parts'])
+
+
+@pytest.mark.parametrize('extension', ['.csv', '.json', '.ndjson'])
+def test_split_by_size_keeps_parts_under_the_limit(tmp_path, clients, extension):
+    _, manifest = split(tmp_path / f'klienti{extension}', [clients], clients.columns, max_bytes=2000)
+
+    assert len(manifest['parts']) > 1
+    assert all(part['bytes'] <= 2000 for part in manifest['parts'])
+    assert sum(part['rows'] for part in manifest['parts']) == len(clients)
+
+
+def test_split_by_key_numbers_each_value_separately(tmp_path, clients):
+    _, manifest = split(tmp_path / 'klienti.csv', [clients.iloc[:20], clients.iloc[20:]], clients.columns,
+                        partition_by='Ime_Firma', max_rows=5)
+
+    files = sorted(part['file'] for part in manifest['parts'])
+    assert files[:2] == ['klienti_Фирма_0_001.csv', 'klienti_Фирма_0_002.csv']
+    assert len(files) == 10
+    for part in manifest['parts']:
+        assert set(read_part(tmp_path, part['file'])['Ime_Firma']) == {part['key']}
+
+
+def test_open_parts_are_limited(tmp_path, clients, monkeypatch):
+    monkeypatch.setattr(SplitWriter, 'MAX_OPEN_PARTS', 2)
+    _, manifest = split(tmp_path / 'klienti.csv', [clients], clients.columns, partition_by='Number')
+    assert len(manifest['parts']) == len(clients)
+
+
+def test_empty_output_still_writes_one_part(tmp_path, clients):
+    _, manifest = split(tmp_path / 'klienti.csv', [clients.iloc[0:0]], clients.columns, max_rows=10)
+    assert [part['rows'] for part in manifest['parts']] == [0]
+    assert read_part(tmp_path, 'klienti_001.csv').columns.tolist() == clients.columns.tolist()
+
+
+def test_invalid_options(tmp_path, clients):
+    with pytest.raises(RuntimeError):
+        SplitWriter(str(tmp_path / 'klienti.xlsx'), clients.columns, max_bytes=1000)
+    with pytest.raises(ValueError):
+        SplitWriter(str(tmp_path / 'klienti.csv'), clients.columns, partition_by='Липсва')
+    with pytest.raises(ValueError):
+        SplitWriter(str(tmp_path / 'klienti.csv'), clients.columns, max_rows=0)
+
+
+def test_open_table_writer_splits_only_when_asked(tmp_path, clients):
+    plain = open_table_writer(str(tmp_path / 'a.csv'), clients.columns)
+    plain.close()
+    assert not isinstance(plain, SplitWriter)
+    split_writer = open_table_writer(str(tmp_path / 'b.csv'), clients.columns, split={'max_rows': 10})
+    split_writer.close()
+    assert isinstance(split_writer, SplitWriter)
+
+
+@pytest.mark.parametrize('text, expected', [('500', 500), ('2KB', 2048), ('1.5 MB', 1572864), ('1g', 1 << 30)])
+def test_parse_byte_size(text, expected):
+    assert parse_byte_size(text) == expected
@@ -0,0 +1,109 @@
+import threading
+
+import pytest
+
+from kasi_extractor.core import REQUIRED_COLUMNS
+from kasi_extractor.pipeline import Pipeline
+from kasi_extractor.sources import OperationCancelled, stream_source_chunks
+
+SCHEMA = 'CREATE TABLE [Kasi_all]\n (\n' + ',\n'.join(
+    f'\t[{column}]\t\t\tText (50)' for column in REQUIRED_COLUMNS) + '\n);\n'
+
+
+class StubRunner:
+    """MdbToolsRunner без mdbtools: export подава готовите части на on_chunk"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.cancelled = False
+        self.sent = 0
+
+    def schema(self, table):
+        return ('schema', table)
+
+    def export(self, table, output_path, on_chunk=None):
+        return ('export', on_chunk)
+
+    def run(self, job, use_poll=True):
+        if job[0] == 'schema':
+            return SCHEMA
+        for chunk in self.chunks:
+            if self.cancelled:
+                raise OperationCancelled()
+            job[1](chunk)
+            self.sent += 1
+        return self.sent
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def csv_row(i):
+    return ','.join(f'"{column}{i}"' for column in REQUIRED_COLUMNS) + '\n'
+
+
+@pytest.fixture
+def mdb_path(tmp_path):
+    path = tmp_path / 'kasi.mdb'
+    path.write_bytes(b'stub')
+    return str(path)
+
+
+def consume(iterator, timeout=10):
+    """Изчерпва генератора в нишка - зависване се вижда като грешка, а не като блокирал тест"""
+    outcome = {}
+
+    def target():
+        try:
+            outcome['rows'] = sum(len(chunk) for chunk in iterator)
+        except BaseException as e:
+            outcome['error'] = e
+
+    worker = threading.Thread(target=target, daemon=True)
+    worker.start()
+    worker.join(timeout)
+    assert not worker.is_alive(), 'stream_source_chunks зависна'
+    return outcome
+
+
+def test_stream_reads_all_rows_in_chunks(mdb_path):
+    header = ','.join(REQUIRED_COLUMNS) + '\n'
+    runner = StubRunner([header.encode()] + [csv_row(i).encode() for i in range(250)])
+    chunks = list(stream_source_chunks(mdb_path, chunksize=100, runner=runner))
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+    assert chunks[2]['Number'].iloc[-1] == 'Number249'
+
+
+def test_bad_row_stops_the_export_instead_of_hanging(mdb_path):
+    header = ','.join(REQUIRED_COLUMNS) + '\n'
+    bad_row = ','.join(['x'] * (len(REQUIRED_COLUMNS) + 3)) + '\n'
+    # Много повече части от опашката (64) - експортът остава блокиран на put
+    block = ''.join(csv_row(i) for i in range(200)).encode()
+    runner = StubRunner([header.encode(), block, bad_row.encode()] + [block] * 1000)
+    outcome = consume(stream_source_chunks(mdb_path, chunksize=1000, runner=runner))
+    assert 'Expected' in str(outcome['error'])
+    assert runner.cancelled
+    assert runner.sent < 1000
+
+
+def test_pipeline_runs_stages_in_order():
+    written = []
+    pipeline = Pipeline(range(10), [('double', lambda x: x * 2),
+                                    ('odd', lambda x: x if x % 4 else None),
+                                    ('write', written.append)])
+    stage_seconds = pipeline.run()
+    assert written == [2, 6, 10, 14, 18]
+    assert set(stage_seconds) == {'source', 'double', 'odd', 'write'}
+
+
+def test_pipeline_stops_all_stages_on_first_error():
+    def fail(x):
+        if x == 3:
+            raise ValueError('лош ред')
+        return x
+
+    written = []
+    pipeline = Pipeline(iter(range(10 ** 6)), [('check', fail), ('write', written.append)], maxsize=2)
+    with pytest.raises(ValueError, match='лош ред'):
+        pipeline.run()
+    assert written == [0, 1, 2][:len(written)]
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+
+from kasi_extractor.suppression import BloomFilter, SuppressionList
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    rng = np.random.default_rng(0)
+    keys = np.unique(rng.integers(870000000, 999999999, 20000))
+    bloom = BloomFilter.for_capacity(len(keys), error_rate=0.01)
+    bloom.add(keys)
+
+    assert bloom.might_contain(keys).all()
+    others = np.setdiff1d(np.arange(100000000, 100100000), keys)
+    assert bloom.might_contain(others).mean() < 0.03
+
+
+@pytest.fixture
+def opt_out_files(tmp_path):
+    csv_path = tmp_path / 'optout.csv'
+    csv_path.write_text('Име;Телефон\nИван;0888 000 001\nМария;+359888000003\nбез номер;\n', encoding='utf-8')
+    txt_path = tmp_path / 'optout.txt'
+    txt_path.write_text('00359888000005\n888000007\n', encoding='utf-8')
+    return [str(csv_path), str(txt_path)]
+
+
+def test_build_reads_named_column_and_headerless_text(opt_out_files):
+    suppression = SuppressionList.build(opt_out_files)
+    assert suppression.phones.tolist() == [888000001, 888000003, 888000005, 888000007]
+
+
+@pytest.mark.parametrize('bloom', [True, False])
+def test_anti_join_matches_any_phone_format(opt_out_files, clients, bloom):
+    clients.loc[3, 'Phone'] = '+359 888 000 003'
+    clients.loc[5, 'Phone'] = '00359888000005'
+    suppression = SuppressionList.build(opt_out_files, bloom=bloom)
+
+    kept, removed = suppression.anti_join(clients)
+    assert removed == 4
+    assert sorted(set(clients['Number']) - set(kept['Number'])) == ['1', '3', '5', '7']
+
+
+def test_anti_join_requires_the_phone_column(opt_out_files, clients):
+    with pytest.raises(RuntimeError, match='Phone'):
+        SuppressionList.build(opt_out_files).anti_join(clients.drop(columns=['Phone']))
+
+
+def test_load_writes_a_cache_only_when_asked(opt_out_files, tmp_path):
+    SuppressionList.load(opt_out_files)
+    assert sorted(os.listdir(tmp_path)) == ['optout.csv', 'optout.txt']
+
+    cache_path = str(tmp_path / 'cache' / 'optout.npz')
+    os.makedirs(os.path.dirname(cache_path))
+    built = SuppressionList.load(opt_out_files, cache_path)
+    assert os.path.exists(cache_path)
+    cached = SuppressionList.load(opt_out_files, cache_path)
+    assert cached.phones.tolist() == built.phones.tolist()
+    assert SuppressionList.load([cache_path]).phones.tolist() == built.phones.tolist()
+
+
+def test_cache_is_rebuilt_when_a_source_changes(opt_out_files, tmp_path):
+    cache_path = str(tmp_path / 'optout.npz')
+    SuppressionList.load(opt_out_files, cache_path)
+    with open(opt_out_files[1], 'a', encoding='utf-8') as f:
+        f.write('0899999999\n')
+
+    assert 899999999 in SuppressionList.load(opt_out_files, cache_path).phones
@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+from kasi_extractor.indexes import TrigramIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    df = pd.DataFrame({
+        'Ime_Obekt': ['ЕТ-ИВАНОВ', 'Магазин "Зора"', '(ДЕ) склад', 'Кафе Ивана', 'Кафе Ивана'],
+        'Ime_Firma': ['Иванов ЕООД', 'Зора ООД', 'Де ООД', 'Ивана ЕТ', 'Ивана ЕТ'],
+        'Adres_Obekt': ['гр. София, ул.№5', '', 'Стара  Загора', 'Пловдив', 'Пловдив'],
+    })
+    return TrigramIndex.build(df, str(tmp_path / 'trigrams'), ('kasi.csv', 1, 1))
+
+
+def values(result):
+    return result['Стойност'].tolist()
+
+
+def test_normalize_turns_punctuation_into_spaces():
+    normalized = TrigramIndex.normalize(['ЕТ-ИВАНОВ', 'Магазин "Зора"', ' (ДЕ)  склад ', 'ул.№5'])
+    assert normalized.tolist() == ['ЕТ ИВАНОВ', 'МАГАЗИН ЗОРА', 'ДЕ СКЛАД', 'УЛ 5']
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('ив', 'ЕТ-ИВАНОВ'),
+    ('зо', 'Магазин "Зора"'),
+    ('де', '(ДЕ) склад'),
+    ('ет-ив', 'ЕТ-ИВАНОВ'),
+])
+def test_short_queries_match_words_after_punctuation(index, query, expected):
+    result = index.search(query)
+    assert expected in values(result[result['Колона'] == 'Ime_Obekt'])
+
+
+def test_prefix_matches_rank_first(index):
+    result = index.search('ивана')
+    assert values(result)[:2] == ['Ивана ЕТ', 'Кафе Ивана']
+
+
+def test_rows_for_returns_every_row_with_the_value(index):
+    result = index.search('кафе')
+    assert result['Редове'].tolist() == [2]
+    assert index.rows_for(int(result['value_id'][0])).tolist() == [3, 4]
+
+
+def test_no_match_and_limit(index):
+    assert len(index.search('xyz')) == 0
+    assert len(index.search('а', limit=3)) == 3
+
+
+def test_index_from_an_older_format_is_not_current(index):
+    assert index.is_current(('kasi.csv', 1, 1))
+    index.manifest['version'] = TrigramIndex.FORMAT_VERSION - 1
+    assert not index.is_current(('kasi.csv', 1, 1))
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from kasi_extractor.core import arrow_text_dtype
+from kasi_extractor.validation import (VALIDATION_COLUMN, normalize_phone_numbers, valid_eik,
+                                       valid_mobile_phones, validate_clients)
+
+
+def reference_check_digit(digits, weights, fallback):
+    remainder = sum(d * w for d, w in zip(digits, weights)) % 11
+    if remainder == 10:
+        remainder = sum(d * w for d, w in zip(digits, fallback)) % 11
+    return 0 if remainder == 10 else remainder
+
+
+def reference_eik(text):
+    """ЕИК по описанието на алгоритъма - ред по ред, за сравнение с векторната проверка"""
+    text = text.replace(' ', '')
+    text = text[2:] if text.startswith('BG') else text
+    if not text.isdigit() or len(text) not in (9, 13):
+        return False
+    digits = [int(ch) for ch in text]
+    if reference_check_digit(digits[:8], range(1, 9), range(3, 11)) != digits[8]:
+        return False
+    if len(digits) == 13:
+        return reference_check_digit(digits[8:12], (2, 7, 3, 5), (4, 9, 5, 7)) == digits[12]
+    return True
+
+
+def with_check_digit(first8):
+    digits = [int(ch) for ch in first8]
+    return first8 + str(reference_check_digit(digits, range(1, 9), range(3, 11)))
+
+
+def test_known_eik_values():
+    eik9 = with_check_digit('17586492')
+    eik13 = eik9 + '001'
+    eik13 += str(reference_check_digit([int(ch) for ch in eik13[8:12]], (2, 7, 3, 5), (4, 9, 5, 7)))
+    wrong = eik9[:8] + str((int(eik9[8]) + 1) % 10)
+    values = [eik9, eik13, f'BG{eik9}', f'{eik9[:3]} {eik9[3:]}', wrong, eik9[:8], '', 'ABC', f'{eik9}x']
+    assert valid_eik(pd.Series(values)).tolist() == [True, True, True, True, False, False, False, False, False]
+
+
+@pytest.mark.parametrize('dtype', [object, 'arrow'])
+def test_eik_matches_the_reference_on_random_values(dtype):
+    rng = np.random.default_rng(1)
+    values = [with_check_digit(f'{n:08d}') for n in rng.integers(0, 10 ** 8, 300)]
+    values += [f'{n:09d}' for n in rng.integers(0, 10 ** 9, 300)]
+    values += [f'{n:013d}' for n in rng.integers(0, 10 ** 13, 300)]
+    series = pd.Series(values, dtype=arrow_text_dtype() if dtype == 'arrow' else object)
+    assert valid_eik(series).tolist() == [reference_eik(value) for value in values]
+
+
+def test_mobile_phones():
+    values = ['0888123456', '+359 88 812 3456', '00359 899 123 456', '359987654321', '888123456',
+              '(0898) 12-34-56', '029876543', '0888 12345', '0878123456789', 'няма', '', None]
+    expected = [True, True, True, True, True, True, False, False, False, False, False, False]
+    assert valid_mobile_phones(pd.Series(values, dtype=object)).tolist() == expected
+
+
+def test_normalize_phone_numbers():
+    values = pd.Series(['0888123456', '+359 888 123 456', '00359888123456', '12', None], dtype=object)
+    assert normalize_phone_numbers(values).tolist() == [888123456, 888123456, 888123456, -1, -1]
+
+
+def test_validate_clients_reports_every_reason(clients):
+    clients['bulst'] = [with_check_digit(f'{i:08d}') for i in range(len(clients))]
+    clients.loc[1, 'bulst'] = clients.loc[1, 'bulst'][:8] + str((int(clients.loc[1, 'bulst'][8]) + 1) % 10)
+    clients.loc[2, 'Phone'] = '029876543'
+    clients.loc[3, ['bulst', 'Phone']] = ['', '']
+
+    valid, reasons = validate_clients(clients)
+    assert reasons.name == VALIDATION_COLUMN
+    assert valid.sum() == len(clients) - 3
+    assert reasons[valid].eq('').all()
+    assert reasons[~valid].to_dict() == {
+        1: 'невалиден ЕИК',
+        2: 'невалиден телефон',
+        3: 'невалиден ЕИК, невалиден телефон',
+    }
+
+
+def test_validate_clients_skips_missing_columns(clients):
+    valid, reasons = validate_clients(clients.drop(columns=['bulst', 'Phone']))
+    assert valid.all()
@@ -0,0 +1,60 @@
+import zipfile
+
+import pandas as pd
+import pytest
+
+from kasi_extractor.writers import XlsxWriter
+
+openpyxl = pytest.importorskip('openpyxl')
+
+
+def write_xlsx(path, chunks, columns):
+    writer = XlsxWriter(str(path), columns)
+    for chunk in chunks:
+        writer.write(chunk)
+    writer.close()
+    return writer
+
+
+def sheet_rows(path):
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return {sheet.title: [list(row) for row in sheet.iter_rows(values_only=True)]
+                for sheet in workbook.worksheets}
+    finally:
+        workbook.close()
+
+
+def test_rows_roll_over_to_a_new_sheet(tmp_path, clients, monkeypatch):
+    # 4 реда на лист = заглавие + 3 реда данни
+    monkeypatch.setattr(XlsxWriter, 'MAX_ROWS', 4)
+    data = clients.head(8)[['Number', 'Phone']]
+    writer = write_xlsx(tmp_path / 'out.xlsx', [data.iloc[:5], data.iloc[5:]], data.columns)
+
+    assert writer.rows == 8 and writer.sheets == 3
+    sheets = sheet_rows(tmp_path / 'out.xlsx')
+    assert list(sheets) == ['Клиенти', 'Клиенти 2', 'Клиенти 3']
+    assert all(rows[0] == ['Number', 'Phone'] for rows in sheets.values())
+    assert [row[0] for rows in sheets.values() for row in rows[1:]] == [str(i) for i in range(8)]
+    assert [len(rows) for rows in sheets.values()] == [4, 4, 3]
+
+
+def test_exactly_full_sheet_does_not_add_an_empty_one(tmp_path, clients, monkeypatch):
+    monkeypatch.setattr(XlsxWriter, 'MAX_ROWS', 4)
+    writer = write_xlsx(tmp_path / 'out.xlsx', [clients.head(3)[['Number']]], ['Number'])
+    assert writer.sheets == 1
+
+
+def test_empty_output_has_the_header(tmp_path):
+    write_xlsx(tmp_path / 'out.xlsx', [], ['Number', 'Phone'])
+    assert sheet_rows(tmp_path / 'out.xlsx') == {'Клиенти': [['Number', 'Phone']]}
+
+
+def test_text_is_escaped_and_control_characters_dropped(tmp_path):
+    data = pd.DataFrame({'Ime_Obekt': ['A & B <ООД>', 'ред\x01 с\x0bзнаци', '007']})
+    write_xlsx(tmp_path / 'out.xlsx', [data], data.columns)
+
+    rows = sheet_rows(tmp_path / 'out.xlsx')['Клиенти']
+    assert [row[0] for row in rows[1:]] == ['A & B <ООД>', 'ред сзнаци', '007']
+    with zipfile.ZipFile(tmp_path / 'out.xlsx') as archive:
+        assert archive.testzip() is None